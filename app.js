@@ -65,6 +65,12 @@ async function saveReport(pred){
   }
 }
 
+function reportImageUrl(r, size){
+  // image_url carries the image's content version, so the browser can keep it
+  const base = r.image_url || `/reports/${r.id}/image`;
+  return `${base}${base.includes('?') ? '&' : '?'}size=${size}`;
+}
+
 async function loadReports(){
   $reportsUl.innerHTML = '';
   try{
@@ -74,7 +80,9 @@ async function loadReports(){
     list.forEach(r=>{
       const li = document.createElement('li');
       const conf = Math.round((r.confidence||0)*100);
-      li.innerHTML = `<strong>#${r.id}</strong> ${r.filename||''} — ${r.disease} (${conf}%) <a href="/reports/${r.id}/download">Download</a>`;
+      li.innerHTML = `<img class="report-thumb" src="${reportImageUrl(r, 'thumb')}" alt="" loading="lazy" width="48" height="48"> <strong>#${r.id}</strong> ${r.filename||''} — ${r.disease} (${conf}%) <a href="${reportImageUrl(r, 'preview')}" target="_blank">View</a> <a href="/reports/${r.id}/download">Download</a>`;
+      // Reports saved without an image have nothing to show
+      li.querySelector('img').addEventListener('error', e => e.target.remove());
       $reportsUl.appendChild(li);
     });
   }catch(e){
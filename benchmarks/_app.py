@@ -0,0 +1,28 @@
+"""Import the API in-process against a temporary SQLite file and storage dir."""
+import importlib
+import os
+import sys
+
+PKG_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def load_app(tmp_dir: str, **env):
+    """Return a TestClient for the app, configured to keep all state under ``tmp_dir``.
+
+    Must be called before anything imports the package: settings are read at import.
+    Use the client as a context manager (``with client:``) so the app's startup runs.
+    """
+    os.environ.setdefault('DB_ENGINE', 'sqlite')
+    os.environ.setdefault('SQLITE_PATH', os.path.join(tmp_dir, 'bench.db'))
+    os.environ.setdefault('STORAGE_DIR', os.path.join(tmp_dir, 'storage'))
+    web_dir = os.path.join(tmp_dir, 'web')
+    os.makedirs(web_dir, exist_ok=True)
+    os.environ.setdefault('WEB_DIR', web_dir)
+    for key, value in env.items():
+        os.environ[key] = str(value)
+
+    from fastapi.testclient import TestClient
+
+    sys.path.insert(0, os.path.dirname(PKG_DIR))
+    main = importlib.import_module(os.path.basename(PKG_DIR) + '.main')
+    return TestClient(main.app)
@@ -0,0 +1,279 @@
+"""Endpoint latency, throughput and peak RSS against a seeded report dataset.
+
+Runs the app in-process (TestClient) against a throwaway SQLite database and
+storage directory. The dataset is ``--rows`` synthetic reports, with their
+catalog texts, stats rollup and spread over the past year. It is built
+directly with the app's models rather than through the API, and kept under
+``--data-dir`` so later runs (and other commits) start from the same file.
+Uploads are synthetic leaf images, PNG-encoded with zlib so no imaging
+library is needed. Everything is derived from ``--seed``.
+
+    python benchmarks/bench_api.py --rows 1k|100k|1m [--requests 200] [--concurrency 4]
+                                   [--only predict,list_reports] [--json out.json] [--compare old.json]
+
+Per endpoint it reports p50/p99/mean latency, throughput over the endpoint's
+wall time, errors, and the peak RSS while it ran (Linux resets the high-water
+mark between endpoints; elsewhere the value is the process peak so far).
+``--compare`` prints the change against an earlier ``--json`` file.
+"""
+import argparse
+import base64
+import json
+import os
+import platform
+import random
+import resource
+import shutil
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from importlib import import_module
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from _app import PKG_DIR, load_app  # noqa: E402
+
+ROWS = {"1k": 1_000, "100k": 100_000, "1m": 1_000_000}
+SEED_BATCH = 20_000
+
+
+def _rows(value: str) -> int:
+    return ROWS.get(value.lower()) or int(value)
+
+
+def leaf_png(rng: np.random.Generator, size: int) -> bytes:
+    """A green leaf on soil with a few brown lesions, as an RGB PNG."""
+    y, x = np.mgrid[0:size, 0:size] / size
+    img = np.empty((size, size, 3), dtype=np.float32)
+    img[:] = (0.35, 0.25, 0.15)
+    leaf = ((x - 0.5) / 0.42) ** 2 + ((y - 0.5) / 0.28) ** 2 < 1
+    img[leaf] = (0.2, 0.55, 0.18)
+    for _ in range(int(rng.integers(0, 12))):
+        cx, cy, r = rng.uniform(0.2, 0.8), rng.uniform(0.3, 0.7), rng.uniform(0.01, 0.05)
+        img[leaf & (((x - cx) ** 2 + (y - cy) ** 2) < r * r)] = (0.45, 0.3, 0.1)
+    img += rng.normal(0, 0.03, img.shape)
+    raw = (np.clip(img, 0, 1) * 255).astype(np.uint8)
+    rows = b''.join(b'\x00' + raw[i].tobytes() for i in range(size))
+
+    def chunk(tag: bytes, data: bytes) -> bytes:
+        return struct.pack('>I', len(data)) + tag + data + struct.pack('>I', zlib.crc32(tag + data) & 0xFFFFFFFF)
+
+    return (b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', struct.pack('>IIBBBBB', size, size, 8, 2, 0, 0, 0))
+            + chunk(b'IDAT', zlib.compress(rows, 6)) + chunk(b'IEND', b''))
+
+
+def _pkg(name: str):
+    return import_module(os.path.basename(PKG_DIR) + '.' + name)
+
+
+def seed_reports(rows: int, seed: int) -> None:
+    """Insert ``rows`` reports (and their text links) into the app's database."""
+    from sqlalchemy import insert
+
+    database, models, rules = _pkg('database'), _pkg('models'), _pkg('rules')
+    stats, texts, httpcache = _pkg('stats'), _pkg('texts'), _pkg('httpcache')
+    rng = np.random.default_rng(seed)
+    catalog = rules.ENGINE.rules
+    text_ids = texts.TEXTS.ids(texts.catalog_strings())
+    now = datetime(2026, 1, 1)
+    with database.SessionLocal() as db:
+        next_id = 1
+        for start in range(0, rows, SEED_BATCH):
+            n = min(SEED_BATCH, rows - start)
+            picks = rng.integers(0, len(catalog), n)
+            confs = rng.uniform(0.3, 0.99, n)
+            ages = rng.uniform(0, 365 * 86400, n)
+            reports, links = [], []
+            for i in range(n):
+                rule = catalog[int(picks[i])]
+                conf = float(confs[i])
+                severity = rules.severity_from_conf(conf, rule.label)
+                reports.append({"id": next_id, "filename": f"leaf-{next_id}.png", "disease": rule.label,
+                                "confidence": conf, "severity": severity,
+                                "created_at": now - timedelta(seconds=int(ages[i]))})
+                links.extend(texts.TEXTS.link_rows(next_id, list(rule.recs), rule.treatment_for(severity), text_ids))
+                next_id += 1
+            db.execute(insert(models.Report), reports)
+            db.execute(insert(models.ReportText), links)
+            db.commit()
+            print(f"seeded {start + n}/{rows} reports", file=sys.stderr)
+        stats.rebuild(db)
+        httpcache.bump(db, httpcache.REPORTS, httpcache.REPORT_CHANGES)
+        db.commit()
+
+
+def _peak_rss_mb() -> float:
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def _reset_peak_rss() -> None:
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        pass
+
+
+def _percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def run_endpoint(name: str, call, requests: int, concurrency: int) -> dict:
+    """Issue ``requests`` calls of ``call(i)`` from ``concurrency`` threads."""
+    latencies, errors = [], [0]
+    lock = threading.Lock()
+
+    def one(i):
+        t0 = time.perf_counter()
+        try:
+            ok = call(i).status_code < 400
+        except Exception:
+            ok = False
+        elapsed = time.perf_counter() - t0
+        with lock:
+            if ok:
+                latencies.append(elapsed)
+            else:
+                errors[0] += 1
+
+    _reset_peak_rss()
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, range(requests)))
+    wall = time.perf_counter() - t0
+    result = {
+        "endpoint": name,
+        "requests": requests,
+        "concurrency": concurrency,
+        "p50_ms": round(_percentile(latencies, 0.50) * 1000, 3) if latencies else None,
+        "p99_ms": round(_percentile(latencies, 0.99) * 1000, 3) if latencies else None,
+        "mean_ms": round(sum(latencies) / len(latencies) * 1000, 3) if latencies else None,
+        "per_second": round(len(latencies) / wall, 1),
+        "errors": errors[0],
+        "peak_rss_mb": round(_peak_rss_mb(), 1),
+    }
+    print(f"{name:<22} p50 {result['p50_ms']!s:>9} ms  p99 {result['p99_ms']!s:>9} ms  "
+          f"{result['per_second']:>8.1f}/s  rss {result['peak_rss_mb']:>7.1f} MiB  errors {result['errors']}")
+    return result
+
+
+def endpoints(client, rows: int, seed: int):
+    """(name, call(i)) pairs; request bodies are built up front so only handling is measured."""
+    rng = np.random.default_rng(seed + 1)
+    images = [leaf_png(rng, 256) for _ in range(16)]
+    data_url = 'data:image/png;base64,' + base64.b64encode(images[0]).decode()
+    report = {"filename": "leaf.png", "disease": "Rust", "confidence": 0.8, "severity": "High",
+              "recommendations": ["Apply rust-targeted fungicide."], "treatment": ["Scout weekly."]}
+    bulk_body = json.dumps([dict(report, filename=f"bulk-{i}.png") for i in range(100)])
+    ids = random.Random(seed).sample(range(1, rows + 1), min(rows, 1000))
+    diseases = [r.label for r in _pkg('rules').ENGINE.rules]
+    page = client.get('/reports', params={'limit': 50})
+    deep_cursor = None
+    for _ in range(20):
+        deep_cursor = page.headers.get('x-next-cursor') or deep_cursor
+        if not page.headers.get('x-next-cursor'):
+            break
+        page = client.get('/reports', params={'limit': 50, 'cursor': deep_cursor})
+    saved = client.post('/reports', json=dict(report, annotated_image=data_url)).json()['id']
+    etag = client.get('/reports').headers.get('etag', '')
+
+    return [
+        ("predict", lambda i: client.post('/predict', files={'file': (f'leaf-{i}.png', images[i % len(images)], 'image/png')})),
+        ("predict_multi", lambda i: client.post('/predict_multi', params={'n': 10, 'seed': i},
+                                                files={'file': ('leaf.png', images[i % len(images)], 'image/png')})),
+        ("list_reports", lambda i: client.get('/reports', params={'limit': 50})),
+        ("list_reports_summary", lambda i: client.get('/reports', params={'limit': 50, 'fields': 'summary'})),
+        ("list_reports_deep", lambda i: client.get('/reports', params={'limit': 50, 'cursor': deep_cursor})),
+        ("list_reports_filtered", lambda i: client.get('/reports', params={'limit': 50, 'disease': diseases[i % len(diseases)]})),
+        ("list_reports_304", lambda i: client.get('/reports', headers={'If-None-Match': etag})),
+        ("get_report", lambda i: client.get(f'/reports/{ids[i % len(ids)]}')),
+        ("report_stats", lambda i: client.get('/reports/stats', params={'group': 'total'})),
+        ("download_report", lambda i: client.get(f'/reports/{saved}/download')),
+        ("report_thumbnail", lambda i: client.get(f'/reports/{saved}/image', params={'size': 'thumb'})),
+        ("create_report", lambda i: client.post('/reports', json=dict(report, annotated_image=data_url))),
+        ("bulk_100", lambda i: client.post('/reports/bulk', content=bulk_body, headers={'content-type': 'application/json'})),
+    ]
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=PKG_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(old_path: str, results) -> None:
+    with open(old_path, encoding='utf-8') as f:
+        old = {r["endpoint"]: r for r in json.load(f)["results"]}
+    print(f"\nvs {old_path}")
+    for r in results:
+        prev = old.get(r["endpoint"])
+        if not prev or not prev.get("p50_ms") or not r.get("p50_ms"):
+            continue
+        print(f"{r['endpoint']:<22} p50 {100 * (r['p50_ms'] / prev['p50_ms'] - 1):+7.1f}%  "
+              f"p99 {100 * (r['p99_ms'] / prev['p99_ms'] - 1):+7.1f}%  "
+              f"throughput {100 * (r['per_second'] / max(prev['per_second'], 0.1) - 1):+7.1f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=_rows, default='1k', help='seeded reports: 1k, 100k, 1m or a number')
+    parser.add_argument('--requests', type=int, default=200, help='requests per endpoint')
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--only', help='comma-separated endpoint names')
+    parser.add_argument('--data-dir', default=os.path.join(tempfile.gettempdir(), 'cropai-bench'),
+                        help='where seeded databases are kept between runs')
+    parser.add_argument('--json', help='write results to this file')
+    parser.add_argument('--compare', help='earlier --json file to diff against')
+    args = parser.parse_args()
+
+    os.makedirs(args.data_dir, exist_ok=True)
+    dataset = os.path.join(args.data_dir, f"reports-{args.rows}-seed{args.seed}.db")
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'bench.db')
+        if os.path.exists(dataset):
+            shutil.copyfile(dataset, db_path)
+        wanted = set(args.only.split(',')) if args.only else None
+        results = []
+        with load_app(tmp, SQLITE_PATH=db_path) as client:
+            if not os.path.exists(dataset):
+                t0 = time.perf_counter()
+                seed_reports(args.rows, args.seed)
+                print(f"seeded {args.rows} reports in {time.perf_counter() - t0:.1f}s", file=sys.stderr)
+                with _pkg('database').engine.connect() as conn:
+                    # Fold the WAL into the main file before copying it
+                    conn.exec_driver_sql("PRAGMA wal_checkpoint(TRUNCATE)")
+                shutil.copyfile(db_path, dataset)
+            for name, call in endpoints(client, args.rows, args.seed):
+                if wanted is None or name in wanted:
+                    results.append(run_endpoint(name, call, args.requests, args.concurrency))
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({"benchmark": "api", "commit": _git_commit(), "python": platform.python_version(),
+                       "platform": platform.platform(), "rows": args.rows, "seed": args.seed,
+                       "requests": args.requests, "concurrency": args.concurrency, "results": results}, f, indent=2)
+    if args.compare:
+        compare(args.compare, results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+"""Save-report cost with an annotated image: JSON data URL vs multipart binary part.
+
+Runs the app in-process against a throwaway SQLite file and storage directory.
+
+    python benchmarks/bench_report_upload.py --sizes 1,5,10 --repeat 5 [--json out.json]
+
+For each image size (MiB) it reports median latency, request payload bytes and
+the peak Python heap allocated while the request is handled (tracemalloc).
+"""
+import argparse
+import base64
+import gc
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from _app import load_app  # noqa: E402
+
+META = {"filename": "leaf.jpg", "disease": "Rust", "confidence": 0.8, "severity": "High",
+        "recommendations": ["Apply rust-targeted fungicide."], "treatment": []}
+
+
+def _measure(send, repeat):
+    latencies, peaks = [], []
+    for _ in range(repeat):
+        gc.collect()
+        tracemalloc.start()
+        t0 = time.perf_counter()
+        resp = send()
+        latencies.append(time.perf_counter() - t0)
+        peaks.append(tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+        assert resp.status_code == 200, resp.text
+    return statistics.median(latencies), max(peaks)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', default='1,5,10', help='image sizes in MiB, comma-separated')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--json', help='write results to this file')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        with load_app(tmp) as client:
+            results = []
+            for mib in [float(x) for x in args.sizes.split(',')]:
+                image = os.urandom(int(mib * 1024 * 1024))
+                # Bodies are built up front so only request handling is measured
+                json_body = json.dumps(dict(META, annotated_image='data:image/jpeg;base64,' + base64.b64encode(image).decode())).encode()
+                meta = json.dumps(META)
+
+                json_latency, json_peak = _measure(lambda: client.post(
+                    '/reports', content=json_body, headers={'content-type': 'application/json'}), args.repeat)
+                mp_latency, mp_peak = _measure(lambda: client.post(
+                    '/reports', data={'report': meta}, files={'image': ('leaf.jpg', image, 'image/jpeg')}), args.repeat)
+
+                for mode, latency, peak, payload in (('json-data-url', json_latency, json_peak, len(json_body)),
+                                                     ('multipart', mp_latency, mp_peak, len(image) + len(meta))):
+                    results.append({"image_mib": mib, "mode": mode, "median_ms": round(latency * 1000, 2),
+                                    "payload_bytes": payload, "peak_heap_bytes": peak})
+                    print(f"{mib:>6.1f} MiB  {mode:<14} {latency * 1000:9.2f} ms  "
+                          f"payload {payload / 1048576:7.2f} MiB  peak heap {peak / 1048576:7.2f} MiB")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({"benchmark": "report_upload", "results": results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+"""Concurrent report readers and writers on SQLite: legacy vs tuned engine profile.
+
+Each profile runs in a fresh subprocess (engine settings are read at import)
+against its own throwaway database, seeded with --seed reports. Readers run the
+GET /reports listing query and writers insert and commit a report, both through
+the app's own engine and sessions so the numbers reflect the database rather
+than HTTP overhead.
+
+    python benchmarks/bench_sqlite_concurrency.py --readers 8 --writers 2 --seconds 10 [--json out.json]
+
+``legacy`` is the previous engine: rollback journal, synchronous=FULL, the
+default 2000-page cache and no mmap. ``tuned`` is the current default profile
+(WAL, synchronous=NORMAL, 64 MiB cache, 256 MiB mmap).
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from importlib import import_module
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from _app import load_app  # noqa: E402
+
+PROFILES = {
+    "legacy": {"SQLITE_JOURNAL_MODE": "DELETE", "SQLITE_SYNCHRONOUS": "FULL",
+               "SQLITE_CACHE_SIZE": "-2000", "SQLITE_MMAP_SIZE": "0"},
+    "tuned": {},
+}
+
+REPORT = {"filename": "leaf.jpg", "disease": "Rust", "confidence": 0.8, "severity": "High",
+          "recommendations": ["Apply rust-targeted fungicide."], "treatment": []}
+
+
+def _percentile(values, q):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def _summary(latencies, errors, seconds):
+    return {
+        "requests": len(latencies),
+        "per_second": round(len(latencies) / seconds, 1),
+        "p50_ms": round(_percentile(latencies, 0.50) * 1000, 2) if latencies else None,
+        "p99_ms": round(_percentile(latencies, 0.99) * 1000, 2) if latencies else None,
+        "errors": errors,
+    }
+
+
+def run_profile(args) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        with load_app(tmp) as client:
+            resp = client.post('/reports/bulk', json=[dict(REPORT, filename=f"{i}.jpg") for i in range(args.seed)])
+            assert resp.status_code == 200, resp.text
+        pkg = os.path.basename(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        database = import_module(pkg + '.database')
+        models = import_module(pkg + '.models')
+        queries = import_module(pkg + '.queries')
+        with database.engine.connect() as conn:
+            journal = conn.exec_driver_sql("PRAGMA journal_mode").scalar()
+
+        def read():
+            with database.SessionLocal() as db:
+                queries.newest_first(db.query(*queries.SUMMARY_COLUMNS)).limit(50).all()
+
+        def write():
+            with database.SessionLocal() as db:
+                db.add(models.Report(filename=REPORT["filename"], disease=REPORT["disease"],
+                                     confidence=REPORT["confidence"], severity=REPORT["severity"]))
+                db.commit()
+
+        stop = time.monotonic() + args.seconds
+        results = {"read": ([], [0]), "write": ([], [0])}
+
+        def worker(kind):
+            latencies, errors = results[kind]
+            while time.monotonic() < stop:
+                t0 = time.perf_counter()
+                try:
+                    read() if kind == "read" else write()
+                    ok = True
+                except Exception:  # e.g. "database is locked" past busy_timeout
+                    ok = False
+                if ok:
+                    latencies.append(time.perf_counter() - t0)
+                else:
+                    errors[0] += 1
+
+        threads = [threading.Thread(target=worker, args=("read",)) for _ in range(args.readers)]
+        threads += [threading.Thread(target=worker, args=("write",)) for _ in range(args.writers)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        return {
+            "journal_mode": journal,
+            "reads": _summary(results["read"][0], results["read"][1][0], args.seconds),
+            "writes": _summary(results["write"][0], results["write"][1][0], args.seconds),
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--readers', type=int, default=8)
+    parser.add_argument('--writers', type=int, default=2)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--seed', type=int, default=5000, help='reports inserted before measuring')
+    parser.add_argument('--json', help='write results to this file')
+    parser.add_argument('--profile', choices=sorted(PROFILES), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.profile:
+        # Child process: run one profile and hand the numbers back on stdout
+        os.environ.update(PROFILES[args.profile])
+        print(json.dumps(run_profile(args)))
+        return
+
+    results = []
+    for name in PROFILES:
+        cmd = [sys.executable, os.path.abspath(__file__), '--profile', name, '--readers', str(args.readers),
+               '--writers', str(args.writers), '--seconds', str(args.seconds), '--seed', str(args.seed)]
+        out = subprocess.run(cmd, check=True, capture_output=True, text=True).stdout
+        result = dict(json.loads(out.strip().splitlines()[-1]), profile=name)
+        results.append(result)
+        for kind in ("reads", "writes"):
+            r = result[kind]
+            print(f"{name:<7} {result['journal_mode']:<7} {kind:<6} {r['per_second']:9.1f}/s  "
+                  f"p50 {r['p50_ms']} ms  p99 {r['p99_ms']} ms  errors {r['errors']}")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({"benchmark": "sqlite_concurrency", "readers": args.readers, "writers": args.writers,
+                       "seconds": args.seconds, "results": results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
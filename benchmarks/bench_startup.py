@@ -0,0 +1,93 @@
+"""Worker cold start: import time, lifespan startup and first request.
+
+Each sample is a fresh interpreter, so nothing is shared but the SQLite file
+and storage directory. The first worker of a run meets an empty database and
+does the schema bootstrap. The others find the schema current and only warm
+up. ``--workers`` starts that many interpreters at once against one fresh
+database, as a process manager would, and they have to agree on a single
+bootstrap.
+
+    python benchmarks/bench_startup.py [--repeat 5] [--workers 4] [--json out.json]
+
+Import time is split into the third-party stack (FastAPI, SQLAlchemy, numpy)
+and the app's own modules.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+
+CHILD = r'''
+import json, sys, time
+sys.path.insert(0, sys.argv[1])
+t0 = time.perf_counter()
+import fastapi, numpy, pydantic, sqlalchemy.orm
+t1 = time.perf_counter()
+from _app import load_app
+client = load_app(sys.argv[2])
+t2 = time.perf_counter()
+with client:
+    t3 = time.perf_counter()
+    status = client.get('/reports', params={'limit': 1}).status_code
+    t4 = time.perf_counter()
+print(json.dumps({"deps_import_ms": (t1 - t0) * 1000, "app_import_ms": (t2 - t1) * 1000,
+                  "startup_ms": (t3 - t2) * 1000, "first_request_ms": (t4 - t3) * 1000, "status": status}))
+'''
+
+
+def _spawn(tmp: str) -> subprocess.Popen:
+    return subprocess.Popen([sys.executable, '-c', CHILD, BENCH_DIR, tmp], stdout=subprocess.PIPE, text=True)
+
+
+def _collect(proc: subprocess.Popen) -> dict:
+    out, _ = proc.communicate()
+    if proc.returncode != 0:
+        raise SystemExit(f"worker exited with {proc.returncode}")
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def _median(values):
+    values = sorted(values)
+    return values[len(values) // 2]
+
+
+def _summary(name: str, samples) -> dict:
+    result = {"case": name, "samples": len(samples)}
+    for key in ("deps_import_ms", "app_import_ms", "startup_ms", "first_request_ms"):
+        result[key] = round(_median([s[key] for s in samples]), 2)
+    result["errors"] = sum(1 for s in samples if s["status"] != 200)
+    print(f"{name:<18} deps {result['deps_import_ms']:8.1f} ms  app {result['app_import_ms']:7.1f} ms  "
+          f"startup {result['startup_ms']:7.1f} ms  first request {result['first_request_ms']:6.1f} ms  "
+          f"errors {result['errors']}")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=5, help='samples per case')
+    parser.add_argument('--workers', type=int, default=4, help='workers started together on a fresh database')
+    parser.add_argument('--json', help='write results to this file')
+    args = parser.parse_args()
+
+    cold, warm, together = [], [], []
+    for _ in range(args.repeat):
+        with tempfile.TemporaryDirectory() as tmp:
+            cold.append(_collect(_spawn(tmp)))
+            warm.append(_collect(_spawn(tmp)))
+        with tempfile.TemporaryDirectory() as tmp:
+            procs = [_spawn(tmp) for _ in range(args.workers)]
+            together.extend(_collect(p) for p in procs)
+
+    results = [_summary('fresh database', cold), _summary('existing database', warm),
+               _summary(f'{args.workers} workers at once', together)]
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({"benchmark": "startup", "results": results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
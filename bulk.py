@@ -0,0 +1,152 @@
+"""Bulk report ingestion: request parsing and batched, idempotent inserts."""
+import os
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from fastapi import HTTPException, Request
+from fastapi.exceptions import RequestValidationError
+from pydantic import TypeAdapter, ValidationError
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from . import httpcache, metrics, models, schemas, stats
+from .texts import TEXTS
+
+# Bulk configuration via environment variables
+BULK_BATCH_SIZE = int(os.getenv('BULK_BATCH_SIZE', '500'))
+BULK_MAX_ITEMS = int(os.getenv('BULK_MAX_ITEMS', '10000'))
+MAX_BULK_BYTES = int(os.getenv('MAX_BULK_BYTES', str(256 * 1024 * 1024)))
+
+NDJSON_TYPES = ('application/x-ndjson', 'application/ndjson', 'application/jsonl', 'application/json-seq')
+# Room for ":<index>" when per-item keys are derived from the Idempotency-Key header
+MAX_HEADER_KEY = 100
+
+_ITEMS = TypeAdapter(List[schemas.ReportBulkItem])
+
+
+def _invalid(errors) -> RequestValidationError:
+    return RequestValidationError([{**err, "loc": ("body", *err["loc"])} for err in errors])
+
+
+def _too_many() -> HTTPException:
+    return HTTPException(status_code=400, detail=f"At most {BULK_MAX_ITEMS} reports per request")
+
+
+async def read_items(request: Request) -> List[schemas.ReportBulkItem]:
+    """Reports from a JSON array body, or one JSON object per line for NDJSON."""
+    if not request.headers.get('content-type', '').startswith(NDJSON_TYPES):
+        try:
+            items = _ITEMS.validate_json(await request.body())
+        except ValidationError as e:
+            raise _invalid(e.errors(include_url=False))
+        if len(items) > BULK_MAX_ITEMS:
+            raise _too_many()
+        return items
+
+    items: List[schemas.ReportBulkItem] = []
+    errors = []
+
+    def parse(line: bytes) -> None:
+        if not line.strip():
+            return
+        if len(items) >= BULK_MAX_ITEMS:
+            raise _too_many()
+        try:
+            items.append(schemas.ReportBulkItem.model_validate_json(line))
+        except ValidationError as e:
+            errors.extend({**err, "loc": (len(items), *err["loc"])} for err in e.errors(include_url=False))
+            items.append(None)
+
+    # Lines are parsed as they arrive rather than after buffering the whole body
+    buf = b''
+    async for chunk in request.stream():
+        buf += chunk
+        *lines, buf = buf.split(b'\n')
+        for line in lines:
+            parse(line)
+    parse(buf)
+    if errors:
+        raise _invalid(errors)
+    return items
+
+
+def item_keys(items: List[schemas.ReportBulkItem], header_key: Optional[str]) -> List[Optional[str]]:
+    """Per-item idempotency keys; an Idempotency-Key header covers items without their own."""
+    if header_key is not None and not 0 < len(header_key) <= MAX_HEADER_KEY:
+        raise HTTPException(status_code=400, detail=f"Idempotency-Key must be 1-{MAX_HEADER_KEY} characters")
+    return [item.idempotency_key or (f"{header_key}:{i}" if header_key else None) for i, item in enumerate(items)]
+
+
+def _insert(db: Session, items: List[schemas.ReportBulkItem], keys: List[Optional[str]]):
+    wanted = {k for k in keys if k}
+    known: Dict[str, int] = {}
+    if wanted:
+        known = dict(
+            db.query(models.ReportIdempotency.key, models.ReportIdempotency.report_id)
+            .filter(models.ReportIdempotency.key.in_(wanted))
+        )
+    rows: List[Optional[models.Report]] = []
+    fresh: Dict[str, models.Report] = {}
+    for item, key in zip(items, keys):
+        if key in known or key in fresh:
+            rows.append(None)
+            continue
+        report = models.Report(
+            filename=item.filename,
+            disease=item.disease,
+            confidence=item.confidence,
+            severity=item.severity,
+        )
+        rows.append(report)
+        if key:
+            fresh[key] = report
+    # Interned before this transaction writes anything (see TextCatalog.ids)
+    text_ids = TEXTS.ids(t for item, r in zip(items, rows) if r is not None
+                         for t in (item.recommendations or []) + (item.treatment or []))
+    # One flush: SQLAlchemy sends the batch as a multi-row INSERT where the driver allows
+    db.add_all(r for r in rows if r is not None)
+    db.flush()
+    db.add_all(models.ReportIdempotency(key=k, report_id=r.id) for k, r in fresh.items())
+    links = [link for item, r in zip(items, rows) if r is not None
+             for link in TEXTS.link_rows(r.id, item.recommendations or [], item.treatment or [], text_ids)]
+    if links:
+        db.execute(insert(models.ReportText), links)
+    # Read ids before commit expires the instances
+    out = []
+    for report, key in zip(rows, keys):
+        if report is not None:
+            out.append((report.id, True))
+        else:
+            out.append((known[key] if key in known else fresh[key].id, False))
+    created = [r for r in rows if r is not None]
+    stamps = _created_at(db, [r.id for r in created])
+    stats.add_reports(db, ((stamps.get(r.id), r.disease, r.severity, r.confidence) for r in created))
+    if created:
+        httpcache.bump(db, httpcache.REPORTS)
+    with metrics.stage('db_commit'):
+        db.commit()
+    return out, stamps
+
+
+def insert_batch(db: Session, items: List[schemas.ReportBulkItem],
+                 keys: List[Optional[str]]) -> Tuple[List[Tuple[int, bool]], Dict[int, datetime]]:
+    """Insert one batch, and its stats rollup, in a single transaction.
+
+    Returns (report id, created) per item in input order, where items whose key
+    was seen before map to the earlier report, and created_at of the new rows.
+    """
+    try:
+        return _insert(db, items, keys)
+    except IntegrityError:
+        # A concurrent sync claimed one of the keys first; its rows are visible now
+        db.rollback()
+        return _insert(db, items, keys)
+
+
+def _created_at(db: Session, report_ids: List[int]) -> Dict[int, datetime]:
+    # Server-side default, not loaded by the flush
+    if not report_ids:
+        return {}
+    rows = db.query(models.Report.id, models.Report.created_at).filter(models.Report.id.in_(report_ids))
+    return dict(rows.all())
@@ -0,0 +1,155 @@
+"""Bounded prediction cache keyed on image content.
+
+The in-process tier is an LRU with TTL. Setting PREDICT_CACHE_DB to a file
+path adds a shared SQLite tier so several uvicorn workers reuse each other's hits.
+"""
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+# Cache configuration via environment variables
+PREDICT_CACHE_SIZE = int(os.getenv('PREDICT_CACHE_SIZE', '4096'))  # 0 disables the cache
+PREDICT_CACHE_TTL = float(os.getenv('PREDICT_CACHE_TTL', '3600'))  # seconds
+PREDICT_CACHE_DB = os.getenv('PREDICT_CACHE_DB', '').strip()
+
+Key = Tuple[str, str, str]  # (image sha256 hex, normalized filename, catalog version)
+Value = Tuple[float, int, bool]  # (score before runtime jitter, rule index, scored by the classifier)
+
+
+class _SharedTier:
+    """SQLite table shared between worker processes on the same host."""
+
+    def __init__(self, path: str, ttl: float):
+        self.path = path
+        self.ttl = ttl
+        self._local = threading.local()
+        self._puts = 0
+        with self._conn() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS prediction_cache ("
+                "key TEXT PRIMARY KEY, score REAL NOT NULL, rule INTEGER NOT NULL, expires_at REAL NOT NULL, "
+                "from_model INTEGER)"
+            )
+            try:
+                conn.execute("ALTER TABLE prediction_cache ADD COLUMN from_model INTEGER")
+            except sqlite3.OperationalError:
+                pass  # already there
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str) -> Optional[Value]:
+        row = self._conn().execute(
+            # Rows written before from_model existed don't say who scored them; treat them as misses
+            "SELECT score, rule, from_model FROM prediction_cache WHERE key = ? AND expires_at > ? "
+            "AND from_model IS NOT NULL", (key, time.time())
+        ).fetchone()
+        return (row[0], row[1], bool(row[2])) if row else None
+
+    def put(self, key: str, value: Value) -> None:
+        conn = self._conn()
+        now = time.time()
+        conn.execute(
+            "INSERT OR REPLACE INTO prediction_cache (key, score, rule, expires_at, from_model) VALUES (?, ?, ?, ?, ?)",
+            (key, value[0], value[1], now + self.ttl, int(value[2])),
+        )
+        self._puts += 1
+        if self._puts % 1000 == 0:
+            conn.execute("DELETE FROM prediction_cache WHERE expires_at <= ?", (now,))
+
+
+class PredictionCache:
+    """LRU + TTL cache of the deterministic part of a prediction."""
+
+    def __init__(self, max_entries: int, ttl: float, shared_path: str = ''):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[Key, Tuple[float, Value]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._shared = _SharedTier(shared_path, ttl) if shared_path and max_entries > 0 else None
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def get(self, key: Key) -> Optional[Value]:
+        if not self.enabled:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[1]
+                del self._entries[key]
+                self.expirations += 1
+        if self._shared is not None:
+            try:
+                value = self._shared.get('|'.join(key))
+            except sqlite3.Error:
+                value = None
+            if value is not None:
+                with self._lock:
+                    self.shared_hits += 1
+                self._store(key, value, now)
+                return value
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key: Key, value: Value) -> None:
+        if not self.enabled:
+            return
+        self._store(key, value, time.monotonic())
+        if self._shared is not None:
+            try:
+                self._shared.put('|'.join(key), value)
+            except sqlite3.Error:
+                # Shared tier is best effort; the local tier still serves this worker
+                pass
+
+    def _store(self, key: Key, value: Value, now: float) -> None:
+        with self._lock:
+            self._entries[key] = (now + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "shared": self._shared is not None,
+                "size": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "shared_hits": self.shared_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+
+PREDICTION_CACHE = PredictionCache(PREDICT_CACHE_SIZE, PREDICT_CACHE_TTL, PREDICT_CACHE_DB)
@@ -0,0 +1,271 @@
+"""Image-feature classifier in front of the rule engine.
+
+Set CLASSIFIER_MODEL to a model file to enable it; it is loaded once at import.
+
+- ``.npz``: multinomial logistic regression with arrays ``coef`` (classes x
+  features), ``intercept``, ``classes`` and optionally ``mean``/``scale`` for
+  standardization. ``python -m api.classifier train`` writes one.
+- ``.onnx``: any CPU model taking a float32 [N, features] input and returning
+  class probabilities; class labels come from the ``classes`` metadata entry
+  (a JSON list). Needs onnxruntime.
+
+Decoding needs Pillow. Features are color histograms and lesion-area ratios
+computed with NumPy on a downscaled copy of the image. Labels must be catalog
+rule labels (or "Unknown"). Images that can't be decoded, or whose top class
+scores below CLASSIFIER_MIN_CONFIDENCE, fall back to the rule engine.
+"""
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+from typing import BinaryIO, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from . import metrics
+from .rules import ENGINE, Rule
+
+CLASSIFIER_MODEL = os.getenv('CLASSIFIER_MODEL', '').strip()
+CLASSIFIER_MIN_CONFIDENCE = float(os.getenv('CLASSIFIER_MIN_CONFIDENCE', '0.35'))
+CLASSIFIER_THREADS = int(os.getenv('CLASSIFIER_THREADS', '1'))  # onnxruntime intra-op threads per call
+FEATURE_SIZE = int(os.getenv('CLASSIFIER_IMAGE_SIZE', '256'))  # longest side after downscaling
+MAX_IMAGE_PIXELS = int(os.getenv('CLASSIFIER_MAX_PIXELS', str(50_000_000)))
+
+RGB_BINS = 8
+HUE_BINS = 12
+RATIO_NAMES = ('tissue', 'green', 'yellow', 'brown', 'dark', 'powdery', 'lesion')
+FEATURE_NAMES = (
+    [f'{c}_hist_{i}' for c in 'rgb' for i in range(RGB_BINS)]
+    + [f'hue_hist_{i}' for i in range(HUE_BINS)]
+    + [f'{name}_ratio' for name in RATIO_NAMES]
+    + [f'{c}_{stat}' for stat in ('mean', 'std') for c in 'rgb']
+    + ['sat_mean', 'val_mean']
+)
+N_FEATURES = len(FEATURE_NAMES)
+
+
+class StageTimings:
+    """Per-stage latency totals across requests (GET /predict/classifier)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats: Dict[str, List[float]] = {}
+
+    def lap(self, timings: Optional[Dict[str, float]], stage: str, started: float) -> float:
+        """Record ``stage`` as ending now, in ``timings`` (ms) and the totals; returns now."""
+        now = time.perf_counter()
+        ms = (now - started) * 1000
+        if timings is not None:
+            timings[stage] = timings.get(stage, 0.0) + ms
+        metrics.observe(stage, now - started)
+        with self._lock:
+            s = self._stats.setdefault(stage, [0, 0.0, 0.0])
+            s[0] += 1
+            s[1] += ms
+            s[2] = max(s[2], ms)
+        return now
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {stage: {"count": n, "mean_ms": round(total / n, 3), "max_ms": round(peak, 3)}
+                    for stage, (n, total, peak) in self._stats.items()}
+
+
+def server_timing(timings: Dict[str, float]) -> str:
+    return ', '.join(f'{stage};dur={ms:.2f}' for stage, ms in timings.items())
+
+
+STAGES = StageTimings()
+
+
+def decode_image(fileobj: BinaryIO, size: int = FEATURE_SIZE) -> Optional[np.ndarray]:
+    """RGB uint8 array with the longest side at most ``size``, or None if not decodable."""
+    try:
+        from PIL import Image
+    except ImportError:
+        return None
+    try:
+        fileobj.seek(0)
+        with Image.open(fileobj) as img:
+            # Own limit, checked before decoding; Pillow's process-wide MAX_IMAGE_PIXELS is left alone
+            if img.size[0] * img.size[1] > MAX_IMAGE_PIXELS:
+                return None
+            # JPEG decodes straight to a reduced scale instead of full size
+            img.draft('RGB', (size, size))
+            img = img.convert('RGB')
+            img.thumbnail((size, size), Image.Resampling.BILINEAR)
+            return np.asarray(img, dtype=np.uint8)
+    except (OSError, ValueError, Image.DecompressionBombError):
+        return None
+
+
+def extract_features(rgb: np.ndarray) -> np.ndarray:
+    """FEATURE_NAMES, in order, for an RGB uint8 image."""
+    px = rgb.reshape(-1, 3).astype(np.float32) / 255.0
+    n = max(len(px), 1)
+    r, g, b = px[:, 0], px[:, 1], px[:, 2]
+    val = px.max(axis=1)
+    delta = val - px.min(axis=1)
+    sat = np.where(val > 0, delta / np.maximum(val, 1e-6), 0.0)
+    chroma = delta > 1e-6
+    safe = np.where(chroma, delta, 1.0)
+    hue = np.where(val == r, ((g - b) / safe) % 6, np.where(val == g, (b - r) / safe + 2, (r - g) / safe + 4)) / 6
+    hue = np.where(chroma, hue, 0.0)
+
+    rgb_hist = [np.bincount(np.minimum((c * RGB_BINS).astype(np.intp), RGB_BINS - 1), minlength=RGB_BINS) / n
+                for c in (r, g, b)]
+
+    # Plant tissue: coloured and not in shadow; hue ranges are in degrees / 360
+    tissue = (sat > 0.15) & (val > 0.15)
+    n_tissue = max(int(tissue.sum()), 1)
+    hue_bins = np.minimum((hue[tissue] * HUE_BINS).astype(np.intp), HUE_BINS - 1)
+    hue_hist = np.bincount(hue_bins, minlength=HUE_BINS) / n_tissue
+    green = tissue & (hue >= 70 / 360) & (hue < 170 / 360)
+    yellow = tissue & (hue >= 40 / 360) & (hue < 70 / 360)
+    brown = tissue & ((hue < 40 / 360) | (hue >= 340 / 360))
+    dark = (val < 0.3) & (sat > 0.1)
+    powdery = (sat < 0.15) & (val > 0.75)
+    lesion = (yellow | brown | dark).sum()
+    ratios = [tissue.sum() / n, green.sum() / n_tissue, yellow.sum() / n_tissue, brown.sum() / n_tissue,
+              dark.sum() / n, powdery.sum() / n, lesion / n_tissue]
+
+    return np.concatenate([
+        *rgb_hist, hue_hist, np.array(ratios, dtype=np.float64),
+        px.mean(axis=0), px.std(axis=0), [sat.mean(), val.mean()],
+    ]).astype(np.float32)
+
+
+class LogisticModel:
+    backend = 'logistic'
+
+    def __init__(self, path: str):
+        with np.load(path, allow_pickle=False) as data:
+            self.coef = data['coef'].astype(np.float64)
+            self.intercept = data['intercept'].astype(np.float64)
+            self.classes = [str(c) for c in data['classes']]
+            self.mean = data['mean'].astype(np.float64) if 'mean' in data else np.zeros(N_FEATURES)
+            self.scale = data['scale'].astype(np.float64) if 'scale' in data else np.ones(N_FEATURES)
+        if self.coef.shape != (len(self.classes), N_FEATURES):
+            raise ValueError(f"{path}: coef must be {len(self.classes)} x {N_FEATURES}, got {self.coef.shape}")
+
+    def predict_proba(self, features: np.ndarray) -> np.ndarray:
+        z = ((features - self.mean) / self.scale) @ self.coef.T + self.intercept
+        z = np.exp(z - z.max(axis=-1, keepdims=True))
+        return z / z.sum(axis=-1, keepdims=True)
+
+
+class OnnxModel:
+    backend = 'onnx'
+
+    def __init__(self, path: str):
+        try:
+            import onnxruntime as ort
+        except ImportError:
+            raise RuntimeError(f"CLASSIFIER_MODEL={path} needs onnxruntime (pip install onnxruntime)")
+        opts = ort.SessionOptions()
+        opts.intra_op_num_threads = CLASSIFIER_THREADS
+        self.session = ort.InferenceSession(path, sess_options=opts, providers=['CPUExecutionProvider'])
+        meta = self.session.get_modelmeta().custom_metadata_map
+        if 'classes' not in meta:
+            raise ValueError(f"{path}: missing 'classes' metadata (JSON list of labels)")
+        self.classes = [str(c) for c in json.loads(meta['classes'])]
+        self.input = self.session.get_inputs()[0].name
+        outputs = [o.name for o in self.session.get_outputs() if o.type == 'tensor(float)']
+        if not outputs:
+            raise ValueError(f"{path}: no float tensor output with class probabilities")
+        self.output = outputs[-1]
+
+    def predict_proba(self, features: np.ndarray) -> np.ndarray:
+        return self.session.run([self.output], {self.input: features.reshape(1, -1).astype(np.float32)})[0][0]
+
+
+class ImageClassifier:
+    def __init__(self, path: str, min_confidence: float = CLASSIFIER_MIN_CONFIDENCE):
+        self.path = path
+        self.min_confidence = min_confidence
+        self.model = OnnxModel(path) if path.endswith('.onnx') else LogisticModel(path)
+        labels = {r.label: r for r in ENGINE.rules}
+        labels.setdefault(ENGINE.unknown.label, ENGINE.unknown)
+        unknown = [c for c in self.model.classes if c not in labels]
+        if unknown:
+            raise ValueError(f"{path}: classes not in the rule catalog: {unknown}")
+        self.rules = [labels[c] for c in self.model.classes]
+        with open(path, 'rb') as f:
+            # Part of the prediction cache key, next to the catalog version
+            self.version = hashlib.sha256(f.read()).hexdigest()[:16]
+        self._lock = threading.Lock()
+        self._counts = {"classified": 0, "fallback": 0}
+
+    def _count(self, outcome: str) -> None:
+        with self._lock:
+            self._counts[outcome] += 1
+
+    def classify(self, fileobj: BinaryIO, timings: Optional[Dict[str, float]] = None) -> Optional[Tuple[float, Rule]]:
+        """(probability, rule) of the top class, or None to fall back to the rule engine."""
+        t = time.perf_counter()
+        rgb = decode_image(fileobj)
+        t = STAGES.lap(timings, 'decode', t)
+        if rgb is None or rgb.size == 0:
+            self._count("fallback")
+            return None
+        features = extract_features(rgb)
+        t = STAGES.lap(timings, 'features', t)
+        proba = np.asarray(self.model.predict_proba(features), dtype=np.float64)
+        STAGES.lap(timings, 'model', t)
+        idx = int(np.argmax(proba))
+        if proba[idx] < self.min_confidence:
+            self._count("fallback")
+            return None
+        self._count("classified")
+        return float(proba[idx]), self.rules[idx]
+
+    def stats(self) -> dict:
+        with self._lock:
+            counts = dict(self._counts)
+        return {"backend": self.model.backend, "model": self.path, "version": self.version,
+                "classes": self.model.classes, "min_confidence": self.min_confidence, **counts}
+
+
+CLASSIFIER: Optional[ImageClassifier] = ImageClassifier(CLASSIFIER_MODEL) if CLASSIFIER_MODEL else None
+
+
+def train(data_dir: str, out_path: str, epochs: int = 500, lr: float = 0.5, l2: float = 1e-3) -> None:
+    """Fit a logistic model on ``data_dir/<rule label>/*`` images and save it as .npz."""
+    features, targets = [], []
+    classes = sorted(d for d in os.listdir(data_dir) if os.path.isdir(os.path.join(data_dir, d)))
+    for ci, label in enumerate(classes):
+        folder = os.path.join(data_dir, label)
+        for name in sorted(os.listdir(folder)):
+            with open(os.path.join(folder, name), 'rb') as f:
+                rgb = decode_image(f)
+            if rgb is not None:
+                features.append(extract_features(rgb))
+                targets.append(ci)
+    if not features:
+        raise SystemExit(f"no decodable images under {data_dir}")
+    x = np.stack(features).astype(np.float64)
+    y = np.eye(len(classes))[targets]
+    mean, scale = x.mean(axis=0), x.std(axis=0) + 1e-6
+    x = (x - mean) / scale
+    coef = np.zeros((len(classes), N_FEATURES))
+    intercept = np.zeros(len(classes))
+    for _ in range(epochs):
+        z = x @ coef.T + intercept
+        p = np.exp(z - z.max(axis=1, keepdims=True))
+        p /= p.sum(axis=1, keepdims=True)
+        err = (p - y) / len(x)
+        coef -= lr * (err.T @ x + l2 * coef)
+        intercept -= lr * err.sum(axis=0)
+    accuracy = float((np.argmax(x @ coef.T + intercept, axis=1) == np.array(targets)).mean())
+    np.savez(out_path, coef=coef, intercept=intercept, classes=np.array(classes), mean=mean, scale=scale)
+    print(f"{len(x)} images, {len(classes)} classes, training accuracy {accuracy:.3f} -> {out_path}")
+
+
+if __name__ == '__main__':
+    # python -m api.classifier train <data_dir> <out.npz>
+    if len(sys.argv) == 4 and sys.argv[1] == 'train':
+        train(sys.argv[2], sys.argv[3])
+        sys.exit(0)
+    print('usage: python -m api.classifier train <data_dir> <out.npz>')
@@ -0,0 +1,124 @@
+"""Validators and conditional GETs for report reads.
+
+``cache_versions`` holds two counters, bumped in the same transaction as the
+write that moves them:
+
+- ``reports`` moves whenever a report is created, deleted or rewritten. It is
+  the ETag of every GET /reports page.
+- ``report_changes`` moves only when an existing report changes or goes away.
+  A report's ETag is its id plus this counter, so a matching If-None-Match is
+  answered with 304 from the counters alone, without loading the report.
+
+The table also holds the schema fingerprint checked at startup (startup.py).
+"""
+import os
+import time
+from datetime import datetime, timezone
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Dict, Optional, Tuple
+
+from fastapi import Request, Response
+from fastapi.staticfiles import StaticFiles
+from sqlalchemy import select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from . import models
+
+REPORTS = 'reports'
+REPORT_CHANGES = 'report_changes'
+
+# API reads may be stored by clients but are revalidated on every use
+API_CACHE_CONTROL = 'no-cache'
+STATIC_MAX_AGE = int(os.getenv('STATIC_MAX_AGE', '3600'))
+
+Version = models.CacheVersion
+
+
+def seed(db: Session) -> None:
+    """Create the counters if missing (safe to run from several workers at once)."""
+    have = set(db.scalars(select(Version.name)))
+    for name in (REPORTS, REPORT_CHANGES):
+        if name in have:
+            continue
+        db.add(Version(name=name, version=0, updated_at=time.time()))
+        try:
+            db.commit()
+        except IntegrityError:
+            db.rollback()
+
+
+def bump(db: Session, *names: str) -> None:
+    # Runs in the caller's transaction; the caller commits
+    db.execute(
+        update(Version).where(Version.name.in_(names))
+        .values(version=Version.version + 1, updated_at=time.time())
+    )
+
+
+def versions(db: Session) -> Dict[str, Tuple[int, float]]:
+    """name -> (version, updated_at as unix time)."""
+    return {r.name: (r.version, r.updated_at) for r in db.execute(select(Version.name, Version.version, Version.updated_at))}
+
+
+def collection_etag(v: Dict[str, Tuple[int, float]]) -> str:
+    return f'"{REPORTS}-{v[REPORTS][0]}"'
+
+
+def report_etag(report_id: int, v: Dict[str, Tuple[int, float]]) -> str:
+    return f'"report-{report_id}-{v[REPORT_CHANGES][0]}"'
+
+
+def report_last_modified(created_at: Optional[datetime], v: Dict[str, Tuple[int, float]]) -> float:
+    changed = v[REPORT_CHANGES][1]
+    if created_at is None:
+        return changed
+    if created_at.tzinfo is None:
+        # Stored as UTC (CURRENT_TIMESTAMP)
+        created_at = created_at.replace(tzinfo=timezone.utc)
+    return max(created_at.timestamp(), changed)
+
+
+def _etag_listed(header: str, etag: str) -> bool:
+    # Weak comparison, as RFC 9110 prescribes for If-None-Match
+    tags = [t.strip() for t in header.split(',')]
+    return '*' in tags or etag in (t[2:] if t.startswith('W/') else t for t in tags)
+
+
+def not_modified(request: Request, etag: str, last_modified: Optional[float]) -> bool:
+    """Whether the client's copy is current; If-None-Match wins over If-Modified-Since."""
+    inm = request.headers.get('if-none-match')
+    if inm is not None:
+        return _etag_listed(inm, etag)
+    ims = request.headers.get('if-modified-since')
+    if ims is None or last_modified is None:
+        return False
+    try:
+        return int(last_modified) <= parsedate_to_datetime(ims).timestamp()
+    except (TypeError, ValueError):
+        return False
+
+
+def validators(etag: str, last_modified: Optional[float]) -> Dict[str, str]:
+    headers = {'ETag': etag, 'Cache-Control': API_CACHE_CONTROL}
+    if last_modified is not None:
+        headers['Last-Modified'] = formatdate(last_modified, usegmt=True)
+    return headers
+
+
+def conditional(request: Request, response: Response, etag: str, last_modified: Optional[float]) -> Optional[Response]:
+    """A 304 if the client's copy is current, else None with the validators set on ``response``."""
+    headers = validators(etag, last_modified)
+    if not_modified(request, etag, last_modified):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return None
+
+
+class CachedStaticFiles(StaticFiles):
+    """StaticFiles (which already does ETag/Last-Modified and 304s) plus Cache-Control."""
+
+    def file_response(self, *args, **kwargs) -> Response:
+        response = super().file_response(*args, **kwargs)
+        response.headers.setdefault('Cache-Control', f'public, max-age={STATIC_MAX_AGE}')
+        return response
@@ -1,38 +1,68 @@
-from fastapi import FastAPI, UploadFile, File, Depends, HTTPException
+from fastapi import APIRouter, FastAPI, UploadFile, File, Depends, HTTPException, Query, Request, Response
 from fastapi.responses import StreamingResponse, FileResponse
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
+from fastapi.concurrency import run_in_threadpool
+from fastapi.exceptions import RequestValidationError
+from pydantic import ValidationError
+from starlette.datastructures import UploadFile as StarletteUploadFile
+from sqlalchemy import delete, insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from .database import Base, engine, get_db
+from .database import DB_ASYNC, SessionLocal, async_engine, engine, get_async_db, get_db
 from . import models, schemas
+from .rules import ENGINE, severity_from_conf
+from . import scoring
+from .cache import PREDICTION_CACHE
+from .classifier import CLASSIFIER, STAGES, server_timing
+from .uploads import (
+    BATCH_MAX_FILES, BATCH_WORKERS, MAX_BATCH_BYTES, MAX_REPORT_BYTES, MAX_UPLOAD_BYTES, UploadLimitMiddleware,
+    batch_items, check_upload_size, hash_fileobj, upload_length,
+)
+from .workers import CPU_POOL, HASH_POOL, pool_stats
+from . import bulk, httpcache, metrics, startup, stats, storage, zipstream
+from .texts import TEXTS, legacy_recommendations
+from .thumbnails import SIZES as IMAGE_SIZES, THUMBS, image_entry, source_key
+from .writebehind import REPORT_WRITE_BEHIND, WRITER
+from .queries import (
+    DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, SUMMARY_COLUMNS, ReportFilters,
+    after_cursor, encode_cursor, newest_first,
+)
+import asyncio
+import csv
 import json
 import os
 import io
-import re
-import time
-import base64
-import zipfile
+import zlib
 import random
-import hashlib
-from typing import List
-from glob import glob
-
-STORAGE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'storage')
-REPORTS_DIR = os.path.join(STORAGE_DIR, 'reports')
-IMAGES_DIR = os.path.join(STORAGE_DIR, 'images')
-os.makedirs(REPORTS_DIR, exist_ok=True)
-os.makedirs(IMAGES_DIR, exist_ok=True)
-
-# Create tables
-Base.metadata.create_all(bind=engine)
-
-app = FastAPI(title="CropAI API", version="0.1.0")
-WEB_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'web')
-app.mount("/static", StaticFiles(directory=WEB_DIR), name="static")
+import time
+from datetime import date
+from typing import List, Literal, Optional
+from collections import deque
+from contextlib import asynccontextmanager
+from itertools import islice
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Schema bootstrap and warm-up run once per worker here rather than on import
+    await run_in_threadpool(startup.startup)
+    if REPORT_WRITE_BEHIND:
+        # Also replays jobs journaled by a previous run
+        WRITER.start()
+    yield
+    engine.dispose()
+    if async_engine is not None:
+        await async_engine.dispose()
+
+
+app = FastAPI(title="CropAI API", version="0.1.0", lifespan=lifespan)
+WEB_DIR = os.getenv('WEB_DIR') or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'web')
+app.mount("/static", httpcache.CachedStaticFiles(directory=WEB_DIR), name="static")
 
 @app.get("/")
 def root_page():
-    return FileResponse(os.path.join(WEB_DIR, "index.html"))
+    # Revalidated on every load so a deploy's new asset links are picked up
+    return FileResponse(os.path.join(WEB_DIR, "index.html"), headers={"Cache-Control": "no-cache"})
 
 # CORS for local dev
 app.add_middleware(
@@ -42,309 +72,488 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# Refuse oversized uploads before their multipart body is parsed
+app.add_middleware(UploadLimitMiddleware, limits={
+    "/predict": MAX_UPLOAD_BYTES,
+    "/predict_multi": MAX_UPLOAD_BYTES,
+    "/predict_batch": MAX_BATCH_BYTES,
+    "/reports": MAX_REPORT_BYTES,
+    "/reports/bulk": bulk.MAX_BULK_BYTES,
+})
+# Added last so it is outermost and times everything above
+app.add_middleware(metrics.MetricsMiddleware)
+metrics.instrument_engine(engine, 'sync')
+if async_engine is not None:
+    metrics.instrument_engine(async_engine.sync_engine, 'async')
+
+# Endpoints that mostly wait on the database come in a sync flavour (threadpool + Session)
+# and an async one (AsyncSession); DB_ASYNC picks which router is mounted at the bottom.
+sync_db = APIRouter()
+async_db = APIRouter()
+
+
+# Cached scores are only valid for the same catalog and model
+PREDICT_VERSION = ENGINE.version if CLASSIFIER is None else f"{ENGINE.version}:{CLASSIFIER.version}"
+
+
+def predict_from_hash(img_hash: bytes, filename: str, fileobj=None, timings=None) -> schemas.Prediction:
+    """Score an image given its SHA-256 digest and lower-cased filename.
+
+    With a classifier configured, ``fileobj`` (the image) is decoded and classified
+    first; the rule engine scores whatever the classifier can't. Stage durations in
+    milliseconds are added to ``timings``.
+    """
+    # Same image + filename under the same catalog always scores the same; reuse it
+    cache_key = (img_hash.hex(), filename.strip(), PREDICT_VERSION)
+    t = time.perf_counter()
+    cached = PREDICTION_CACHE.get(cache_key)
+    STAGES.lap(timings, 'cache', t)
+    if cached is not None:
+        base_conf, rule, from_model = cached[0], ENGINE.rule(cached[1]), cached[2]
+    else:
+        hit = CLASSIFIER.classify(fileobj, timings) if CLASSIFIER is not None and fileobj is not None else None
+        from_model = hit is not None
+        if hit is not None:
+            base_conf, rule = hit
+        else:
+            t = time.perf_counter()
+            seed = int.from_bytes(img_hash[:8], 'big')
+            # Score each rule using base confidence + content-derived jitter; boost matches from filename keywords
+            base_conf, rule = scoring.best_rule(seed, ENGINE.match(filename))
+            STAGES.lap(timings, 'rules', t)
+        PREDICTION_CACHE.put(cache_key, (base_conf, rule.index, from_model))
+    disease = rule.label
+    recs = list(rule.recs)
+
+    if from_model:
+        # Model probabilities are reported as they are; rule-engine fallbacks get the usual adjustments
+        confidence = base_conf
+    else:
+        # Small secondary adjustment from filename length for tie-breaking
+        adj = ((len(filename) % 7) - 3) * 0.01  # in [-0.03, +0.03]
+        # Add a small runtime jitter so repeated predictions can change slightly
+        runtime_jitter = random.uniform(-0.03, 0.03)
+        confidence = max(0.0, min(1.0, base_conf + adj + runtime_jitter))
 
+    # Map confidence to severity using shared bands
+    severity = severity_from_conf(confidence, disease)
 
-def _normalize(name: str) -> str:
-    return (name or '').strip().lower()
-
+    # Disease-specific treatment steps, pre-joined per severity band
+    treatment = rule.treatment_for(severity)
 
-def get_disease_rules():
-    """Shared disease catalog: patterns, base_conf, and recommendations."""
-    return [
-        {"patterns": ["late blight", "phytophthora"], "label": "Late Blight", "base_conf": 0.88, "recs": [
-            "Apply fungicides effective against late blight.",
-            "Remove and destroy infected plant debris.",
-            "Avoid leaf wetness; ensure good field drainage.",
-        ]},
-        {"patterns": ["early blight", "alternaria"], "label": "Early Blight", "base_conf": 0.84, "recs": [
-            "Rotate crops and avoid nightshade volunteers.",
-            "Use protectant fungicides as per label.",
-            "Prune lower leaves to improve airflow.",
-        ]},
-        {"patterns": ["rust", "orange pustule", "pustule", "orange", "brown"], "label": "Rust", "base_conf": 0.80, "recs": [
-            "Apply rust-targeted fungicide.",
-            "Reduce overhead irrigation; minimize leaf wetness.",
-            "Scout nearby fields for spread and volunteer hosts.",
-        ]},
-        {"patterns": ["leaf spot", "spot", "cercospora"], "label": "Leaf Spot", "base_conf": 0.78, "recs": [
-            "Remove severely spotted leaves.",
-            "Use a broad-spectrum fungicide if pressure is high.",
-            "Increase spacing to improve airflow.",
-        ]},
-        {"patterns": ["downy", "downy mildew", "peronospora"], "label": "Downy Mildew", "base_conf": 0.82, "recs": [
-            "Use labeled fungicides effective on downy mildew.",
-            "Reduce leaf wetness; water early in the day.",
-            "Improve airflow and remove infected material.",
-        ]},
-        {"patterns": ["anthracnose"], "label": "Anthracnose", "base_conf": 0.79, "recs": [
-            "Prune and destroy infected tissues.",
-            "Apply recommended fungicides preventively.",
-            "Avoid overhead irrigation.",
-        ]},
-        {"patterns": ["septoria"], "label": "Septoria Leaf Spot", "base_conf": 0.77, "recs": [
-            "Remove infected leaves and debris.",
-            "Rotate crops; avoid volunteer hosts.",
-            "Use protectant fungicides where needed.",
-        ]},
-        {"patterns": ["mildew", "powdery"], "label": "Powdery Mildew", "base_conf": 0.83, "recs": [
-            "Apply sulfur or other labeled fungicides.",
-            "Avoid excessive nitrogen fertilization.",
-            "Ensure sunlight penetration and airflow.",
-        ]},
-        {"patterns": ["mosaic", "virus"], "label": "Viral Mosaic", "base_conf": 0.76, "recs": [
-            "Remove infected plants to reduce spread.",
-            "Control vectors (aphids/whiteflies).",
-            "Use certified disease-free seed/planting material.",
-        ]},
-        {"patterns": ["leaf curl", "curl"], "label": "Leaf Curl Virus", "base_conf": 0.75, "recs": [
-            "Rogue infected plants.", "Control whitefly/aphid vectors.", "Use virus-free transplants.",
-        ]},
-        {"patterns": ["fusarium", "wilt"], "label": "Fusarium Wilt", "base_conf": 0.74, "recs": [
-            "Remove infected plants; sanitize soil-contact tools.",
-            "Improve drainage; avoid waterlogging.",
-            "Use resistant cultivars and rotate crops.",
-        ]},
-        {"patterns": ["verticillium"], "label": "Verticillium Wilt", "base_conf": 0.72, "recs": [
-            "Rotate out of susceptible hosts for multiple seasons.",
-            "Improve soil health; solarize where feasible.",
-            "Use resistant rootstocks/cultivars.",
-        ]},
-        {"patterns": ["canker"], "label": "Canker", "base_conf": 0.70, "recs": [
-            "Prune cankered tissue; disinfect tools.",
-            "Apply copper-based protectants after pruning.",
-            "Avoid injuries and water stress.",
-        ]},
-        {"patterns": ["leaf miner", "miner trails", "mining"], "label": "Leaf Miner Damage", "base_conf": 0.68, "recs": [
-            "Remove mined leaves.", "Use labeled insecticides if pressure high.", "Promote natural enemies.",
-        ]},
-        {"patterns": ["aphid", "aphids"], "label": "Aphid Infestation", "base_conf": 0.66, "recs": [
-            "Use insecticidal soap or labeled aphicides.", "Control ants; encourage predators.", "Remove heavily infested shoots.",
-        ]},
-        {"patterns": ["nitrogen deficiency", "chlorosis", "pale"], "label": "Nitrogen Deficiency", "base_conf": 0.65, "recs": [
-            "Apply recommended nitrogen fertilizer.", "Mulch and add organic matter.", "Confirm via soil test.",
-        ]},
-        {"patterns": ["potassium deficiency", "leaf edge burn", "scorch"], "label": "Potassium Deficiency", "base_conf": 0.64, "recs": [
-            "Apply K fertilizer per soil test.", "Avoid drought stress.", "Balance N:K ratio.",
-        ]},
-        {"patterns": ["magnesium deficiency", "interveinal chlorosis"], "label": "Magnesium Deficiency", "base_conf": 0.64, "recs": [
-            "Apply Mg (e.g., Epsom salt) per recommendation.", "Manage soil pH.", "Avoid excess K competing with Mg.",
-        ]},
-        {"patterns": ["iron deficiency", "iron chlorosis"], "label": "Iron Chlorosis", "base_conf": 0.63, "recs": [
-            "Apply chelated iron as foliar or soil drench.", "Adjust pH to optimal range.", "Improve drainage.",
-        ]},
-        {"patterns": ["phosphorus deficiency", "purpling"], "label": "Phosphorus Deficiency", "base_conf": 0.62, "recs": [
-            "Apply P fertilizer per soil test.", "Maintain warm, well-drained soil.", "Avoid over-liming.",
-        ]},
-        {"patterns": ["scab"], "label": "Scab", "base_conf": 0.74, "recs": [
-            "Maintain proper soil moisture and pH.", "Use resistant varieties when available.", "Practice crop rotation.",
-        ]},
-        {"patterns": ["black rot"], "label": "Black Rot", "base_conf": 0.78, "recs": [
-            "Remove mummified fruit and cankered wood.", "Apply fungicides during susceptible periods.", "Promote canopy airflow.",
-        ]},
-        {"patterns": ["bacterial spot", "xanthomonas"], "label": "Bacterial Leaf Spot", "base_conf": 0.75, "recs": [
-            "Use certified disease-free seed/transplants.", "Apply copper-based bactericides per label.", "Avoid handling when foliage is wet.",
-        ]},
-        {"patterns": ["bacterial", "ooze"], "label": "Bacterial Infection", "base_conf": 0.72, "recs": [
-            "Remove infected tissue and sanitize tools.", "Avoid working in fields when foliage is wet.", "Consider copper-based bactericides per label.",
-        ]},
-        {"patterns": ["sunscald", "sun burn", "sunburn", "heat stress"], "label": "Sunscald / Heat Stress", "base_conf": 0.68, "recs": [
-            "Provide shade or reduce heat exposure.", "Avoid midday spraying to prevent burn.", "Ensure adequate irrigation.",
-        ]},
-        {"patterns": ["sooty mold", "sooty"], "label": "Sooty Mold", "base_conf": 0.66, "recs": [
-            "Control sap-sucking insects (aphids/whiteflies).", "Wash foliage to remove soot where practical.", "Improve airflow and reduce honeydew sources.",
-        ]},
-        {"patterns": ["healthy", "normal"], "label": "Healthy", "base_conf": 0.90, "recs": [
-            "No action required.", "Continue routine scouting and good agronomy.",
-        ]},
-    ]
+    return schemas.Prediction(disease=disease, confidence=confidence, severity=severity, recommendations=recs, treatment=treatment)
 
 
-def get_treatment_db():
-    """Shared treatment guidance per disease, severity adjustment added later."""
+@app.post("/predict", response_model=schemas.Prediction)
+async def predict(response: Response, file: UploadFile = File(...)):
+    # Image-feature classifier when CLASSIFIER_MODEL is set, else the deterministic rule-based one.
+    # It supports multiple common disease types and returns confidence and severity.
+    filename = (file.filename or "upload").lower()
+    # Hash the image in chunks and derive a deterministic hash-based RNG so different images vary.
+    # Hashing and scoring run on the worker pool so large uploads don't stall the event loop.
+    check_upload_size(file)
+    timings = {}
+    prediction = await HASH_POOL.run(_predict_fileobj, file.file, filename, timings)
+    response.headers['Server-Timing'] = server_timing(timings)
+    return prediction
+
+
+def _predict_fileobj(fileobj, filename: str, timings=None) -> schemas.Prediction:
+    t = time.perf_counter()
+    img_hash = hash_fileobj(fileobj)
+    STAGES.lap(timings, 'hash', t)
+    return predict_from_hash(img_hash, filename, fileobj, timings)
+
+
+@app.post("/predict_batch")
+async def predict_batch(request: Request):
+    # Multipart with any number of "files" parts; each may be an image or a zip of images.
+    # The form is parsed here rather than via File(...) so the uploads stay open while streaming.
+    form = await request.form(max_files=BATCH_MAX_FILES)
+    uploads = [f for f in form.getlist('files') if isinstance(f, StarletteUploadFile)]
+    if not uploads:
+        await form.close()
+        raise HTTPException(status_code=400, detail="No files uploaded")
+    try:
+        HASH_POOL.ensure_capacity()
+        items, archives = batch_items(uploads)
+    except HTTPException:
+        await form.close()
+        raise
+
+    def score(item):
+        name, opener = item
+        with opener() as fh:
+            return _predict_fileobj(fh, name.lower())
+
+    def results():
+        try:
+            # Keep up to BATCH_WORKERS images hashing at once; lines go out in input order
+            pending = iter(items)
+            window = deque()
+            for item in islice(pending, BATCH_WORKERS):
+                window.append((item[0], HASH_POOL.submit(score, item, reject=False)))
+            index = 0
+            while window:
+                name, fut = window.popleft()
+                nxt = next(pending, None)
+                if nxt is not None:
+                    window.append((nxt[0], HASH_POOL.submit(score, nxt, reject=False)))
+                try:
+                    line = {"index": index, "filename": name, **fut.result().model_dump()}
+                except HTTPException as e:
+                    line = {"index": index, "filename": name, "error": e.detail}
+                except Exception as e:
+                    line = {"index": index, "filename": name, "error": str(e) or e.__class__.__name__}
+                index += 1
+                yield json.dumps(line, ensure_ascii=False) + "\n"
+        finally:
+            for zf in archives:
+                zf.close()
+            for upload in uploads:
+                upload.file.close()
+
+    return StreamingResponse(results(), media_type='application/x-ndjson')
+
+
+@app.get("/predict/cache")
+def prediction_cache_stats():
+    return PREDICTION_CACHE.stats()
+
+
+@app.get("/predict/classifier")
+def classifier_stats():
+    # Which backend scores /predict, how often it fell back to the rules, and per-stage latency
     return {
-        _normalize("Unknown"): [
-            "Re-take a clear, well-lit image for better diagnosis.",
-            "Consult local extension for ambiguous symptoms.",
-        ],
-        _normalize("Healthy"): ["Maintain good agronomy; continue monitoring."],
-        _normalize("Late Blight"): ["Destroy infected debris and volunteer hosts.", "Apply systemic+contact fungicide rotation as labeled.", "Improve drainage; avoid prolonged leaf wetness."],
-        _normalize("Early Blight"): ["Remove lower infected leaves to reduce inoculum.", "Use protectant fungicides; rotate modes of action.", "Maintain balanced nutrition; avoid overhead irrigation."],
-        _normalize("Rust"): ["Scout and remove heavily infected leaves.", "Apply rust-targeted fungicides per label.", "Reduce leaf wetness; increase airflow."],
-        _normalize("Leaf Spot"): ["Prune affected foliage and dispose away from field.", "Use broad-spectrum protectants if pressure is high.", "Improve canopy airflow and sanitation."],
-        _normalize("Downy Mildew"): ["Use effective downy mildew fungicides.", "Irrigate early; minimize night-time leaf wetness.", "Remove infected material; enhance airflow."],
-        _normalize("Anthracnose"): ["Prune and destroy infected twigs/fruit.", "Preventive fungicide sprays during wet periods.", "Avoid overhead irrigation; sanitize tools."],
-        _normalize("Septoria Leaf Spot"): ["Remove infected leaves and debris.", "Rotate crops; use clean seed/transplants.", "Apply protectants; improve airflow."],
-        _normalize("Powdery Mildew"): ["Apply sulfur or labeled PM fungicides.", "Avoid excess nitrogen; improve sunlight and airflow.", "Remove severely infected leaves."],
-        _normalize("Viral Mosaic"): ["Rogue infected plants to limit spread.", "Control vectors (aphids/whiteflies).", "Use virus-free seed/planting material."],
-        _normalize("Leaf Curl Virus"): ["Rogue infected plants.", "Control whitefly/aphid vectors.", "Use virus-free transplants."],
-        _normalize("Fusarium Wilt"): ["Remove infected plants; sanitize tools.", "Improve drainage; avoid waterlogging.", "Use resistant cultivars and rotate crops."],
-        _normalize("Verticillium Wilt"): ["Rotate out of susceptible hosts.", "Improve soil health; solarize where feasible.", "Use resistant rootstocks/cultivars."],
-        _normalize("Canker"): ["Prune cankered tissue 10–15 cm below symptoms; disinfect tools.", "Copper-based sprays after pruning.", "Avoid injuries and water stress."],
-        _normalize("Leaf Miner Damage"): ["Remove mined leaves.", "Use labeled insecticides if pressure high.", "Promote natural enemies."],
-        _normalize("Aphid Infestation"): ["Use insecticidal soap or aphicides as labeled.", "Control ants; encourage predators.", "Remove heavily infested shoots."],
-        _normalize("Scab"): ["Maintain moisture and pH; avoid injuries.", "Use resistant varieties when available.", "Rotate out of susceptible hosts."],
-        _normalize("Black Rot"): ["Remove mummified fruit and cankered wood.", "Fungicide program during susceptible stages.", "Open canopy to improve drying."],
-        _normalize("Bacterial Leaf Spot"): ["Use certified disease-free seed/transplants.", "Copper-based bactericides; avoid handling wet foliage.", "Sanitize tools and manage splash dispersal."],
-        _normalize("Bacterial Infection"): ["Prune infected tissue; sanitize equipment.", "Avoid working when foliage is wet.", "Consider copper products as labeled."],
-        _normalize("Sunscald / Heat Stress"): ["Provide shade; stagger irrigation to reduce stress.", "Avoid midday sprays; use mulch to conserve moisture.", "Plan for heat-tolerant varieties."],
-        _normalize("Nitrogen Deficiency"): ["Apply recommended nitrogen; avoid over-application.", "Incorporate organic matter; mulch.", "Verify with soil test; re-evaluate in 10–14 days."],
-        _normalize("Potassium Deficiency"): ["Apply K fertilizer per soil test.", "Avoid drought stress.", "Balance N:K ratio."],
-        _normalize("Magnesium Deficiency"): ["Apply Mg (e.g., Epsom salt) per recommendation.", "Manage soil pH.", "Avoid excess K competing with Mg."],
-        _normalize("Iron Chlorosis"): ["Apply chelated iron.", "Adjust pH to optimal range.", "Improve drainage."],
-        _normalize("Phosphorus Deficiency"): ["Apply P fertilizer per soil test.", "Maintain warm, well-drained soil.", "Avoid over-liming."],
-        _normalize("Sooty Mold"): ["Control sap-sucking pests (aphids/whiteflies).", "Wash affected leaves where practical.", "Improve airflow; remove honeydew sources."],
+        "classifier": CLASSIFIER.stats() if CLASSIFIER is not None else None,
+        "stages": STAGES.stats(),
     }
 
 
-def severity_from_conf(conf: float, disease_label: str) -> str:
-    """Map confidence (0..1) to severity bands. Healthy/Unknown always Low.
-    - High: 80–100%
-    - Moderate: 50–79%
-    - Low: 0–49%
-    """
-    if (disease_label or '') in ("Healthy", "Unknown"):
-        return "Low"
-    pct = max(0.0, min(1.0, conf))
-    if pct >= 0.80:
-        return "High"
-    if pct >= 0.50:
-        return "Moderate"
-    return "Low"
-@app.post("/predict", response_model=schemas.Prediction)
-async def predict(file: UploadFile = File(...)):
-    # Lightweight, deterministic rule-based classifier without external ML deps.
-    # It supports multiple common disease types and returns confidence and severity.
-    filename = (file.filename or "upload").lower()
-    # Read image bytes and derive a deterministic hash-based RNG so different images vary
-    blob = await file.read()
-    if not isinstance(blob, (bytes, bytearray)):
-        blob = bytes(str(blob), 'utf-8')
-    img_hash = hashlib.sha256(blob).digest()
-    seed = int.from_bytes(img_hash[:8], 'big')
-    rng = random.Random(seed)
+@app.get("/workers")
+def worker_stats():
+    return pool_stats()
 
-    # Shared disease rules
-    DISEASE_RULES = get_disease_rules()
-
-    # Score each rule using base confidence + content-derived jitter; boost matches from filename keywords
-    best = None
-    for rule in DISEASE_RULES:
-        base = rule["base_conf"]
-        jitter = rng.uniform(-0.1, 0.1)
-        boost = 0.1 if any(p in filename for p in rule["patterns"]) else 0.0
-        score = max(0.0, min(1.0, base + jitter + boost))
-        entry = (score, rule)
-        if best is None or entry[0] > best[0]:
-            best = entry
-
-    if best is None:
-        disease = "Unknown"
-        base_conf = 0.5
-        recs = [
-            "Unable to confidently classify. Re-take a clear, well-lit image.",
-            "Scout for additional symptoms and consult a local expert if needed.",
-        ]
-    else:
-        disease = best[1]["label"]
-        base_conf = best[0]
-        recs = best[1]["recs"]
 
-    # Small secondary adjustment from filename length for tie-breaking
-    adj = ((len(filename) % 7) - 3) * 0.01  # in [-0.03, +0.03]
-    # Add a small runtime jitter so repeated predictions can change slightly
-    runtime_jitter = random.uniform(-0.03, 0.03)
-    confidence = max(0.0, min(1.0, base_conf + adj + runtime_jitter))
+@metrics.REGISTRY.gauge('cropai_db_pool_connections', 'Database pool connections by state.')
+def _db_pool_samples():
+    yield from metrics.pool_samples(engine, 'sync')
+    if async_engine is not None:
+        yield from metrics.pool_samples(async_engine.sync_engine, 'async')
 
-    # Map confidence to severity using shared bands
-    severity = severity_from_conf(confidence, disease)
 
-    # Disease-specific treatment steps (basic, safe defaults)
-    TREATMENT_DB = get_treatment_db()
+@metrics.REGISTRY.gauge('cropai_worker_pool', 'Worker pool queue depth and task counters.')
+def _worker_pool_samples():
+    for p in pool_stats():
+        for key in ('queue_depth', 'max_queue', 'submitted', 'completed', 'failed', 'rejected'):
+            yield {"pool": p["name"], "field": key}, p[key]
 
-    def adjust_by_severity(steps: List[str], sev: str) -> List[str]:
-        sev = (sev or '').lower()
-        if sev == 'high':
-            return ["Urgent: Act within 24–48 hours."] + steps + ["Increase scouting frequency (daily) until stabilized."]
-        if sev == 'moderate':
-            return steps + ["Monitor twice per week and reassess in 7 days."]
-        return steps + ["Monitor weekly; no drastic actions needed."]
 
-    base_steps = TREATMENT_DB.get(_normalize(disease), TREATMENT_DB[_normalize("Unknown")])
-    treatment = adjust_by_severity(base_steps, severity)
+@metrics.REGISTRY.gauge('cropai_cache', 'Prediction, thumbnail and write-behind counters.')
+def _cache_samples():
+    for name, values in (("prediction", PREDICTION_CACHE.stats()), ("thumbnail", THUMBS.stats()),
+                         ("write_behind", WRITER.stats())):
+        for key, value in values.items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                yield {"cache": name, "field": key}, value
 
-    return schemas.Prediction(disease=disease, confidence=confidence, severity=severity, recommendations=recs, treatment=treatment)
 
+@app.get("/metrics")
+def metrics_text():
+    # Prometheus text exposition format
+    return Response(metrics.REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
 
-@app.post("/reports", response_model=schemas.ReportOut)
-def create_report(payload: schemas.ReportCreate, db: Session = Depends(get_db)):
-    # Persist minimal info in DB (existing schema)
-    report = models.Report(
-        filename=payload.filename,
-        disease=payload.disease,
-        confidence=payload.confidence,
-        severity=payload.severity,
-        recommendations=json.dumps(payload.recommendations),
-    )
-    db.add(report)
-    db.commit()
-    db.refresh(report)
 
-    # Save annotated image (if provided as data URL)
-    img_path = None
-    if payload.annotated_image and isinstance(payload.annotated_image, str) and payload.annotated_image.startswith('data:image/'):
-        try:
-            header, b64 = payload.annotated_image.split(',', 1)
-            ext = 'png'
-            m = re.search(r'data:image/(.*?);base64', header)
-            if m:
-                ext = m.group(1).split('+')[0].split(';')[0] or 'png'
-            raw = base64.b64decode(b64)
-            ts = int(time.time())
-            base_name = f"{report.id}-{ts}"
-            img_path = os.path.join(IMAGES_DIR, f"{base_name}.{ext}")
-            with open(img_path, 'wb') as f:
-                f.write(raw)
-        except Exception:
-            img_path = None
-
-    # Save JSON report file (including treatment list)
-    ts = int(time.time())
-    json_name = f"{report.id}-{ts}.json"
-    json_path = os.path.join(REPORTS_DIR, json_name)
-    payload_dict = {
-        "id": report.id,
+if metrics.PROFILER is not None:
+    @app.get("/debug/profile")
+    def profile(reset: bool = False):
+        # Collapsed stacks (flamegraph.pl / speedscope) sampled since start or the last reset
+        return Response(metrics.PROFILER.collapsed(reset), media_type="text/plain; charset=utf-8")
+
+
+def _parse_report(raw) -> schemas.ReportCreate:
+    if raw is None:
+        raise RequestValidationError([{"type": "missing", "loc": ("body", "report"), "msg": "Field required", "input": None}])
+    try:
+        return schemas.ReportCreate.model_validate_json(raw)
+    except ValidationError as e:
+        raise RequestValidationError([{**err, "loc": ("body", *err["loc"])} for err in e.errors(include_url=False)])
+
+
+REPORT_BODY_DOC = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "application/json": {"schema": schemas.ReportCreate.model_json_schema()},
+            "multipart/form-data": {"schema": {
+                "type": "object",
+                "required": ["report"],
+                "properties": {
+                    "report": {"type": "string", "description": "ReportCreate as JSON (annotated_image ignored)"},
+                    "image": {"type": "string", "format": "binary"},
+                },
+            }},
+        },
+    }
+}
+
+
+async def _read_report(request: Request):
+    """(payload, image upload or None, form to close or None) from a JSON or multipart body."""
+    if not request.headers.get('content-type', '').startswith(('multipart/form-data', 'application/x-www-form-urlencoded')):
+        return _parse_report(await request.body()), None, None
+    form = await request.form(max_files=1, max_fields=8)
+    try:
+        payload = _parse_report(form.get('report'))
+        image = form.get('image')
+        if not isinstance(image, StarletteUploadFile):
+            image = None
+        elif image.size is not None and image.size > MAX_UPLOAD_BYTES:
+            raise HTTPException(status_code=413, detail=f"Upload exceeds the {MAX_UPLOAD_BYTES} byte limit")
+    except Exception:
+        await form.close()
+        raise
+    return payload, image, form
+
+
+@sync_db.post("/reports", response_model=schemas.ReportOut, openapi_extra=REPORT_BODY_DOC)
+async def create_report(request: Request, db: Session = Depends(get_db)):
+    # Accepts the JSON body (annotated image as a base64 data URL) or multipart form data
+    # with the metadata in a "report" part and the image as a raw binary "image" part.
+    with metrics.stage('upload_read'):
+        payload, image, form = await _read_report(request)
+    try:
+        return await run_in_threadpool(save_report, payload, db, image)
+    finally:
+        if form is not None:
+            await form.close()
+
+
+@async_db.post("/reports", response_model=schemas.ReportOut, openapi_extra=REPORT_BODY_DOC)
+async def create_report_async(request: Request, db: AsyncSession = Depends(get_async_db)):
+    with metrics.stage('upload_read'):
+        payload, image, form = await _read_report(request)
+    try:
+        return await save_report_async(payload, db, image)
+    finally:
+        if form is not None:
+            await form.close()
+
+
+def _report_record(report_id: int, payload: schemas.ReportCreate, created_at) -> dict:
+    # Contents of the JSON report file
+    return {
+        "id": report_id,
         "filename": payload.filename,
         "disease": payload.disease,
         "confidence": payload.confidence,
         "severity": payload.severity,
         "recommendations": payload.recommendations or [],
         "treatment": payload.treatment or [],
-        "annotated_image_path": img_path,
-        "created_at": getattr(report, 'created_at', None).__str__() if getattr(report, 'created_at', None) else None,
+        "annotated_image_path": None,
+        "created_at": str(created_at) if created_at else None,
     }
+
+
+def _submit_report_files(jobs):
+    """Start writing (report_id, record, base_name, annotated_image, image_artifact) jobs' files.
+
+    Returns (report_id, future of manifest entries) for the jobs written inline.
+    """
+    if REPORT_WRITE_BEHIND:
+        # Write-behind mode hands the files to the background writer; a full queue falls back to inline
+        jobs = [job for job in jobs if not WRITER.enqueue(*job)]
+    return [(job[0], CPU_POOL.submit(metrics.timed_call, storage.write_report_files, *job[1:], reject=False))
+            for job in jobs]
+
+
+def _written(timed) -> List[dict]:
+    artifacts, seconds = timed
+    metrics.observe('file_write', seconds)
+    return artifacts
+
+
+def _record_report_files(db: Session, written) -> None:
+    # Index the written files so downloads and deletes never scan the storage directories
+    artifacts = [a for _, batch in written for a in batch]
     try:
-        with open(json_path, 'w', encoding='utf-8') as f:
-            json.dump(payload_dict, f, ensure_ascii=False, indent=2)
-    except Exception:
-        pass
+        for report_id, batch in written:
+            storage.record_artifacts(db, report_id, batch)
+        if written:
+            with metrics.stage('db_commit'):
+                db.commit()
+    except BaseException:
+        storage.settle_claims(artifacts, committed=False)
+        raise
+    storage.settle_claims(artifacts)
+
+
+def _write_report_files(db: Session, jobs) -> None:
+    _record_report_files(db, [(report_id, _written(fut.result())) for report_id, fut in _submit_report_files(jobs)])
+
 
-    # Construct response manually to include treatment even if DB lacks column
+def _new_report(payload: schemas.ReportCreate) -> models.Report:
+    # Recommendations and treatment are stored as report_texts links, not on the row
+    return models.Report(
+        filename=payload.filename,
+        disease=payload.disease,
+        confidence=payload.confidence,
+        severity=payload.severity,
+    )
+
+
+def _report_texts(report_id: int, payload: schemas.ReportCreate, text_ids) -> List[dict]:
+    return TEXTS.link_rows(report_id, payload.recommendations or [], payload.treatment or [], text_ids)
+
+
+def _report_out(report: models.Report, payload: schemas.ReportCreate) -> schemas.ReportOut:
     return schemas.ReportOut(
         id=report.id,
         filename=payload.filename,
         disease=payload.disease,
         confidence=payload.confidence,
         severity=payload.severity,
-        recommendations=payload.recommendations or json.loads(report.recommendations or '[]'),
+        recommendations=payload.recommendations or [],
         treatment=payload.treatment or [],
     )
 
 
-@app.get("/reports", response_model=List[schemas.ReportOut])
-def list_reports(db: Session = Depends(get_db)):
-    rows = db.query(models.Report).order_by(models.Report.created_at.desc()).all()
+def save_report(payload: schemas.ReportCreate, db: Session, image: Optional[StarletteUploadFile] = None) -> schemas.ReportOut:
+    if not REPORT_WRITE_BEHIND:
+        # Shed load before writing anything rather than leaving a row without its files
+        CPU_POOL.ensure_capacity()
+    # Interned before the insert starts: new texts are committed on their own connection
+    text_ids = TEXTS.ids((payload.recommendations or []) + (payload.treatment or []))
+    report = _new_report(payload)
+    db.add(report)
+    db.flush()
+    db.refresh(report)
+    links = _report_texts(report.id, payload, text_ids)
+    if links:
+        db.execute(insert(models.ReportText), links)
+    # Rollup row changes in the same transaction as the insert
+    stats.add_reports(db, [(report.created_at, report.disease, report.severity, report.confidence)])
+    httpcache.bump(db, httpcache.REPORTS)
+    with metrics.stage('db_commit'):
+        db.commit()
+
+    # Decode/write the annotated image and JSON report file on the worker pool
+    payload_dict = _report_record(report.id, payload, report.created_at)
+    base_name = storage.artifact_base_name(report.id)
+    image_artifact = None
+    if image is not None:
+        # Binary upload: copied chunk by chunk into the blob store, no base64 involved
+        ext = storage.image_ext(image.content_type, image.filename)
+        image_artifact = HASH_POOL.submit(
+            storage.put_image_stream, image.file, ext, f"{base_name}.{ext}", reject=False
+        ).result()
+    annotated_image = None if image is not None else payload.annotated_image
+    _write_report_files(db, [(report.id, payload_dict, base_name, annotated_image, image_artifact)])
+    return _report_out(report, payload)
+
+
+async def save_report_async(payload: schemas.ReportCreate, db: AsyncSession,
+                            image: Optional[StarletteUploadFile] = None) -> schemas.ReportOut:
+    # Same steps as save_report; file work is awaited on the worker pools instead of blocking a thread
+    if not REPORT_WRITE_BEHIND:
+        CPU_POOL.ensure_capacity()
+    strings = (payload.recommendations or []) + (payload.treatment or [])
+    text_ids = TEXTS.cached_ids(strings)
+    if text_ids is None:
+        text_ids = await run_in_threadpool(TEXTS.ids, strings)
+    report = _new_report(payload)
+    db.add(report)
+    await db.flush()
+    await db.refresh(report)
+    links = _report_texts(report.id, payload, text_ids)
+    if links:
+        await db.execute(insert(models.ReportText), links)
+    await db.run_sync(stats.add_reports, [(report.created_at, report.disease, report.severity, report.confidence)])
+    await db.run_sync(httpcache.bump, httpcache.REPORTS)
+    with metrics.stage('db_commit'):
+        await db.commit()
+
+    payload_dict = _report_record(report.id, payload, report.created_at)
+    base_name = storage.artifact_base_name(report.id)
+    image_artifact = None
+    if image is not None:
+        ext = storage.image_ext(image.content_type, image.filename)
+        image_artifact = await HASH_POOL.run(storage.put_image_stream, image.file, ext, f"{base_name}.{ext}", reject=False)
+    annotated_image = None if image is not None else payload.annotated_image
+    jobs = [(report.id, payload_dict, base_name, annotated_image, image_artifact)]
+    written = [(report_id, _written(await asyncio.wrap_future(fut))) for report_id, fut in _submit_report_files(jobs)]
+    if written:
+        await db.run_sync(_record_report_files, written)
+    return _report_out(report, payload)
+
+
+BULK_BODY_DOC = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "application/json": {"schema": {"type": "array", "items": schemas.ReportBulkItem.model_json_schema()}},
+            "application/x-ndjson": {"schema": {"type": "string", "description": "One ReportBulkItem JSON object per line"}},
+        },
+    }
+}
+
+
+@app.post("/reports/bulk", response_model=schemas.BulkReportResult, openapi_extra=BULK_BODY_DOC)
+async def create_reports_bulk(request: Request, db: Session = Depends(get_db)):
+    # Offline sync: many reports per request, inserted in batches of BULK_BATCH_SIZE per transaction.
+    # An Idempotency-Key header (or per-item idempotency_key) makes retried syncs return the same ids.
+    items = await bulk.read_items(request)
+    keys = bulk.item_keys(items, request.headers.get('idempotency-key'))
+    return await run_in_threadpool(save_reports_bulk, items, keys, db)
+
+
+def save_reports_bulk(items: List[schemas.ReportBulkItem], keys: List[Optional[str]], db: Session) -> schemas.BulkReportResult:
+    if not REPORT_WRITE_BEHIND:
+        CPU_POOL.ensure_capacity()
+    ids: List[int] = []
+    created = 0
+    for start in range(0, len(items), bulk.BULK_BATCH_SIZE):
+        batch = items[start:start + bulk.BULK_BATCH_SIZE]
+        results, stamps = bulk.insert_batch(db, batch, keys[start:start + bulk.BULK_BATCH_SIZE])
+        fresh = [(item, report_id) for item, (report_id, created) in zip(batch, results) if created]
+        _write_report_files(db, [
+            (report_id, _report_record(report_id, item, stamps.get(report_id)),
+             storage.artifact_base_name(report_id), item.annotated_image, None)
+            for item, report_id in fresh
+        ])
+        ids.extend(report_id for report_id, _ in results)
+        created += len(fresh)
+    return schemas.BulkReportResult(ids=ids, created=created, duplicates=len(ids) - created)
+
+
+def _report_page_query(limit: int, cursor: Optional[str], fields: str, filters: ReportFilters):
+    # fields=summary skips loading recommendations and treatment
+    columns = SUMMARY_COLUMNS + ((models.Report.recommendations,) if fields == 'full' else ())
+    stmt = filters.apply(select(*columns))
+    if cursor:
+        stmt = after_cursor(stmt, cursor)
+    return newest_first(stmt).limit(limit + 1)
+
+
+def _page_rows(rows, limit: int, request: Request, response: Response):
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].created_at, rows[-1].id)
+        response.headers['X-Next-Cursor'] = next_cursor
+        response.headers['Link'] = f'<{request.url.include_query_params(cursor=next_cursor)}>; rel="next"'
+    return rows
+
+
+def _image_url(report_id: int, sha256: Optional[str]) -> Optional[str]:
+    return f"/reports/{report_id}/image?v={sha256[:IMAGE_VERSION_CHARS]}" if sha256 else None
+
+
+def _report_page(rows, lists, images) -> List[schemas.ReportOut]:
+    # ``lists`` maps report id -> (recommendations, treatment); empty for fields=summary.
+    # ``images`` maps report id -> image sha256 (storage.image_shas)
     results: List[schemas.ReportOut] = []
     for r in rows:
+        recs, steps = lists.get(r.id) or ([], [])
         results.append(
             schemas.ReportOut(
                 id=r.id,
@@ -352,247 +561,429 @@ def list_reports(db: Session = Depends(get_db)):
                 disease=r.disease,
                 confidence=r.confidence,
                 severity=r.severity,
-                recommendations=json.loads(r.recommendations or '[]'),
-                treatment=[],
+                recommendations=recs or legacy_recommendations(getattr(r, 'recommendations', None)),
+                treatment=steps,
+                image_url=_image_url(r.id, images.get(r.id)),
             )
         )
     return results
 
 
-@app.get("/reports/{report_id}", response_model=schemas.ReportOut)
-def get_report(report_id: int, db: Session = Depends(get_db)):
-    r = db.query(models.Report).filter(models.Report.id == report_id).first()
+def _collection_conditional(request: Request, response: Response, v):
+    # Versions are read before the page: a write landing in between only costs the client one refetch
+    return httpcache.conditional(request, response, httpcache.collection_etag(v), v[httpcache.REPORTS][1])
+
+
+@sync_db.get("/reports", response_model=List[schemas.ReportOut])
+def list_reports(
+    request: Request,
+    response: Response,
+    limit: int = Query(default=DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    fields: Literal['full', 'summary'] = 'full',
+    filters: ReportFilters = Depends(),
+    db: Session = Depends(get_db),
+):
+    # Newest first, one page at a time; the next page's cursor is returned in X-Next-Cursor.
+    # Pages carry the collection version as ETag, so a poll with nothing new is a 304.
+    cached = _collection_conditional(request, response, httpcache.versions(db))
+    if cached is not None:
+        return cached
+    rows = _page_rows(db.execute(_report_page_query(limit, cursor, fields, filters)).all(), limit, request, response)
+    ids = [r.id for r in rows]
+    lists = TEXTS.lists_for(db, ids) if fields == 'full' else {}
+    return _report_page(rows, lists, storage.image_shas(db, ids))
+
+
+@async_db.get("/reports", response_model=List[schemas.ReportOut])
+async def list_reports_async(
+    request: Request,
+    response: Response,
+    limit: int = Query(default=DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    fields: Literal['full', 'summary'] = 'full',
+    filters: ReportFilters = Depends(),
+    db: AsyncSession = Depends(get_async_db),
+):
+    cached = _collection_conditional(request, response, await db.run_sync(httpcache.versions))
+    if cached is not None:
+        return cached
+    rows = _page_rows((await db.execute(_report_page_query(limit, cursor, fields, filters))).all(), limit, request, response)
+    ids = [r.id for r in rows]
+    lists = await db.run_sync(TEXTS.lists_for, ids) if fields == 'full' else {}
+    return _report_page(rows, lists, await db.run_sync(storage.image_shas, ids))
+
+
+EXPORT_COLUMNS = ['id', 'filename', 'disease', 'confidence', 'severity', 'recommendations', 'treatment', 'created_at']
+EXPORT_BATCH_SIZE = 1000
+
+
+@app.get("/reports/export")
+def export_reports(
+    format: Literal['ndjson', 'csv'] = 'ndjson',
+    gzip: bool = False,
+    filters: ReportFilters = Depends(),
+):
+    # Stream every matching report from a server-side cursor, one batch of rows per chunk.
+    # Uses its own session: the request-scoped one is closed before a streamed body is sent.
+    stmt = newest_first(filters.apply(select(*SUMMARY_COLUMNS, models.Report.recommendations)))
+
+    def encode(rows, lists) -> str:
+        if format == 'csv':
+            buf = io.StringIO()
+            writer = csv.writer(buf)
+            for r in rows:
+                recs, steps = lists.get(r.id) or ([], [])
+                writer.writerow([r.id, r.filename, r.disease, r.confidence, r.severity,
+                                 json.dumps(recs, ensure_ascii=False) if recs else (r.recommendations or '[]'),
+                                 json.dumps(steps, ensure_ascii=False),
+                                 r.created_at.isoformat() if r.created_at else ''])
+            return buf.getvalue()
+        out = []
+        for r in rows:
+            recs, steps = lists.get(r.id) or ([], [])
+            out.append(json.dumps({
+                "id": r.id,
+                "filename": r.filename,
+                "disease": r.disease,
+                "confidence": r.confidence,
+                "severity": r.severity,
+                "recommendations": recs or legacy_recommendations(r.recommendations),
+                "treatment": steps,
+                "created_at": r.created_at.isoformat() if r.created_at else None,
+            }, ensure_ascii=False) + "\n")
+        return ''.join(out)
+
+    def chunks():
+        if format == 'csv':
+            yield ','.join(EXPORT_COLUMNS) + '\r\n'
+        # Texts are looked up on a second session: MySQL can't run another query on a
+        # connection while an unbuffered cursor is streaming
+        with SessionLocal() as db, SessionLocal() as lookup:
+            result = db.execute(stmt.execution_options(yield_per=EXPORT_BATCH_SIZE, stream_results=True))
+            for rows in result.partitions():
+                yield encode(rows, TEXTS.lists_for(lookup, [r.id for r in rows]))
+
+    def gzipped(parts):
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31: gzip container
+        for part in parts:
+            data = compressor.compress(part.encode('utf-8'))
+            if data:
+                yield data
+        yield compressor.flush()
+
+    media_type = 'text/csv; charset=utf-8' if format == 'csv' else 'application/x-ndjson'
+    filename = f"reports.{format}"
+    body = chunks()
+    if gzip:
+        media_type, filename, body = 'application/gzip', filename + '.gz', gzipped(body)
+    return StreamingResponse(body, media_type=media_type, headers={
+        'Content-Disposition': f'attachment; filename="{filename}"'
+    })
+
+
+MAX_BUNDLE_REPORTS = 500
+
+
+@app.get("/reports/stats", response_model=List[schemas.ReportStat])
+def report_stats(
+    day_from: Optional[date] = None,
+    day_to: Optional[date] = None,
+    disease: Optional[str] = None,
+    severity: Optional[str] = None,
+    group: Literal['day', 'total'] = 'day',
+    db: Session = Depends(get_db),
+):
+    # Counts per day x disease x severity (inclusive day range), read from the rollup table;
+    # group=total sums each disease x severity over the range
+    by_day = group == 'day'
+    rows = db.execute(stats.stats_query(day_from, day_to, disease, severity, by_day)).all()
+    return [
+        schemas.ReportStat(
+            day=r.day if by_day else None,
+            disease=r.disease,
+            severity=r.severity,
+            count=r.count,
+            avg_confidence=r.conf_sum / r.count if r.count else 0.0,
+            min_confidence=r.conf_min,
+            max_confidence=r.conf_max,
+        )
+        for r in rows
+    ]
+
+
+@app.get("/catalog/texts", response_model=List[schemas.CatalogTextOut])
+def catalog_texts(
+    q: Optional[str] = None,
+    limit: int = Query(default=100, ge=1, le=1000),
+    db: Session = Depends(get_db),
+):
+    # Ids for the recommendation= and step= filters on /reports and /reports/export
+    stmt = select(models.CatalogText.id, models.CatalogText.text)
+    if q:
+        stmt = stmt.where(models.CatalogText.text.contains(q))
+    rows = db.execute(stmt.order_by(models.CatalogText.id).limit(limit)).all()
+    return [schemas.CatalogTextOut(id=r.id, text=r.text) for r in rows]
+
+
+@app.get("/reports/bundle")
+def download_reports_bundle(request: Request, ids: str = Query(..., description="Comma-separated report ids"), db: Session = Depends(get_db)):
+    # One zip for many reports (e.g. a whole field), each in its own report-{id}/ folder
+    try:
+        report_ids = list(dict.fromkeys(int(x) for x in ids.split(',') if x.strip()))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="ids must be comma-separated integers")
+    if not report_ids or len(report_ids) > MAX_BUNDLE_REPORTS:
+        raise HTTPException(status_code=400, detail=f"Provide between 1 and {MAX_BUNDLE_REPORTS} report ids")
+    entries = []
+    for report_id, files in storage.latest_files(db, report_ids).items():
+        for p, name, checksum in files:
+            if os.path.isfile(p):
+                entries.append(zipstream.Entry(p, f"report-{report_id}/{name}", checksum))
+    if not entries:
+        raise HTTPException(status_code=404, detail="Files for these reports not found")
+    return zipstream.bundle_response(request, entries, "reports.zip")
+
+
+def _found(r: Optional[models.Report]) -> models.Report:
     if not r:
         raise HTTPException(status_code=404, detail="Report not found")
-    return schemas.ReportOut(
-        id=r.id,
-        filename=r.filename,
-        disease=r.disease,
-        confidence=r.confidence,
-        severity=r.severity,
-        recommendations=json.loads(r.recommendations or '[]'),
-        treatment=[],
-    )
+    return r
+
+
+def _etag_conditional(request: Request, response: Response, report_id: int, v):
+    # Reports never change once written, so a current ETag is answered from the counters alone
+    if request.headers.get('if-none-match') is None:
+        return None
+    return httpcache.conditional(request, response, httpcache.report_etag(report_id, v), None)
+
+
+def _report_conditional(request: Request, response: Response, r: models.Report, v):
+    return httpcache.conditional(request, response, httpcache.report_etag(r.id, v),
+                                 httpcache.report_last_modified(r.created_at, v))
+
+
+@sync_db.get("/reports/{report_id}", response_model=schemas.ReportOut)
+def get_report(report_id: int, request: Request, response: Response, db: Session = Depends(get_db)):
+    v = httpcache.versions(db)
+    cached = _etag_conditional(request, response, report_id, v)
+    if cached is not None:
+        return cached
+    r = _found(db.query(models.Report).filter(models.Report.id == report_id).first())
+    cached = _report_conditional(request, response, r, v)
+    if cached is not None:
+        return cached
+    return _report_page([r], TEXTS.lists_for(db, [r.id]), storage.image_shas(db, [r.id]))[0]
+
+
+@async_db.get("/reports/{report_id}", response_model=schemas.ReportOut)
+async def get_report_async(report_id: int, request: Request, response: Response,
+                           db: AsyncSession = Depends(get_async_db)):
+    v = await db.run_sync(httpcache.versions)
+    cached = _etag_conditional(request, response, report_id, v)
+    if cached is not None:
+        return cached
+    r = _found(await db.get(models.Report, report_id))
+    cached = _report_conditional(request, response, r, v)
+    if cached is not None:
+        return cached
+    return _report_page([r], await db.run_sync(TEXTS.lists_for, [r.id]),
+                        await db.run_sync(storage.image_shas, [r.id]))[0]
+
+
+@app.get("/reports/{report_id}/artifacts")
+def report_artifacts(report_id: int, db: Session = Depends(get_db)):
+    # Whether the report's files are on disk yet (write-behind mode) and what was written
+    if db.get(models.Report, report_id) is None:
+        raise HTTPException(status_code=404, detail="Report not found")
+    rows = storage.artifact_rows(db, report_id)
+    status = WRITER.status(report_id) if REPORT_WRITE_BEHIND else None
+    if status is None:
+        status = 'written' if rows or storage.latest_files(db, [report_id])[report_id] else 'missing'
+    return {
+        "report_id": report_id,
+        "status": status,
+        "artifacts": [
+            {"kind": r.kind, "name": r.name, "size": r.size, "sha256": r.sha256,
+             "created_at": str(r.created_at) if r.created_at else None}
+            for r in rows
+        ],
+    }
 
 
 @app.get("/reports/{report_id}/download")
-def download_report_bundle(report_id: int):
-    # Find latest JSON and image files for the report id
-    json_files = sorted(glob(os.path.join(REPORTS_DIR, f"{report_id}-*.json")), reverse=True)
-    img_files = sorted(glob(os.path.join(IMAGES_DIR, f"{report_id}-*")))
-    if not json_files and not img_files:
+def download_report_bundle(report_id: int, request: Request, db: Session = Depends(get_db)):
+    # Latest JSON and image files for the report id, streamed from disk
+    files = storage.latest_files(db, [report_id])[report_id]
+    entries = [zipstream.Entry(p, f"report/{name}", checksum) for p, name, checksum in files if os.path.isfile(p)]
+    if not entries:
         raise HTTPException(status_code=404, detail="Files for this report not found")
-
-    memfile = io.BytesIO()
-    with zipfile.ZipFile(memfile, mode='w', compression=zipfile.ZIP_DEFLATED) as zf:
-        for p in json_files[:1]:
-            zf.write(p, arcname=os.path.join('report', os.path.basename(p)))
-        for p in img_files[:1]:
-            zf.write(p, arcname=os.path.join('report', os.path.basename(p)))
-    memfile.seek(0)
-    return StreamingResponse(memfile, media_type='application/zip', headers={
-        'Content-Disposition': f'attachment; filename="report-{report_id}.zip"'
-    })
-
-
-@app.post("/feedback", response_model=schemas.FeedbackOut)
-def submit_feedback(payload: schemas.FeedbackCreate, db: Session = Depends(get_db)):
+    return zipstream.bundle_response(request, entries, f"report-{report_id}.zip")
+
+
+# Image URLs in report payloads carry ?v=<content prefix>; a matching v never changes content
+IMAGE_VERSION_CHARS = 16
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+
+@app.get("/reports/{report_id}/image")
+def report_image(
+    report_id: int,
+    request: Request,
+    size: Literal['thumb', 'preview', 'full'] = 'full',
+    v: Optional[str] = None,
+    db: Session = Depends(get_db),
+):
+    # The report's stored image, or a downscaled copy rendered once and kept in the thumbnail cache
+    entry = image_entry(storage.latest_files(db, [report_id])[report_id])
+    if entry is None or not os.path.isfile(entry[0]):
+        raise HTTPException(status_code=404, detail="Image for this report not found")
+    path, _, sha256 = entry
+    key = source_key(path, sha256)
+    etag = f'"{key[:32]}-{size}"'
+    # Without a matching version the URL is keyed by report id alone, which SQLite can hand out again
+    versioned = v is not None and len(v) == IMAGE_VERSION_CHARS and key.startswith(v)
+    headers = {"ETag": etag, "Cache-Control": IMMUTABLE_CACHE_CONTROL if versioned else "private, no-cache"}
+    if httpcache.not_modified(request, etag, None):
+        return Response(status_code=304, headers=headers)
+    if size in IMAGE_SIZES:
+        thumb = THUMBS.get(path, key, size, CPU_POOL)
+        if thumb is not None:
+            return FileResponse(thumb, media_type="image/jpeg", headers=headers)
+    # Full size, or no Pillow / not decodable: the original file
+    return FileResponse(path, headers=headers)
+
+
+@app.get("/thumbnails/cache")
+def thumbnail_cache_stats():
+    return THUMBS.stats()
+
+
+def _remove_report_files(paths: List[str]) -> None:
+    THUMBS.forget(storage.remove_released(paths))
+
+
+def _new_feedback(payload: schemas.FeedbackCreate) -> models.Feedback:
     # Enforce Gmail-only email
     email = (payload.email or "").lower()
     if not email.endswith('@gmail.com'):
         raise HTTPException(status_code=400, detail="Email must be a Gmail address (ends with @gmail.com)")
 
-    fb = models.Feedback(
+    return models.Feedback(
         name=payload.name,
         email=email,
         kind=payload.kind,
         rating=payload.rating,
         message=payload.message,
     )
+
+
+def _feedback_out(fb: models.Feedback) -> schemas.FeedbackOut:
+    return schemas.FeedbackOut(id=fb.id, name=fb.name, email=fb.email, message=fb.message, kind=fb.kind, rating=fb.rating)
+
+
+@sync_db.post("/feedback", response_model=schemas.FeedbackOut)
+def submit_feedback(payload: schemas.FeedbackCreate, db: Session = Depends(get_db)):
+    fb = _new_feedback(payload)
     db.add(fb)
-    db.commit()
+    with metrics.stage('db_commit'):
+        db.commit()
     db.refresh(fb)
-    return schemas.FeedbackOut(id=fb.id, name=fb.name, email=fb.email, message=fb.message, kind=fb.kind, rating=fb.rating)
+    return _feedback_out(fb)
+
+
+@async_db.post("/feedback", response_model=schemas.FeedbackOut)
+async def submit_feedback_async(payload: schemas.FeedbackCreate, db: AsyncSession = Depends(get_async_db)):
+    fb = _new_feedback(payload)
+    db.add(fb)
+    with metrics.stage('db_commit'):
+        await db.commit()
+    await db.refresh(fb)
+    return _feedback_out(fb)
 
 
 @app.post("/predict_multi", response_model=List[schemas.Prediction])
 async def predict_multi(file: UploadFile = File(...), n: int = 10, seed: int | None = None):
-    # Generate multiple prediction variants with slight confidence jitter
-    if seed is not None:
-        random.seed(seed)
+    # Generate multiple prediction variants with slight confidence jitter; the generator is
+    # per request so a seed neither leaks into nor races with other requests
+    rng = random.Random(seed)
     filename = (file.filename or "upload").lower()
+    # Same size limit as /predict; the scores don't depend on the image, so it isn't hashed
+    check_upload_size(file)
+    if file.size is None:
+        await HASH_POOL.run(upload_length, file.file)
 
-    # Same rules as /predict
-    DISEASE_RULES = [
-        {"patterns": ["late blight", "phytophthora"], "label": "Late Blight", "base_conf": 0.88, "recs": [
-            "Apply fungicides effective against late blight.",
-            "Remove and destroy infected plant debris.",
-            "Avoid leaf wetness; ensure good field drainage.",
-        ]},
-        {"patterns": ["early blight", "alternaria"], "label": "Early Blight", "base_conf": 0.84, "recs": [
-            "Rotate crops and avoid nightshade volunteers.",
-            "Use protectant fungicides as per label.",
-            "Prune lower leaves to improve airflow.",
-        ]},
-        {"patterns": ["rust", "orange pustule", "pustule", "orange", "brown"], "label": "Rust", "base_conf": 0.8, "recs": [
-            "Apply rust-targeted fungicide.",
-            "Reduce overhead irrigation; minimize leaf wetness.",
-            "Scout nearby fields for spread and volunteer hosts.",
-        ]},
-        {"patterns": ["leaf spot", "spot", "cercospora"], "label": "Leaf Spot", "base_conf": 0.78, "recs": [
-            "Remove severely spotted leaves.",
-            "Use a broad-spectrum fungicide if pressure is high.",
-            "Increase spacing to improve airflow.",
-        ]},
-        {"patterns": ["downy", "downy mildew", "peronospora"], "label": "Downy Mildew", "base_conf": 0.82, "recs": [
-            "Use labeled fungicides effective on downy mildew.",
-            "Reduce leaf wetness; water early in the day.",
-            "Improve airflow and remove infected material.",
-        ]},
-        {"patterns": ["anthracnose"], "label": "Anthracnose", "base_conf": 0.79, "recs": [
-            "Prune and destroy infected tissues.",
-            "Apply recommended fungicides preventively.",
-            "Avoid overhead irrigation.",
-        ]},
-        {"patterns": ["septoria"], "label": "Septoria Leaf Spot", "base_conf": 0.77, "recs": [
-            "Remove infected leaves and debris.",
-            "Rotate crops; avoid volunteer hosts.",
-            "Use protectant fungicides where needed.",
-        ]},
-        {"patterns": ["mildew", "powdery"], "label": "Powdery Mildew", "base_conf": 0.83, "recs": [
-            "Apply sulfur or other labeled fungicides.",
-            "Avoid excessive nitrogen fertilization.",
-            "Ensure sunlight penetration and airflow.",
-        ]},
-        {"patterns": ["mosaic", "virus"], "label": "Viral Mosaic", "base_conf": 0.76, "recs": [
-            "Remove infected plants to reduce spread.",
-            "Control vectors (aphids/whiteflies).",
-            "Use certified disease-free seed/planting material.",
-        ]},
-        {"patterns": ["scab"], "label": "Scab", "base_conf": 0.74, "recs": [
-            "Maintain proper soil moisture and pH.",
-            "Use resistant varieties when available.",
-            "Practice crop rotation.",
-        ]},
-        {"patterns": ["black rot"], "label": "Black Rot", "base_conf": 0.78, "recs": [
-            "Remove mummified fruit and cankered wood.",
-            "Apply fungicides during susceptible periods.",
-            "Promote canopy airflow.",
-        ]},
-        {"patterns": ["bacterial spot", "xanthomonas"], "label": "Bacterial Leaf Spot", "base_conf": 0.75, "recs": [
-            "Use certified disease-free seed/transplants.",
-            "Apply copper-based bactericides per label.",
-            "Avoid handling when foliage is wet.",
-        ]},
-        {"patterns": ["bacterial", "ooze"], "label": "Bacterial Infection", "base_conf": 0.72, "recs": [
-            "Remove infected tissue and sanitize tools.",
-            "Avoid working in fields when foliage is wet.",
-            "Consider copper-based bactericides per label.",
-        ]},
-        {"patterns": ["sunscald", "sun burn", "sunburn", "heat stress"], "label": "Sunscald / Heat Stress", "base_conf": 0.68, "recs": [
-            "Provide shade or reduce heat exposure.",
-            "Avoid midday spraying to prevent burn.",
-            "Ensure adequate irrigation.",
-        ]},
-        {"patterns": ["nitrogen deficiency", "chlorosis", "pale"], "label": "Nitrogen Deficiency", "base_conf": 0.65, "recs": [
-            "Apply balanced nitrogen fertilizer as recommended.",
-            "Mulch and improve soil organic matter.",
-            "Verify with soil test to avoid over-application.",
-        ]},
-        {"patterns": ["sooty mold", "sooty"], "label": "Sooty Mold", "base_conf": 0.66, "recs": [
-            "Control sap-sucking insects (aphids/whiteflies).",
-            "Wash foliage to remove soot where practical.",
-            "Improve airflow and reduce honeydew sources.",
-        ]},
-        {"patterns": ["healthy", "normal"], "label": "Healthy", "base_conf": 0.9, "recs": [
-            "No action required.",
-            "Continue routine scouting and good agronomy.",
-        ]},
-    ]
-
-    # choose rule
-    match = None
-    for rule in DISEASE_RULES:
-        if any(p in filename for p in rule["patterns"]):
-            match = rule
-            break
-    if match is None:
-        disease = "Unknown"
-        base_conf = 0.5
-        recs = [
-            "Unable to confidently classify. Re-take a clear, well-lit image.",
-            "Scout for additional symptoms and consult a local expert if needed.",
-        ]
-    else:
-        disease = match["label"]
-        base_conf = match["base_conf"]
-        recs = match["recs"]
-
-    # helpers for treatment
-    def normalize(name: str) -> str:
-        return (name or '').strip().lower()
-    TREATMENT_DB = {
-        normalize("Unknown"): [
-            "Re-take a clear, well-lit image for better diagnosis.",
-            "Consult local extension for ambiguous symptoms.",
-        ],
-        normalize("Healthy"): ["Maintain good agronomy; continue monitoring."],
-        normalize("Late Blight"): ["Destroy infected debris and volunteer hosts.", "Apply systemic+contact fungicide rotation as labeled.", "Improve drainage; avoid prolonged leaf wetness."],
-        normalize("Early Blight"): ["Remove lower infected leaves to reduce inoculum.", "Use protectant fungicides; rotate modes of action.", "Maintain balanced nutrition; avoid overhead irrigation."],
-        normalize("Rust"): ["Scout and remove heavily infected leaves.", "Apply rust-targeted fungicides per label.", "Reduce leaf wetness; increase airflow."],
-        normalize("Leaf Spot"): ["Prune affected foliage and dispose away from field.", "Use broad-spectrum protectants if pressure is high.", "Improve canopy airflow and sanitation."],
-        normalize("Downy Mildew"): ["Use effective downy mildew fungicides.", "Irrigate early; minimize night-time leaf wetness.", "Remove infected material; enhance airflow."],
-        normalize("Anthracnose"): ["Prune and destroy infected twigs/fruit.", "Preventive fungicide sprays during wet periods.", "Avoid overhead irrigation; sanitize tools."],
-        normalize("Septoria Leaf Spot"): ["Remove infected leaves and debris.", "Rotate crops; use clean seed/transplants.", "Apply protectants; improve airflow."],
-        normalize("Powdery Mildew"): ["Apply sulfur or labeled PM fungicides.", "Avoid excess nitrogen; improve sunlight and airflow.", "Remove severely infected leaves."],
-        normalize("Viral Mosaic"): ["Rogue infected plants to limit spread.", "Control vectors (aphids/whiteflies).", "Use virus-free seed/planting material."],
-        normalize("Scab"): ["Maintain moisture and pH; avoid injuries.", "Use resistant varieties when available.", "Rotate out of susceptible hosts."],
-        normalize("Black Rot"): ["Remove mummified fruit and cankered wood.", "Fungicide program during susceptible stages.", "Open canopy to improve drying."],
-        normalize("Bacterial Leaf Spot"): ["Use certified disease-free seed/transplants.", "Copper-based bactericides; avoid handling wet foliage.", "Sanitize tools and manage splash dispersal."],
-        normalize("Bacterial Infection"): ["Prune infected tissue; sanitize equipment.", "Avoid working when foliage is wet.", "Consider copper products as labeled."],
-        normalize("Sunscald / Heat Stress"): ["Provide shade; stagger irrigation to reduce stress.", "Avoid midday sprays; use mulch to conserve moisture.", "Plan for heat-tolerant varieties."],
-        normalize("Nitrogen Deficiency"): ["Apply recommended nitrogen; avoid over-application.", "Incorporate organic matter; mulch.", "Verify with soil test; re-evaluate in 10–14 days."],
-        normalize("Sooty Mold"): ["Control sap-sucking pests (aphids/whiteflies).", "Wash affected leaves where practical.", "Improve airflow; remove honeydew sources."],
-    }
-    def adjust_by_severity(steps: List[str], sev: str) -> List[str]:
-        sev = (sev or '').lower()
-        if sev == 'high':
-            return ["Urgent: Act within 24–48 hours."] + steps + ["Increase scouting frequency (daily) until stabilized."]
-        if sev == 'moderate':
-            return steps + ["Monitor twice per week and reassess in 7 days."]
-        return steps + ["Monitor weekly; no drastic actions needed."]
+    # Same rules as /predict; the highest-priority rule whose pattern appears in the filename wins
+    rule = ENGINE.first_match(filename)
+    disease = rule.label
+    recs = list(rule.recs)
 
     results: List[schemas.Prediction] = []
     base_adj = ((len(filename) % 7) - 3) * 0.01
-    for _ in range(max(1, min(50, n))):
-        jitter = random.uniform(-0.05, 0.05)
-        conf = max(0.0, min(1.0, base_conf + base_adj + jitter))
-        sev = severity_from_conf(conf, disease)
-        steps = adjust_by_severity(TREATMENT_DB.get(normalize(disease), TREATMENT_DB[normalize("Unknown")]), sev)
+    jitter = scoring.uniform_from(rng, max(1, min(50, n)), -0.05, 0.05)
+    for conf, sev in scoring.variants(rule, base_adj, jitter):
         results.append(
             schemas.Prediction(
                 disease=disease,
                 confidence=conf,
                 severity=sev,
                 recommendations=recs,
-                treatment=steps,
+                treatment=rule.treatment_for(sev),
             )
         )
     return results
 
 
-@app.delete("/reports/{report_id}")
+def _forget_idempotency_keys(report_id: int):
+    # SQLite may hand the id out again; don't let a retried bulk sync resolve to it
+    return delete(models.ReportIdempotency).where(models.ReportIdempotency.report_id == report_id)
+
+
+def _unlink_texts(report_id: int):
+    return delete(models.ReportText).where(models.ReportText.report_id == report_id)
+
+
+@sync_db.delete("/reports/{report_id}")
 def delete_report(report_id: int, db: Session = Depends(get_db)):
     r = db.query(models.Report).filter(models.Report.id == report_id).first()
     if not r:
         raise HTTPException(status_code=404, detail="Report not found")
+    # Shared images are only unlinked once their last reference goes
+    unreferenced = storage.release_files(db, report_id)
+    db.execute(_forget_idempotency_keys(report_id))
+    db.execute(_unlink_texts(report_id))
+    group = (r.created_at, r.disease, r.severity)
     db.delete(r)
-    db.commit()
+    db.flush()
+    stats.refresh_group(db, *group)
+    httpcache.bump(db, httpcache.REPORTS, httpcache.REPORT_CHANGES)
+    with metrics.stage('db_commit'):
+        db.commit()
+    WRITER.forget(report_id)
     # Remove files on disk
-    for pattern in [os.path.join(REPORTS_DIR, f"{report_id}-*.json"), os.path.join(IMAGES_DIR, f"{report_id}-*")]:
-        for p in glob(pattern):
-            try:
-                os.remove(p)
-            except OSError:
-                pass
+    _remove_report_files(unreferenced)
+    return {"ok": True}
+
+
+@async_db.delete("/reports/{report_id}")
+async def delete_report_async(report_id: int, db: AsyncSession = Depends(get_async_db)):
+    r = await db.get(models.Report, report_id)
+    if not r:
+        raise HTTPException(status_code=404, detail="Report not found")
+    unreferenced = await db.run_sync(storage.release_files, report_id)
+    await db.execute(_forget_idempotency_keys(report_id))
+    await db.execute(_unlink_texts(report_id))
+    group = (r.created_at, r.disease, r.severity)
+    await db.delete(r)
+    await db.flush()
+    await db.run_sync(stats.refresh_group, *group)
+    await db.run_sync(httpcache.bump, httpcache.REPORTS, httpcache.REPORT_CHANGES)
+    with metrics.stage('db_commit'):
+        await db.commit()
+    WRITER.forget(report_id)
+    await HASH_POOL.run(_remove_report_files, unreferenced, reject=False)
     return {"ok": True}
+
+
+# Declared last so /reports/{report_id} can't shadow the fixed /reports/... paths above
+app.include_router(async_db if DB_ASYNC else sync_db)
@@ -0,0 +1,297 @@
+"""In-process metrics in the Prometheus text format (GET /metrics).
+
+Histograms have fixed buckets and a lock each; an observation is a bisect and
+three additions, cheap enough to leave on. Request latency is recorded per
+route template by ``MetricsMiddleware``; stage latency (``stage``/``observe``)
+covers the steps inside a request: upload read, hashing, scoring, DB commit,
+file write and zip build. Gauges are read from callbacks at scrape time.
+
+METRICS_ENABLED=0 turns recording off. PROFILER_ENABLED=1 starts a sampling
+profiler thread (PROFILER_HZ samples per second) whose collapsed stacks are
+served at GET /debug/profile, ready for flamegraph.pl or speedscope.
+"""
+import os
+import sys
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter as _Tally
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', '1') == '1'
+PROFILER_ENABLED = os.getenv('PROFILER_ENABLED', '0') == '1'
+PROFILER_HZ = float(os.getenv('PROFILER_HZ', '97'))  # off the round numbers so samples don't alias with timers
+
+# Seconds; from sub-millisecond cache hits up to slow bulk syncs
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def _labels(labels: Labels, extra: str = '') -> str:
+    parts = [f'{k}="{_escape(v)}"' for k, v in labels]
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class Histogram:
+    def __init__(self, name: str, doc: str, buckets: Tuple[float, ...] = BUCKETS):
+        self.name = name
+        self.doc = doc
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._series: Dict[Labels, List[float]] = {}  # bucket counts..., +Inf count, sum
+
+    def observe(self, seconds: float, **labels: str) -> None:
+        if not METRICS_ENABLED:
+            return
+        key = tuple(sorted(labels.items()))
+        i = bisect_left(self.buckets, seconds)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[i] += 1
+            series[-1] += seconds
+
+    def render(self) -> Iterator[str]:
+        yield f'# HELP {self.name} {self.doc}'
+        yield f'# TYPE {self.name} histogram'
+        with self._lock:
+            snapshot = [(k, list(v)) for k, v in self._series.items()]
+        for labels, series in sorted(snapshot):
+            total = 0
+            for bound, count in zip(self.buckets + (float('inf'),), series):
+                total += count
+                le = 'le="+Inf"' if bound == float('inf') else f'le="{bound!r}"'
+                yield f'{self.name}_bucket{_labels(labels, le)} {total}'
+            yield f'{self.name}_sum{_labels(labels)} {series[-1]}'
+            yield f'{self.name}_count{_labels(labels)} {total}'
+
+
+class Counter:
+    def __init__(self, name: str, doc: str):
+        self.name = name
+        self.doc = doc
+        self._lock = threading.Lock()
+        self._values: Dict[Labels, float] = {}
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        if not METRICS_ENABLED:
+            return
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> Iterator[str]:
+        yield f'# HELP {self.name} {self.doc}'
+        yield f'# TYPE {self.name} counter'
+        with self._lock:
+            snapshot = sorted(self._values.items())
+        for labels, value in snapshot:
+            yield f'{self.name}{_labels(labels)} {value}'
+
+
+GaugeSamples = Iterable[Tuple[Dict[str, str], float]]
+
+
+class Gauge:
+    """Values computed at scrape time by ``collect`` as (labels, value) pairs."""
+
+    def __init__(self, name: str, doc: str, collect: Callable[[], GaugeSamples], kind: str = 'gauge'):
+        self.name = name
+        self.doc = doc
+        self.collect = collect
+        self.kind = kind
+
+    def render(self) -> Iterator[str]:
+        yield f'# HELP {self.name} {self.doc}'
+        yield f'# TYPE {self.name} {self.kind}'
+        for labels, value in self.collect():
+            if value is not None:
+                yield f'{self.name}{_labels(tuple(sorted(labels.items())))} {value}'
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def gauge(self, name: str, doc: str, kind: str = 'gauge'):
+        """Decorator registering a scrape-time collector."""
+        def wrap(fn):
+            self.register(Gauge(name, doc, fn, kind))
+            return fn
+        return wrap
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            try:
+                lines.extend(metric.render())
+            except Exception as e:  # one failing collector must not take down the scrape
+                lines.append(f'# {metric.name} unavailable: {e.__class__.__name__}')
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+REQUEST_SECONDS = REGISTRY.register(Histogram(
+    'cropai_http_request_duration_seconds', 'Request latency by route template, method and status.'))
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    'cropai_stage_duration_seconds', 'Latency of the steps inside requests.'))
+DB_QUERY_SECONDS = REGISTRY.register(Histogram(
+    'cropai_db_query_duration_seconds', 'Database statement latency by statement kind.'))
+STORAGE_BYTES = REGISTRY.register(Counter(
+    'cropai_storage_written_bytes_total', 'Bytes of report artifacts recorded, by kind.'))
+STORAGE_FILES = REGISTRY.register(Counter(
+    'cropai_storage_written_files_total', 'Report artifacts recorded, by kind.'))
+
+
+def observe(stage: str, seconds: float) -> None:
+    STAGE_SECONDS.observe(seconds, stage=stage)
+
+
+@contextmanager
+def stage(name: str):
+    t = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - t)
+
+
+def timed_call(fn, *args):
+    """``(fn(*args), seconds)``; module level so worker processes can run it too."""
+    t = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - t
+
+
+def timed_iter(name: str, chunks: Iterator[bytes]) -> Iterator[bytes]:
+    """Pass ``chunks`` through, recording the time spent producing them (not sending them)."""
+    spent = 0.0
+    it = iter(chunks)
+    try:
+        while True:
+            t = time.perf_counter()
+            try:
+                chunk = next(it)
+            except StopIteration:
+                break
+            spent += time.perf_counter() - t
+            yield chunk
+    finally:
+        observe(name, spent)
+
+
+def instrument_engine(engine, name: str) -> None:
+    """Time every statement on ``engine`` (a sync Engine, or an AsyncEngine's sync_engine)."""
+    from sqlalchemy import event
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def _start(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('_metrics_t0', []).append(time.perf_counter())
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def _stop(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info.get('_metrics_t0')
+        if started:
+            kind = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else 'OTHER'
+            DB_QUERY_SECONDS.observe(time.perf_counter() - started.pop(), engine=name, statement=kind)
+
+    @event.listens_for(engine, 'handle_error')
+    def _failed(ctx):
+        started = ctx.connection.info.get('_metrics_t0') if ctx.connection is not None else None
+        if started:
+            started.pop()
+
+
+def pool_samples(engine, name: str) -> GaugeSamples:
+    pool = engine.pool
+    for attr in ('size', 'checkedin', 'checkedout', 'overflow'):
+        fn = getattr(pool, attr, None)
+        if callable(fn):
+            yield {"engine": name, "state": attr}, fn()
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware recording request latency by route template."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or not METRICS_ENABLED:
+            await self.app(scope, receive, send)
+            return
+        t = time.perf_counter()
+        status = [500]
+
+        async def send_wrapper(message):
+            if message['type'] == 'http.response.start':
+                status[0] = message['status']
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            # The router stores the matched route in the scope; label by its template, never the raw path
+            route = scope.get('route')
+            path = getattr(route, 'path', None) or ('/static' if scope['path'].startswith('/static/') else 'unmatched')
+            REQUEST_SECONDS.observe(time.perf_counter() - t, route=path, method=scope['method'], status=str(status[0]))
+
+
+class SamplingProfiler:
+    """Samples every thread's stack PROFILER_HZ times a second into collapsed-stack counts."""
+
+    def __init__(self, hz: float):
+        self.interval = 1.0 / hz
+        self._lock = threading.Lock()
+        self._stacks: _Tally = _Tally()
+        self._thread: Optional[threading.Thread] = None
+        self.samples = 0
+
+    def start(self) -> None:
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='cropai-profiler', daemon=True)
+            self._thread.start()
+
+    def _run(self) -> None:
+        me = threading.get_ident()
+        while True:
+            time.sleep(self.interval)
+            frames = sys._current_frames()
+            stacks = []
+            for ident, frame in frames.items():
+                if ident == me:
+                    continue
+                parts = []
+                while frame is not None:
+                    code = frame.f_code
+                    parts.append(f'{os.path.basename(code.co_filename)}:{code.co_name}')
+                    frame = frame.f_back
+                stacks.append(';'.join(reversed(parts)))
+            with self._lock:
+                self._stacks.update(stacks)
+                self.samples += 1
+
+    def collapsed(self, reset: bool = False) -> str:
+        with self._lock:
+            lines = [f'{stack} {count}' for stack, count in self._stacks.most_common()]
+            if reset:
+                self._stacks.clear()
+        return '\n'.join(lines) + '\n'
+
+
+PROFILER = SamplingProfiler(PROFILER_HZ) if PROFILER_ENABLED else None
+if PROFILER is not None:
+    PROFILER.start()
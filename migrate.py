@@ -0,0 +1,100 @@
+"""One-off data migrations.
+
+    python -m api.migrate
+
+Creates any missing tables, then moves reports written before ``report_texts``
+existed: their JSON ``recommendations`` become references to interned
+``catalog_texts`` rows, and so do the treatment steps saved in each report's
+JSON file. Only a report with no readable JSON file gets the rule catalog's
+steps for its disease and severity. The column is cleared row by row as it
+goes, so the command can be stopped and re-run.
+"""
+import json
+import os
+import sys
+
+from sqlalchemy import insert, select, update
+
+from . import httpcache, models, startup, storage
+from .database import SessionLocal
+from .rules import ENGINE
+from .texts import TEXTS, legacy_recommendations
+
+BATCH_SIZE = 1000
+
+
+def _catalog_treatment(disease: str, severity: str):
+    for rule in ENGINE.rules:
+        if rule.label == disease:
+            return rule.treatment_for(severity)
+    return []
+
+
+def _stored_treatment(path):
+    """Treatment steps saved in a report's JSON file; None without a readable file."""
+    try:
+        with open(path, encoding='utf-8') as f:
+            steps = json.load(f).get('treatment')
+    except (OSError, ValueError, AttributeError):
+        return None
+    return [str(s) for s in steps] if isinstance(steps, list) else None
+
+
+def _json_paths(db, report_ids, legacy):
+    # Newest JSON in the manifest, else the newest one in the flat pre-manifest directory
+    rows = db.execute(
+        select(models.ReportArtifact.report_id, models.ReportArtifact.path)
+        .where(models.ReportArtifact.report_id.in_(report_ids), models.ReportArtifact.kind == 'json')
+        .order_by(models.ReportArtifact.id.desc())
+    ).all()
+    paths = {}
+    for report_id, path in rows:
+        paths.setdefault(report_id, os.path.join(storage.STORAGE_DIR, path))
+    for report_id in report_ids:
+        if report_id not in paths and report_id in legacy:
+            paths[report_id] = legacy[report_id]
+    return paths
+
+
+def _treatment(path, disease: str, severity: str):
+    steps = _stored_treatment(path) if path else None
+    return steps if steps is not None else _catalog_treatment(disease, severity)
+
+
+def backfill_texts(db, batch_size: int = BATCH_SIZE) -> int:
+    """Convert legacy rows in batches; returns how many reports were migrated."""
+    done = 0
+    legacy = storage.legacy_json_files()
+    while True:
+        rows = db.execute(
+            select(models.Report.id, models.Report.disease, models.Report.severity, models.Report.recommendations)
+            .where(models.Report.recommendations.is_not(None))
+            .order_by(models.Report.id)
+            .limit(batch_size)
+        ).all()
+        if not rows:
+            return done
+        paths = _json_paths(db, [r.id for r in rows], legacy)
+        lists = {r.id: (legacy_recommendations(r.recommendations), _treatment(paths.get(r.id), r.disease, r.severity))
+                 for r in rows}
+        ids = TEXTS.ids(t for recs, steps in lists.values() for t in recs + steps)
+        linked = set(db.scalars(
+            select(models.ReportText.report_id).where(models.ReportText.report_id.in_(list(lists))).distinct()
+        ))
+        links = [link for report_id, (recs, steps) in lists.items() if report_id not in linked
+                 for link in TEXTS.link_rows(report_id, recs, steps, ids)]
+        if links:
+            db.execute(insert(models.ReportText), links)
+        db.execute(update(models.Report).where(models.Report.id.in_(list(lists))).values(recommendations=None))
+        # Responses gain treatment steps, so cached copies must revalidate
+        httpcache.bump(db, httpcache.REPORTS, httpcache.REPORT_CHANGES)
+        db.commit()
+        done += len(rows)
+        print(f"migrated {done} reports", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    startup.bootstrap()
+    TEXTS.seed()
+    with SessionLocal() as session:
+        print(f"{backfill_texts(session)} reports moved to report_texts")
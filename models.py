@@ -1,7 +1,12 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, Text
+from sqlalchemy import Column, Integer, String, Float, Date, DateTime, Text, Index
+from sqlalchemy.dialects import sqlite
 from sqlalchemy.sql import func
 from .database import Base
 
+# SQLite's CURRENT_TIMESTAMP has no fractional seconds; bind parameters the same
+# way so keyset cursors compare equal to the stored text.
+Timestamp = DateTime(timezone=True).with_variant(sqlite.DATETIME(truncate_microseconds=True), 'sqlite')
+
 
 class Report(Base):
     __tablename__ = "reports"
@@ -11,8 +16,93 @@ class Report(Base):
     disease = Column(String(255), nullable=False)
     confidence = Column(Float, nullable=False)
     severity = Column(String(50), nullable=False)
-    recommendations = Column(Text, nullable=True)  # JSON string
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    recommendations = Column(Text, nullable=True)  # legacy JSON string; new rows use report_texts
+    created_at = Column(Timestamp, server_default=func.now())
+
+    # Keyset pagination runs newest-first on (created_at, id), optionally within a disease/severity
+    __table_args__ = (
+        Index('idx_reports_created_id', 'created_at', 'id'),
+        Index('idx_reports_disease_created_id', 'disease', 'created_at', 'id'),
+        Index('idx_reports_severity_created_id', 'severity', 'created_at', 'id'),
+    )
+
+
+class CatalogText(Base):
+    """Interned recommendation / treatment step text, shared by every report that uses it."""
+    __tablename__ = "catalog_texts"
+
+    id = Column(Integer, primary_key=True)
+    sha256 = Column(String(64), nullable=False, unique=True)
+    text = Column(Text, nullable=False)
+
+
+class ReportText(Base):
+    """The ``position``-th recommendation (kind 'rec') or treatment step (kind 'step') of a report."""
+    __tablename__ = "report_texts"
+
+    report_id = Column(Integer, primary_key=True)
+    kind = Column(String(8), primary_key=True)
+    position = Column(Integer, primary_key=True)
+    text_id = Column(Integer, nullable=False)
+
+    # "Which reports got step X"
+    __table_args__ = (Index('idx_report_texts_text_report', 'text_id', 'kind', 'report_id'),)
+
+
+class ReportArtifact(Base):
+    """Manifest of files written for a report (path relative to the storage dir)."""
+    __tablename__ = "report_artifacts"
+
+    id = Column(Integer, primary_key=True, index=True)
+    report_id = Column(Integer, nullable=False, index=True)
+    kind = Column(String(20), nullable=False)  # json | image
+    path = Column(String(512), nullable=False)
+    name = Column(String(255), nullable=True)  # file name inside download bundles
+    size = Column(Integer, nullable=False)
+    sha256 = Column(String(64), nullable=False)
+    created_at = Column(Timestamp, server_default=func.now())
+
+
+class ImageBlob(Base):
+    """Content-addressed image file shared by every report that saved the same bytes."""
+    __tablename__ = "image_blobs"
+
+    sha256 = Column(String(64), primary_key=True)
+    ext = Column(String(16), nullable=False)
+    size = Column(Integer, nullable=False)
+    refcount = Column(Integer, nullable=False, default=0)
+    created_at = Column(Timestamp, server_default=func.now())
+
+
+class ReportDailyStat(Base):
+    """Rollup of reports per day x disease x severity, kept current on create/delete."""
+    __tablename__ = "report_daily_stats"
+
+    day = Column(Date, primary_key=True)
+    disease = Column(String(255), primary_key=True)
+    severity = Column(String(50), primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+    conf_sum = Column(Float, nullable=False, default=0.0)
+    conf_min = Column(Float, nullable=True)
+    conf_max = Column(Float, nullable=True)
+
+
+class ReportIdempotency(Base):
+    """Client-supplied key of a bulk-synced report, so a retried sync maps to the same row."""
+    __tablename__ = "report_idempotency"
+
+    key = Column(String(128), primary_key=True)
+    report_id = Column(Integer, nullable=False, index=True)
+    created_at = Column(Timestamp, server_default=func.now())
+
+
+class CacheVersion(Base):
+    """Counters behind the report ETags (see httpcache.py)."""
+    __tablename__ = "cache_versions"
+
+    name = Column(String(32), primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+    updated_at = Column(Float, nullable=False)  # unix time
 
 
 class Feedback(Base):
@@ -0,0 +1,98 @@
+"""Shared filtering and keyset pagination for report listings."""
+import base64
+import json
+from datetime import datetime
+from typing import Optional, Tuple
+
+from fastapi import HTTPException, Query
+from sqlalchemy import and_, or_, select
+
+from . import models
+from .texts import REC, STEP
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+# Columns needed for a listing row; recommendations and treatment are only loaded when asked for
+SUMMARY_COLUMNS = (
+    models.Report.id,
+    models.Report.filename,
+    models.Report.disease,
+    models.Report.confidence,
+    models.Report.severity,
+    models.Report.created_at,
+)
+
+
+class ReportFilters:
+    """Query-string filters shared by the report listing and export endpoints.
+
+    ``created_from`` is inclusive and ``created_to`` exclusive. ``recommendation``
+    and ``step`` are catalog text ids (see GET /catalog/texts).
+    """
+
+    def __init__(
+        self,
+        disease: Optional[str] = Query(default=None),
+        severity: Optional[str] = Query(default=None),
+        created_from: Optional[datetime] = Query(default=None),
+        created_to: Optional[datetime] = Query(default=None),
+        recommendation: Optional[int] = Query(default=None),
+        step: Optional[int] = Query(default=None),
+    ):
+        self.disease = disease
+        self.severity = severity
+        self.created_from = created_from
+        self.created_to = created_to
+        self.recommendation = recommendation
+        self.step = step
+
+    def apply(self, query):
+        if self.disease:
+            query = query.filter(models.Report.disease == self.disease)
+        if self.severity:
+            query = query.filter(models.Report.severity == self.severity)
+        if self.created_from is not None:
+            query = query.filter(models.Report.created_at >= self.created_from)
+        if self.created_to is not None:
+            query = query.filter(models.Report.created_at < self.created_to)
+        for kind, text_id in ((REC, self.recommendation), (STEP, self.step)):
+            if text_id is not None:
+                # Served by idx_report_texts_text_report
+                query = query.filter(models.Report.id.in_(
+                    select(models.ReportText.report_id)
+                    .where(models.ReportText.text_id == text_id, models.ReportText.kind == kind)
+                ))
+        return query
+
+
+def newest_first(query):
+    # SQLite and MySQL both sort NULL created_at last in descending order; after_cursor relies on it
+    return query.order_by(models.Report.created_at.desc(), models.Report.id.desc())
+
+
+def encode_cursor(created_at: datetime, report_id: int) -> str:
+    raw = json.dumps([created_at.isoformat() if created_at else None, report_id]).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor: str) -> Tuple[Optional[datetime], int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        created_at, report_id = json.loads(raw)
+        return (datetime.fromisoformat(created_at) if created_at else None), int(report_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def after_cursor(query, cursor: str):
+    """Rows strictly after ``cursor`` in newest_first order (seeks on the (created_at, id) index)."""
+    created_at, report_id = decode_cursor(cursor)
+    if created_at is None:
+        return query.filter(models.Report.created_at.is_(None), models.Report.id < report_id)
+    return query.filter(or_(
+        models.Report.created_at < created_at,
+        and_(models.Report.created_at == created_at, models.Report.id < report_id),
+        # Undated rows come after every dated one; plain comparisons never match NULL
+        models.Report.created_at.is_(None),
+    ))
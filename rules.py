@@ -0,0 +1,326 @@
+"""Disease rule catalog and the compiled matcher shared by the predict endpoints."""
+import hashlib
+from types import MappingProxyType
+from typing import Dict, FrozenSet, List, Mapping, NamedTuple, Tuple
+
+
+def _normalize(name: str) -> str:
+    return (name or '').strip().lower()
+
+
+def get_disease_rules():
+    """Shared disease catalog: patterns, base_conf, and recommendations."""
+    return [
+        {"patterns": ["late blight", "phytophthora"], "label": "Late Blight", "base_conf": 0.88, "recs": [
+            "Apply fungicides effective against late blight.",
+            "Remove and destroy infected plant debris.",
+            "Avoid leaf wetness; ensure good field drainage.",
+        ]},
+        {"patterns": ["early blight", "alternaria"], "label": "Early Blight", "base_conf": 0.84, "recs": [
+            "Rotate crops and avoid nightshade volunteers.",
+            "Use protectant fungicides as per label.",
+            "Prune lower leaves to improve airflow.",
+        ]},
+        {"patterns": ["rust", "orange pustule", "pustule", "orange", "brown"], "label": "Rust", "base_conf": 0.80, "recs": [
+            "Apply rust-targeted fungicide.",
+            "Reduce overhead irrigation; minimize leaf wetness.",
+            "Scout nearby fields for spread and volunteer hosts.",
+        ]},
+        {"patterns": ["leaf spot", "spot", "cercospora"], "label": "Leaf Spot", "base_conf": 0.78, "recs": [
+            "Remove severely spotted leaves.",
+            "Use a broad-spectrum fungicide if pressure is high.",
+            "Increase spacing to improve airflow.",
+        ]},
+        {"patterns": ["downy", "downy mildew", "peronospora"], "label": "Downy Mildew", "base_conf": 0.82, "recs": [
+            "Use labeled fungicides effective on downy mildew.",
+            "Reduce leaf wetness; water early in the day.",
+            "Improve airflow and remove infected material.",
+        ]},
+        {"patterns": ["anthracnose"], "label": "Anthracnose", "base_conf": 0.79, "recs": [
+            "Prune and destroy infected tissues.",
+            "Apply recommended fungicides preventively.",
+            "Avoid overhead irrigation.",
+        ]},
+        {"patterns": ["septoria"], "label": "Septoria Leaf Spot", "base_conf": 0.77, "recs": [
+            "Remove infected leaves and debris.",
+            "Rotate crops; avoid volunteer hosts.",
+            "Use protectant fungicides where needed.",
+        ]},
+        {"patterns": ["mildew", "powdery"], "label": "Powdery Mildew", "base_conf": 0.83, "recs": [
+            "Apply sulfur or other labeled fungicides.",
+            "Avoid excessive nitrogen fertilization.",
+            "Ensure sunlight penetration and airflow.",
+        ]},
+        {"patterns": ["mosaic", "virus"], "label": "Viral Mosaic", "base_conf": 0.76, "recs": [
+            "Remove infected plants to reduce spread.",
+            "Control vectors (aphids/whiteflies).",
+            "Use certified disease-free seed/planting material.",
+        ]},
+        {"patterns": ["leaf curl", "curl"], "label": "Leaf Curl Virus", "base_conf": 0.75, "recs": [
+            "Rogue infected plants.", "Control whitefly/aphid vectors.", "Use virus-free transplants.",
+        ]},
+        {"patterns": ["fusarium", "wilt"], "label": "Fusarium Wilt", "base_conf": 0.74, "recs": [
+            "Remove infected plants; sanitize soil-contact tools.",
+            "Improve drainage; avoid waterlogging.",
+            "Use resistant cultivars and rotate crops.",
+        ]},
+        {"patterns": ["verticillium"], "label": "Verticillium Wilt", "base_conf": 0.72, "recs": [
+            "Rotate out of susceptible hosts for multiple seasons.",
+            "Improve soil health; solarize where feasible.",
+            "Use resistant rootstocks/cultivars.",
+        ]},
+        {"patterns": ["canker"], "label": "Canker", "base_conf": 0.70, "recs": [
+            "Prune cankered tissue; disinfect tools.",
+            "Apply copper-based protectants after pruning.",
+            "Avoid injuries and water stress.",
+        ]},
+        {"patterns": ["leaf miner", "miner trails", "mining"], "label": "Leaf Miner Damage", "base_conf": 0.68, "recs": [
+            "Remove mined leaves.", "Use labeled insecticides if pressure high.", "Promote natural enemies.",
+        ]},
+        {"patterns": ["aphid", "aphids"], "label": "Aphid Infestation", "base_conf": 0.66, "recs": [
+            "Use insecticidal soap or labeled aphicides.", "Control ants; encourage predators.", "Remove heavily infested shoots.",
+        ]},
+        {"patterns": ["nitrogen deficiency", "chlorosis", "pale"], "label": "Nitrogen Deficiency", "base_conf": 0.65, "recs": [
+            "Apply recommended nitrogen fertilizer.", "Mulch and add organic matter.", "Confirm via soil test.",
+        ]},
+        {"patterns": ["potassium deficiency", "leaf edge burn", "scorch"], "label": "Potassium Deficiency", "base_conf": 0.64, "recs": [
+            "Apply K fertilizer per soil test.", "Avoid drought stress.", "Balance N:K ratio.",
+        ]},
+        {"patterns": ["magnesium deficiency", "interveinal chlorosis"], "label": "Magnesium Deficiency", "base_conf": 0.64, "recs": [
+            "Apply Mg (e.g., Epsom salt) per recommendation.", "Manage soil pH.", "Avoid excess K competing with Mg.",
+        ]},
+        {"patterns": ["iron deficiency", "iron chlorosis"], "label": "Iron Chlorosis", "base_conf": 0.63, "recs": [
+            "Apply chelated iron as foliar or soil drench.", "Adjust pH to optimal range.", "Improve drainage.",
+        ]},
+        {"patterns": ["phosphorus deficiency", "purpling"], "label": "Phosphorus Deficiency", "base_conf": 0.62, "recs": [
+            "Apply P fertilizer per soil test.", "Maintain warm, well-drained soil.", "Avoid over-liming.",
+        ]},
+        {"patterns": ["scab"], "label": "Scab", "base_conf": 0.74, "recs": [
+            "Maintain proper soil moisture and pH.", "Use resistant varieties when available.", "Practice crop rotation.",
+        ]},
+        {"patterns": ["black rot"], "label": "Black Rot", "base_conf": 0.78, "recs": [
+            "Remove mummified fruit and cankered wood.", "Apply fungicides during susceptible periods.", "Promote canopy airflow.",
+        ]},
+        {"patterns": ["bacterial spot", "xanthomonas"], "label": "Bacterial Leaf Spot", "base_conf": 0.75, "recs": [
+            "Use certified disease-free seed/transplants.", "Apply copper-based bactericides per label.", "Avoid handling when foliage is wet.",
+        ]},
+        {"patterns": ["bacterial", "ooze"], "label": "Bacterial Infection", "base_conf": 0.72, "recs": [
+            "Remove infected tissue and sanitize tools.", "Avoid working in fields when foliage is wet.", "Consider copper-based bactericides per label.",
+        ]},
+        {"patterns": ["sunscald", "sun burn", "sunburn", "heat stress"], "label": "Sunscald / Heat Stress", "base_conf": 0.68, "recs": [
+            "Provide shade or reduce heat exposure.", "Avoid midday spraying to prevent burn.", "Ensure adequate irrigation.",
+        ]},
+        {"patterns": ["sooty mold", "sooty"], "label": "Sooty Mold", "base_conf": 0.66, "recs": [
+            "Control sap-sucking insects (aphids/whiteflies).", "Wash foliage to remove soot where practical.", "Improve airflow and reduce honeydew sources.",
+        ]},
+        {"patterns": ["healthy", "normal"], "label": "Healthy", "base_conf": 0.90, "recs": [
+            "No action required.", "Continue routine scouting and good agronomy.",
+        ]},
+    ]
+
+
+def get_treatment_db():
+    """Shared treatment guidance per disease, severity adjustment added later."""
+    return {
+        _normalize("Unknown"): [
+            "Re-take a clear, well-lit image for better diagnosis.",
+            "Consult local extension for ambiguous symptoms.",
+        ],
+        _normalize("Healthy"): ["Maintain good agronomy; continue monitoring."],
+        _normalize("Late Blight"): ["Destroy infected debris and volunteer hosts.", "Apply systemic+contact fungicide rotation as labeled.", "Improve drainage; avoid prolonged leaf wetness."],
+        _normalize("Early Blight"): ["Remove lower infected leaves to reduce inoculum.", "Use protectant fungicides; rotate modes of action.", "Maintain balanced nutrition; avoid overhead irrigation."],
+        _normalize("Rust"): ["Scout and remove heavily infected leaves.", "Apply rust-targeted fungicides per label.", "Reduce leaf wetness; increase airflow."],
+        _normalize("Leaf Spot"): ["Prune affected foliage and dispose away from field.", "Use broad-spectrum protectants if pressure is high.", "Improve canopy airflow and sanitation."],
+        _normalize("Downy Mildew"): ["Use effective downy mildew fungicides.", "Irrigate early; minimize night-time leaf wetness.", "Remove infected material; enhance airflow."],
+        _normalize("Anthracnose"): ["Prune and destroy infected twigs/fruit.", "Preventive fungicide sprays during wet periods.", "Avoid overhead irrigation; sanitize tools."],
+        _normalize("Septoria Leaf Spot"): ["Remove infected leaves and debris.", "Rotate crops; use clean seed/transplants.", "Apply protectants; improve airflow."],
+        _normalize("Powdery Mildew"): ["Apply sulfur or labeled PM fungicides.", "Avoid excess nitrogen; improve sunlight and airflow.", "Remove severely infected leaves."],
+        _normalize("Viral Mosaic"): ["Rogue infected plants to limit spread.", "Control vectors (aphids/whiteflies).", "Use virus-free seed/planting material."],
+        _normalize("Leaf Curl Virus"): ["Rogue infected plants.", "Control whitefly/aphid vectors.", "Use virus-free transplants."],
+        _normalize("Fusarium Wilt"): ["Remove infected plants; sanitize tools.", "Improve drainage; avoid waterlogging.", "Use resistant cultivars and rotate crops."],
+        _normalize("Verticillium Wilt"): ["Rotate out of susceptible hosts.", "Improve soil health; solarize where feasible.", "Use resistant rootstocks/cultivars."],
+        _normalize("Canker"): ["Prune cankered tissue 10–15 cm below symptoms; disinfect tools.", "Copper-based sprays after pruning.", "Avoid injuries and water stress."],
+        _normalize("Leaf Miner Damage"): ["Remove mined leaves.", "Use labeled insecticides if pressure high.", "Promote natural enemies."],
+        _normalize("Aphid Infestation"): ["Use insecticidal soap or aphicides as labeled.", "Control ants; encourage predators.", "Remove heavily infested shoots."],
+        _normalize("Scab"): ["Maintain moisture and pH; avoid injuries.", "Use resistant varieties when available.", "Rotate out of susceptible hosts."],
+        _normalize("Black Rot"): ["Remove mummified fruit and cankered wood.", "Fungicide program during susceptible stages.", "Open canopy to improve drying."],
+        _normalize("Bacterial Leaf Spot"): ["Use certified disease-free seed/transplants.", "Copper-based bactericides; avoid handling wet foliage.", "Sanitize tools and manage splash dispersal."],
+        _normalize("Bacterial Infection"): ["Prune infected tissue; sanitize equipment.", "Avoid working when foliage is wet.", "Consider copper products as labeled."],
+        _normalize("Sunscald / Heat Stress"): ["Provide shade; stagger irrigation to reduce stress.", "Avoid midday sprays; use mulch to conserve moisture.", "Plan for heat-tolerant varieties."],
+        _normalize("Nitrogen Deficiency"): ["Apply recommended nitrogen; avoid over-application.", "Incorporate organic matter; mulch.", "Verify with soil test; re-evaluate in 10–14 days."],
+        _normalize("Potassium Deficiency"): ["Apply K fertilizer per soil test.", "Avoid drought stress.", "Balance N:K ratio."],
+        _normalize("Magnesium Deficiency"): ["Apply Mg (e.g., Epsom salt) per recommendation.", "Manage soil pH.", "Avoid excess K competing with Mg."],
+        _normalize("Iron Chlorosis"): ["Apply chelated iron.", "Adjust pH to optimal range.", "Improve drainage."],
+        _normalize("Phosphorus Deficiency"): ["Apply P fertilizer per soil test.", "Maintain warm, well-drained soil.", "Avoid over-liming."],
+        _normalize("Sooty Mold"): ["Control sap-sucking pests (aphids/whiteflies).", "Wash affected leaves where practical.", "Improve airflow; remove honeydew sources."],
+    }
+
+
+# Lower bounds of the Moderate and High bands
+SEVERITY_BANDS = (0.50, 0.80)
+
+
+def severity_from_conf(conf: float, disease_label: str) -> str:
+    """Map confidence (0..1) to severity bands. Healthy/Unknown always Low.
+    - High: 80–100%
+    - Moderate: 50–79%
+    - Low: 0–49%
+    """
+    if (disease_label or '') in ("Healthy", "Unknown"):
+        return "Low"
+    pct = max(0.0, min(1.0, conf))
+    if pct >= SEVERITY_BANDS[1]:
+        return "High"
+    if pct >= SEVERITY_BANDS[0]:
+        return "Moderate"
+    return "Low"
+
+
+def adjust_by_severity(steps: List[str], sev: str) -> List[str]:
+    sev = (sev or '').lower()
+    if sev == 'high':
+        return ["Urgent: Act within 24–48 hours."] + steps + ["Increase scouting frequency (daily) until stabilized."]
+    if sev == 'moderate':
+        return steps + ["Monitor twice per week and reassess in 7 days."]
+    return steps + ["Monitor weekly; no drastic actions needed."]
+
+
+UNKNOWN_RECS = [
+    "Unable to confidently classify. Re-take a clear, well-lit image.",
+    "Scout for additional symptoms and consult a local expert if needed.",
+]
+
+SEVERITIES = ("Low", "Moderate", "High")
+
+
+def _severity_variants(steps: List[str]) -> Mapping[str, Tuple[str, ...]]:
+    return MappingProxyType({sev: tuple(adjust_by_severity(list(steps), sev)) for sev in SEVERITIES})
+
+
+# Priority of first_match (/predict_multi) when several rules match: the order of the
+# catalog copy /predict_multi used to carry, so existing filenames keep their top
+# result. Rules that copy lacked follow in catalog order.
+FIRST_MATCH_ORDER = (
+    "Late Blight", "Early Blight", "Rust", "Leaf Spot", "Downy Mildew", "Anthracnose",
+    "Septoria Leaf Spot", "Powdery Mildew", "Viral Mosaic", "Scab", "Black Rot",
+    "Bacterial Leaf Spot", "Bacterial Infection", "Sunscald / Heat Stress",
+    "Nitrogen Deficiency", "Sooty Mold", "Healthy",
+)
+
+
+class Rule(NamedTuple):
+    """A catalog entry with recommendations and per-severity treatment already joined."""
+    index: int
+    label: str
+    base_conf: float
+    patterns: Tuple[str, ...]
+    recs: Tuple[str, ...]
+    treatment: Mapping[str, Tuple[str, ...]]
+
+    def treatment_for(self, severity: str) -> List[str]:
+        return list(self.treatment.get(severity) or self.treatment["Low"])
+
+
+class _Automaton:
+    """Aho-Corasick automaton mapping every pattern occurrence to its rule indices.
+
+    Overlapping and nested patterns ("bacterial spot" / "bacterial" / "spot") are
+    all reported, which a single alternation regex cannot do.
+    """
+
+    def __init__(self, patterns: List[Tuple[str, int]]):
+        goto: List[Dict[str, int]] = [{}]
+        out: List[set] = [set()]
+        for pattern, rule_idx in patterns:
+            state = 0
+            for ch in pattern:
+                nxt = goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(goto)
+                    goto[state][ch] = nxt
+                    goto.append({})
+                    out.append(set())
+                state = nxt
+            out[state].add(rule_idx)
+
+        fail = [0] * len(goto)
+        queue = list(goto[0].values())
+        head = 0
+        while head < len(queue):
+            state = queue[head]
+            head += 1
+            for ch, nxt in goto[state].items():
+                queue.append(nxt)
+                f = fail[state]
+                while f and ch not in goto[f]:
+                    f = fail[f]
+                fail[nxt] = goto[f].get(ch, 0) if state else 0
+                out[nxt] |= out[fail[nxt]]
+
+        self._goto = tuple(goto)
+        self._fail = tuple(fail)
+        self._out = tuple(frozenset(o) for o in out)
+
+    def scan(self, text: str) -> FrozenSet[int]:
+        goto, fail, out = self._goto, self._fail, self._out
+        state = 0
+        found: set = set()
+        for ch in text:
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            if out[state]:
+                found |= out[state]
+        return frozenset(found)
+
+
+class RuleEngine:
+    """Immutable compiled form of the disease catalog.
+
+    Built once at import; ``match`` is a single pass over the filename.
+    """
+
+    def __init__(self, rules: List[dict], treatment_db: Dict[str, List[str]], first_order: Tuple[str, ...] = ()):
+        unknown_steps = treatment_db[_normalize("Unknown")]
+        compiled = []
+        for idx, rule in enumerate(rules):
+            steps = treatment_db.get(_normalize(rule["label"]), unknown_steps)
+            compiled.append(Rule(
+                index=idx,
+                label=rule["label"],
+                base_conf=rule["base_conf"],
+                patterns=tuple(rule["patterns"]),
+                recs=tuple(rule["recs"]),
+                treatment=_severity_variants(steps),
+            ))
+        self.rules: Tuple[Rule, ...] = tuple(compiled)
+        self.unknown = Rule(
+            index=-1,
+            label="Unknown",
+            base_conf=0.5,
+            patterns=(),
+            recs=tuple(UNKNOWN_RECS),
+            treatment=_severity_variants(unknown_steps),
+        )
+        self._automaton = _Automaton([(p, r.index) for r in self.rules for p in r.patterns])
+        rank = {label: i for i, label in enumerate(first_order)}
+        self._first_rank = tuple(rank.get(r.label, len(rank) + r.index) for r in self.rules)
+        # Content hash of the catalog; cached predictions are only valid for the same version
+        self.version = hashlib.sha256(
+            repr([(r.label, r.base_conf, r.patterns, r.recs, dict(r.treatment)) for r in self.rules]).encode('utf-8')
+        ).hexdigest()[:16]
+
+    def rule(self, index: int) -> Rule:
+        return self.rules[index] if index >= 0 else self.unknown
+
+    def match(self, filename: str) -> FrozenSet[int]:
+        """Indices of every rule with at least one pattern in ``filename``."""
+        return self._automaton.scan(filename)
+
+    def first_match(self, filename: str) -> Rule:
+        """Highest-priority rule matching ``filename`` (``first_order``, then catalog order), or the Unknown rule."""
+        hits = self.match(filename)
+        return self.rules[min(hits, key=self._first_rank.__getitem__)] if hits else self.unknown
+
+
+ENGINE = RuleEngine(get_disease_rules(), get_treatment_db(), FIRST_MATCH_ORDER)
@@ -14,9 +14,86 @@ CREATE TABLE IF NOT EXISTS reports (
   disease VARCHAR(255) NOT NULL,
   confidence DOUBLE NOT NULL,
   severity VARCHAR(50) NOT NULL,
-  recommendations TEXT NULL,
+  recommendations TEXT NULL, -- legacy JSON list; new rows keep recommendations in report_texts
   created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-  INDEX idx_reports_created_at (created_at)
+  INDEX idx_reports_created_id (created_at, id),
+  INDEX idx_reports_disease_created_id (disease, created_at, id),
+  INDEX idx_reports_severity_created_id (severity, created_at, id)
+);
+
+-- Existing installs: add the listing indexes (safe to skip any that already exist)
+-- ALTER TABLE reports DROP INDEX idx_reports_created_at;
+-- CREATE INDEX idx_reports_created_id ON reports (created_at, id);
+-- CREATE INDEX idx_reports_disease_created_id ON reports (disease, created_at, id);
+-- CREATE INDEX idx_reports_severity_created_id ON reports (severity, created_at, id);
+
+-- Recommendation and treatment texts, stored once and referenced by id
+CREATE TABLE IF NOT EXISTS catalog_texts (
+  id INT AUTO_INCREMENT PRIMARY KEY,
+  sha256 CHAR(64) NOT NULL,
+  text TEXT NOT NULL,
+  UNIQUE KEY uq_catalog_texts_sha256 (sha256)
+);
+
+-- Ordered recommendations (kind 'rec') and treatment steps (kind 'step') per report
+CREATE TABLE IF NOT EXISTS report_texts (
+  report_id INT NOT NULL,
+  kind VARCHAR(8) NOT NULL,
+  position INT NOT NULL,
+  text_id INT NOT NULL,
+  PRIMARY KEY (report_id, kind, position),
+  INDEX idx_report_texts_text_report (text_id, kind, report_id)
+);
+-- Existing installs: after creating the two tables above, move old rows over with
+--   python -m api.migrate
+
+-- Files written for each report (paths relative to the storage directory)
+CREATE TABLE IF NOT EXISTS report_artifacts (
+  id INT AUTO_INCREMENT PRIMARY KEY,
+  report_id INT NOT NULL,
+  kind VARCHAR(20) NOT NULL,
+  path VARCHAR(512) NOT NULL,
+  name VARCHAR(255) NULL,
+  size INT NOT NULL,
+  sha256 CHAR(64) NOT NULL,
+  created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+  INDEX ix_report_artifacts_report_id (report_id)
+);
+
+-- Deduplicated annotated images, keyed by content hash
+CREATE TABLE IF NOT EXISTS image_blobs (
+  sha256 CHAR(64) PRIMARY KEY,
+  ext VARCHAR(16) NOT NULL,
+  size INT NOT NULL,
+  refcount INT NOT NULL DEFAULT 0,
+  created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Reports per day x disease x severity for GET /reports/stats (rebuild: python -m api.stats rebuild)
+CREATE TABLE IF NOT EXISTS report_daily_stats (
+  day DATE NOT NULL,
+  disease VARCHAR(255) NOT NULL,
+  severity VARCHAR(50) NOT NULL,
+  count INT NOT NULL DEFAULT 0,
+  conf_sum DOUBLE NOT NULL DEFAULT 0,
+  conf_min DOUBLE NULL,
+  conf_max DOUBLE NULL,
+  PRIMARY KEY (day, disease, severity)
+);
+
+-- Idempotency keys of reports created through POST /reports/bulk
+CREATE TABLE IF NOT EXISTS report_idempotency (
+  `key` VARCHAR(128) PRIMARY KEY,
+  report_id INT NOT NULL,
+  created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+  INDEX ix_report_idempotency_report_id (report_id)
+);
+
+-- Counters behind the GET /reports and GET /reports/{id} ETags
+CREATE TABLE IF NOT EXISTS cache_versions (
+  name VARCHAR(32) PRIMARY KEY,
+  version INT NOT NULL DEFAULT 0,
+  updated_at DOUBLE NOT NULL
 );
 
 -- Feedback table (matches SQLAlchemy model in api/models.py)
@@ -1,4 +1,5 @@
 from pydantic import BaseModel, Field, ConfigDict
+from datetime import date
 from typing import List, Optional, Literal
 from pydantic import EmailStr
 
@@ -25,13 +26,41 @@ class ReportCreate(ReportBase):
     annotated_image: Optional[str] = None
 
 
+class ReportBulkItem(ReportCreate):
+    # Same key on a retried sync returns the original report instead of a duplicate
+    idempotency_key: Optional[str] = Field(default=None, min_length=1, max_length=128)
+
+
+class BulkReportResult(BaseModel):
+    ids: List[int]  # one per submitted item, in order
+    created: int
+    duplicates: int
+
+
 class ReportOut(ReportBase):
     id: int
+    # Content-versioned image URL (add &size=thumb|preview); None until the image is recorded
+    image_url: Optional[str] = None
 
     # Pydantic v2 configuration
     model_config = ConfigDict(from_attributes=True)
 
 
+class ReportStat(BaseModel):
+    day: Optional[date] = None  # None when grouped over the whole range
+    disease: str
+    severity: str
+    count: int
+    avg_confidence: float
+    min_confidence: Optional[float] = None
+    max_confidence: Optional[float] = None
+
+
+class CatalogTextOut(BaseModel):
+    id: int
+    text: str
+
+
 class FeedbackCreate(BaseModel):
     name: str
     email: EmailStr
@@ -0,0 +1,66 @@
+"""Vectorized scoring over the compiled rule catalog.
+
+Jitter is drawn with NumPy's MT19937 from the same state Python's ``random``
+would use, so every result is bit-for-bit identical to the per-rule loop.
+"""
+from typing import List, Tuple
+
+import numpy as np
+
+from .rules import ENGINE, SEVERITIES, SEVERITY_BANDS, Rule
+
+_BASE_CONF = np.array([r.base_conf for r in ENGINE.rules], dtype=np.float64)
+_BAND_EDGES = np.array(SEVERITY_BANDS, dtype=np.float64)
+_ALWAYS_LOW = ("Healthy", "Unknown")
+
+
+def _seed_words(seed: int) -> List[int]:
+    # random.seed(int) feeds abs(seed) to init_by_array as little-endian 32-bit words
+    seed = abs(seed)
+    n = max(1, (seed.bit_length() + 31) // 32)
+    return [(seed >> (32 * i)) & 0xFFFFFFFF for i in range(n)]
+
+
+def seeded_uniform(seed: int, size: int, low: float, high: float) -> np.ndarray:
+    """Same values as ``[random.Random(seed).uniform(low, high) for _ in range(size)]``."""
+    u = np.random.RandomState(_seed_words(seed)).random_sample(size)
+    return low + (high - low) * u
+
+
+def uniform_from(rng, size: int, low: float, high: float) -> np.ndarray:
+    """Draw ``size`` uniforms from ``rng`` (a Random instance or the random module)
+    and advance its state exactly as ``size`` calls to ``rng.uniform`` would."""
+    version, internal, gauss = rng.getstate()
+    bitgen = np.random.MT19937()
+    bitgen.state = {
+        "bit_generator": "MT19937",
+        "state": {"key": np.array(internal[:-1], dtype=np.uint32), "pos": internal[-1]},
+    }
+    u = np.random.Generator(bitgen).random(size)
+    state = bitgen.state["state"]
+    rng.setstate((version, tuple(state["key"].tolist()) + (int(state["pos"]),), gauss))
+    return low + (high - low) * u
+
+
+def best_rule(seed: int, matched) -> Tuple[float, Rule]:
+    """Score every rule as base_conf + jitter + filename boost, clamp and take the argmax."""
+    boost = np.zeros_like(_BASE_CONF)
+    if matched:
+        boost[list(matched)] = 0.1
+    scores = np.clip(_BASE_CONF + seeded_uniform(seed, len(_BASE_CONF), -0.1, 0.1) + boost, 0.0, 1.0)
+    idx = int(np.argmax(scores))
+    return float(scores[idx]), ENGINE.rules[idx]
+
+
+def severity_bands(conf: np.ndarray, disease_label: str) -> np.ndarray:
+    """Vectorized severity_from_conf: indices into SEVERITIES."""
+    if (disease_label or '') in _ALWAYS_LOW:
+        return np.zeros(conf.shape, dtype=np.intp)
+    return np.searchsorted(_BAND_EDGES, np.clip(conf, 0.0, 1.0), side='right')
+
+
+def variants(rule: Rule, base_adj: float, jitter: np.ndarray) -> List[Tuple[float, str]]:
+    """(confidence, severity) for each jitter draw, computed in one pass."""
+    conf = np.clip((rule.base_conf + base_adj) + jitter, 0.0, 1.0)
+    bands = severity_bands(conf, rule.label)
+    return [(c, SEVERITIES[b]) for c, b in zip(conf.tolist(), bands.tolist())]
@@ -0,0 +1,40 @@
+"""Run the API with one worker process per core.
+
+    python -m api.serve [--workers N] [--host 127.0.0.1] [--port 8000]
+
+The schema bootstrap runs once here, before the workers start, so each worker's
+startup only checks the schema fingerprint. Every worker sizes its thread pool
+to its share of the cores (WORKER_THREADS, unless set) so N workers don't
+oversubscribe the machine between them.
+
+Workers share the database and the storage directory; what each keeps in
+memory (prediction cache, text ids, thumbnail LRU bookkeeping, metrics) is per
+process. See the README for what that means for /metrics.
+"""
+import argparse
+import os
+
+
+def main():
+    cores = os.cpu_count() or 1
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int, default=int(os.getenv('WEB_CONCURRENCY', str(cores))))
+    parser.add_argument('--host', default=os.getenv('HOST', '127.0.0.1'))
+    parser.add_argument('--port', type=int, default=int(os.getenv('PORT', '8000')))
+    args = parser.parse_args()
+
+    # Workers are spawned with this environment; explicit settings win
+    os.environ.setdefault('WORKER_THREADS', str(max(2, cores // args.workers) + 2))
+
+    import uvicorn
+
+    from . import startup
+    from .database import engine
+
+    startup.bootstrap()
+    engine.dispose()
+    uvicorn.run(f"{__package__}.main:app", host=args.host, port=args.port, workers=args.workers)
+
+
+if __name__ == '__main__':
+    main()
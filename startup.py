@@ -0,0 +1,113 @@
+"""Worker startup, run from the app's lifespan instead of at import.
+
+The schema bootstrap (database, tables, newer indexes, the cache counters and
+the stats rollup) runs once per schema change: a fingerprint of the models is
+stored in ``cache_versions``, and a worker that finds it current goes straight
+to the per-process warm-up. A worker that finds it stale takes the migration
+lock (a file lock next to the SQLite database, GET_LOCK on MySQL) and checks
+again, so workers starting together bootstrap once between them.
+"""
+import os
+import time
+import zlib
+from contextlib import contextmanager
+
+from sqlalchemy import select, text
+from sqlalchemy.exc import DBAPIError
+
+from . import database, httpcache, models, stats
+from .database import Base, SessionLocal, engine
+from .storage import IMAGES_DIR, REPORTS_DIR
+from .texts import TEXTS
+
+try:
+    import fcntl
+except ImportError:  # Windows: workers there are started one at a time anyway
+    fcntl = None
+
+SCHEMA = 'schema'
+MIGRATION_LOCK = 'cropai_migrate'
+MIGRATION_LOCK_TIMEOUT = int(os.getenv('MIGRATION_LOCK_TIMEOUT', '60'))
+
+
+def schema_version() -> int:
+    """Fingerprint of the tables, columns and indexes the models declare."""
+    parts = []
+    for table in Base.metadata.sorted_tables:
+        parts.append(table.name)
+        parts.extend(f"{c.name}:{c.type}:{c.nullable}" for c in table.columns)
+        parts.extend(sorted(str(i.name) for i in table.indexes))
+    return zlib.crc32('|'.join(parts).encode('utf-8')) & 0x7FFFFFFF
+
+
+def schema_current() -> bool:
+    try:
+        with SessionLocal() as db:
+            stored = db.scalar(select(models.CacheVersion.version).where(models.CacheVersion.name == SCHEMA))
+    except DBAPIError:
+        # No database or no cache_versions table yet
+        return False
+    return stored == schema_version()
+
+
+@contextmanager
+def migration_lock():
+    if database.DB_ENGINE == 'mysql':
+        with engine.connect() as conn:
+            if not conn.scalar(text("SELECT GET_LOCK(:name, :timeout)"),
+                               {"name": MIGRATION_LOCK, "timeout": MIGRATION_LOCK_TIMEOUT}):
+                raise RuntimeError(f"Timed out after {MIGRATION_LOCK_TIMEOUT}s waiting for the migration lock")
+            try:
+                yield
+            finally:
+                conn.execute(text("SELECT RELEASE_LOCK(:name)"), {"name": MIGRATION_LOCK})
+        return
+    if fcntl is None or database.DB_PATH == ':memory:':
+        yield
+        return
+    with open(f"{database.DB_PATH}.migrate.lock", 'a') as f:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def _mark_current(db) -> None:
+    row = db.get(models.CacheVersion, SCHEMA)
+    if row is None:
+        row = models.CacheVersion(name=SCHEMA)
+        db.add(row)
+    row.version = schema_version()
+    row.updated_at = time.time()
+    db.commit()
+
+
+def bootstrap() -> bool:
+    """Bring the schema up to date unless it already is; True if this call did the work."""
+    if schema_current():
+        return False
+    database.create_database()
+    with migration_lock():
+        if schema_current():
+            return False
+        Base.metadata.create_all(bind=engine)
+        # create_all skips tables that already exist, so add newer indexes explicitly
+        for index in models.Report.__table__.indexes:
+            index.create(bind=engine, checkfirst=True)
+        with SessionLocal() as db:
+            httpcache.seed(db)
+            # Seed the stats rollup the first time it appears next to existing reports
+            if db.scalar(select(models.ReportDailyStat.day).limit(1)) is None and db.scalar(select(models.Report.id).limit(1)):
+                stats.rebuild(db)
+            _mark_current(db)
+    return True
+
+
+def startup() -> None:
+    """Everything a worker needs before serving, minus the write-behind thread."""
+    bootstrap()
+    os.makedirs(REPORTS_DIR, exist_ok=True)
+    os.makedirs(IMAGES_DIR, exist_ok=True)
+    # Intern the catalog's recommendation and treatment texts once per process
+    TEXTS.seed()
@@ -0,0 +1,159 @@
+"""Per-day disease/severity rollups behind GET /reports/stats.
+
+Creating a report adds it to its (day, disease, severity) row with one upsert in
+the same transaction as the insert. Deleting recomputes that one row from the
+reports table, since a minimum or maximum can't be un-applied. ``rebuild``
+recomputes everything and is the fix for any drift:
+
+    python -m api.stats rebuild
+"""
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from typing import Iterable, Optional, Tuple
+
+from sqlalchemy import Date, case, delete, func, insert, literal, or_, select, update
+from sqlalchemy.orm import Session
+
+from . import models
+
+Stat = models.ReportDailyStat
+
+
+def _day(created_at) -> date:
+    if isinstance(created_at, datetime):
+        return created_at.date()
+    if isinstance(created_at, date):
+        return created_at
+    if created_at:
+        return datetime.fromisoformat(str(created_at)).date()
+    # Legacy rows without created_at count towards today, here and in rebuild
+    return datetime.utcnow().date()
+
+
+def _upsert(db: Session, key: Tuple[date, str, str], count: int, conf_sum: float, conf_min: float, conf_max: float) -> None:
+    day, disease, severity = key
+    values = dict(day=day, disease=disease, severity=severity, count=count,
+                  conf_sum=conf_sum, conf_min=conf_min, conf_max=conf_max)
+    dialect = db.get_bind().dialect.name
+    if dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+        stmt = sqlite_insert(Stat).values(**values)
+        stmt = stmt.on_conflict_do_update(index_elements=[Stat.day, Stat.disease, Stat.severity], set_={
+            "count": Stat.count + stmt.excluded.count,
+            "conf_sum": Stat.conf_sum + stmt.excluded.conf_sum,
+            # two-argument min()/max() are scalar functions in SQLite
+            "conf_min": func.min(func.coalesce(Stat.conf_min, stmt.excluded.conf_min), stmt.excluded.conf_min),
+            "conf_max": func.max(func.coalesce(Stat.conf_max, stmt.excluded.conf_max), stmt.excluded.conf_max),
+        })
+        db.execute(stmt)
+    elif dialect == 'mysql':
+        from sqlalchemy.dialects.mysql import insert as mysql_insert
+        stmt = mysql_insert(Stat).values(**values)
+        stmt = stmt.on_duplicate_key_update(
+            count=Stat.count + stmt.inserted.count,
+            conf_sum=Stat.conf_sum + stmt.inserted.conf_sum,
+            conf_min=func.least(func.coalesce(Stat.conf_min, stmt.inserted.conf_min), stmt.inserted.conf_min),
+            conf_max=func.greatest(func.coalesce(Stat.conf_max, stmt.inserted.conf_max), stmt.inserted.conf_max),
+        )
+        db.execute(stmt)
+    else:
+        updated = db.execute(
+            update(Stat)
+            .where(Stat.day == day, Stat.disease == disease, Stat.severity == severity)
+            .values(
+                count=Stat.count + count,
+                conf_sum=Stat.conf_sum + conf_sum,
+                conf_min=case((Stat.conf_min.is_(None) | (Stat.conf_min > conf_min), conf_min), else_=Stat.conf_min),
+                conf_max=case((Stat.conf_max.is_(None) | (Stat.conf_max < conf_max), conf_max), else_=Stat.conf_max),
+            )
+        ).rowcount
+        if not updated:
+            db.execute(insert(Stat).values(**values))
+
+
+def add_reports(db: Session, reports: Iterable[Tuple[object, str, str, float]]) -> None:
+    """Fold (created_at, disease, severity, confidence) of newly inserted reports into the rollup.
+
+    Runs in the caller's transaction; the caller commits.
+    """
+    groups = defaultdict(lambda: [0, 0.0, None, None])
+    for created_at, disease, severity, confidence in reports:
+        g = groups[(_day(created_at), disease, severity)]
+        g[0] += 1
+        g[1] += confidence
+        g[2] = confidence if g[2] is None else min(g[2], confidence)
+        g[3] = confidence if g[3] is None else max(g[3], confidence)
+    for key in sorted(groups):
+        _upsert(db, key, *groups[key])
+
+
+def refresh_group(db: Session, created_at, disease: str, severity: str) -> None:
+    """Recompute one rollup row from the reports table (after a delete)."""
+    day = _day(created_at)
+    start = datetime.combine(day, datetime.min.time())
+    in_day = (models.Report.created_at >= start) & (models.Report.created_at < start + timedelta(days=1))
+    if day == _day(None):
+        in_day = or_(in_day, models.Report.created_at.is_(None))
+    count, conf_sum, conf_min, conf_max = db.execute(
+        select(func.count(), func.sum(models.Report.confidence),
+               func.min(models.Report.confidence), func.max(models.Report.confidence))
+        .where(models.Report.disease == disease, models.Report.severity == severity, in_day)
+    ).one()
+    key = (Stat.day == day, Stat.disease == disease, Stat.severity == severity)
+    if not count:
+        db.execute(delete(Stat).where(*key))
+        return
+    updated = db.execute(
+        update(Stat).where(*key).values(count=count, conf_sum=conf_sum, conf_min=conf_min, conf_max=conf_max)
+    ).rowcount
+    if not updated:
+        db.execute(insert(Stat).values(day=day, disease=disease, severity=severity, count=count,
+                                       conf_sum=conf_sum, conf_min=conf_min, conf_max=conf_max))
+
+
+def stats_query(day_from: Optional[date], day_to: Optional[date], disease: Optional[str],
+                severity: Optional[str], by_day: bool):
+    """Rollup rows in [day_from, day_to], per day or summed over the range."""
+    columns = [Stat.disease, Stat.severity]
+    if by_day:
+        columns.insert(0, Stat.day)
+    stmt = select(*columns, func.sum(Stat.count).label('count'), func.sum(Stat.conf_sum).label('conf_sum'),
+                  func.min(Stat.conf_min).label('conf_min'), func.max(Stat.conf_max).label('conf_max'))
+    if day_from is not None:
+        stmt = stmt.where(Stat.day >= day_from)
+    if day_to is not None:
+        stmt = stmt.where(Stat.day <= day_to)
+    if disease:
+        stmt = stmt.where(Stat.disease == disease)
+    if severity:
+        stmt = stmt.where(Stat.severity == severity)
+    return stmt.group_by(*columns).order_by(*columns)
+
+
+def rebuild(db: Session) -> int:
+    """Recompute the whole rollup from models.Report; returns the number of rollup rows."""
+    # Same day as _day(): a NULL day can't go into the rollup's primary key
+    day = func.coalesce(func.date(models.Report.created_at), literal(_day(None), Date))
+    db.execute(delete(Stat))
+    db.execute(insert(Stat).from_select(
+        ['day', 'disease', 'severity', 'count', 'conf_sum', 'conf_min', 'conf_max'],
+        select(day, models.Report.disease, models.Report.severity, func.count(),
+               func.sum(models.Report.confidence), func.min(models.Report.confidence),
+               func.max(models.Report.confidence))
+        .group_by(day, models.Report.disease, models.Report.severity),
+    ))
+    db.commit()
+    return db.scalar(select(func.count()).select_from(Stat))
+
+
+if __name__ == '__main__':
+    # python -m api.stats rebuild
+    import sys
+    from .database import Base, SessionLocal, engine
+
+    if sys.argv[1:] == ['rebuild']:
+        Base.metadata.create_all(bind=engine, tables=[Stat.__table__])
+        with SessionLocal() as session:
+            print(f"{rebuild(session)} rollup rows")
+        sys.exit(0)
+    print('usage: python -m api.stats rebuild')
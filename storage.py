@@ -0,0 +1,472 @@
+"""Report artifacts on disk: the JSON report and the optional annotated image.
+
+Files live in hashed two-level subdirectories (``reports/ab/cd/{id}-{ts}-{rand}.json``)
+so no single directory grows without bound, and every file written is recorded
+in the ``report_artifacts`` table so lookups never list a directory.
+
+Annotated images are content-addressed (``blobs/ab/cd/{sha256}.{ext}``): each
+distinct image is stored once and reference-counted in ``image_blobs``. Several
+worker processes share the store, so a blob is only created or unlinked under
+its stripe lock (``blob_lock``). A writer also takes a claim on the blob, a hard
+link that keeps the content alive until its reference is committed: a release
+committed in between may unlink the blob, and ``settle_claims`` puts it back.
+
+Writer functions are plain module-level callables so they can run on either
+worker pool, including a process pool.
+"""
+import base64
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from glob import glob
+from typing import BinaryIO, Dict, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from . import metrics, models
+from .database import SessionLocal
+
+try:
+    import fcntl
+except ImportError:  # Windows: stripes are only locked within the process
+    fcntl = None
+
+STORAGE_DIR = os.getenv('STORAGE_DIR') or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'storage')
+REPORTS_DIR = os.path.join(STORAGE_DIR, 'reports')
+IMAGES_DIR = os.path.join(STORAGE_DIR, 'images')
+BLOBS_DIR = os.path.join(STORAGE_DIR, 'blobs')
+LOCKS_DIR = os.path.join(BLOBS_DIR, '.locks')
+# Claims left behind by a crashed worker are swept after this many seconds
+CLAIM_MAX_AGE = int(os.getenv('CLAIM_MAX_AGE', '3600'))
+_STRIPES = [threading.Lock() for _ in range(256)]
+
+
+def shard_dir(base_dir: str, report_id: int) -> str:
+    """``base_dir/ab/cd`` from a hash of the report id; all files of one report share it."""
+    digest = hashlib.sha256(str(report_id).encode('ascii')).hexdigest()
+    return os.path.join(base_dir, digest[:2], digest[2:4])
+
+
+def _write_file(path: str, data: bytes, kind: str) -> dict:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
+    return {
+        "kind": kind,
+        "path": os.path.relpath(path, STORAGE_DIR),
+        "name": os.path.basename(path),
+        "size": len(data),
+        "sha256": hashlib.sha256(data).hexdigest(),
+    }
+
+
+def blob_path(sha256: str, ext: str) -> str:
+    return os.path.join(BLOBS_DIR, sha256[:2], sha256[2:4], f"{sha256}.{ext}")
+
+
+def _stored_blob_path(sha256: str, ext: str) -> str:
+    # Caller holds the blob's lock. The blob is keyed by hash alone, so the same bytes
+    # uploaded under another extension reuse the file already stored instead of adding a copy
+    path = blob_path(sha256, ext)
+    if os.path.exists(path):
+        return path
+    try:
+        names = os.listdir(os.path.dirname(path))
+    except OSError:
+        return path
+    for name in sorted(names):
+        stem, _, other = name.partition('.')
+        if stem == sha256 and other.isalnum():
+            return os.path.join(os.path.dirname(path), name)
+    return path
+
+
+@contextmanager
+def blob_lock(sha256: str):
+    """Exclusive lock on the blob's stripe (first byte of the hash), across worker processes."""
+    with _STRIPES[int(sha256[:2], 16)]:
+        if fcntl is None:
+            yield
+            return
+        os.makedirs(LOCKS_DIR, exist_ok=True)
+        with open(os.path.join(LOCKS_DIR, sha256[:2]), 'a') as f:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def _claim(path: str) -> Optional[str]:
+    # Caller holds the blob's lock and has checked the blob exists. The link shares the
+    # blob's inode (and mtime), so its age goes in the name for sweep_claims
+    claim = f"{path}.{int(time.time())}.{uuid.uuid4().hex}.claim"
+    try:
+        os.link(path, claim)
+    except OSError:
+        return None  # no hard links on this filesystem
+    return claim
+
+
+def _put_blob(data: bytes, ext: str, name: str) -> dict:
+    """Store ``data`` under its SHA-256 unless an identical blob is already on disk."""
+    sha256 = hashlib.sha256(data).hexdigest()
+    with blob_lock(sha256):
+        path = _stored_blob_path(sha256, ext)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp, 'wb') as f:
+                f.write(data)
+            os.replace(tmp, path)
+        claim = _claim(path)
+    return {
+        "kind": "image",
+        "path": os.path.relpath(path, STORAGE_DIR),
+        "name": name,
+        "size": len(data),
+        "sha256": sha256,
+        "claim": claim,
+    }
+
+
+def decode_data_url(data_url: str) -> Optional[Tuple[str, bytes]]:
+    """(extension, bytes) of a ``data:image/...;base64,`` URL, or None if it can't be decoded."""
+    try:
+        header, b64 = data_url.split(',', 1)
+        ext = 'png'
+        m = re.search(r'data:image/(.*?);base64', header)
+        if m:
+            ext = m.group(1).split('+')[0].split(';')[0] or 'png'
+        return ext, base64.b64decode(b64)
+    except Exception:
+        return None
+
+
+def image_ext(content_type: Optional[str], filename: Optional[str]) -> str:
+    """File extension for an uploaded image, named the same way as for data URLs."""
+    if content_type and content_type.startswith('image/'):
+        return content_type[len('image/'):].split('+')[0].split(';')[0].strip() or 'png'
+    ext = os.path.splitext(filename or '')[1].lstrip('.').lower()
+    return ext if ext.isalnum() else 'png'
+
+
+def artifact_base_name(report_id: int) -> str:
+    # Unique across workers even when SQLite hands a deleted report's id out again
+    return f"{report_id}-{int(time.time())}-{uuid.uuid4().hex[:12]}"
+
+
+def put_image_stream(fileobj: BinaryIO, ext: str, name: str, chunk_size: int = 256 * 1024) -> dict:
+    """Copy an uploaded image into the blob store one chunk at a time, hashing as it goes.
+
+    Runs in a thread (file objects don't cross process boundaries).
+    """
+    os.makedirs(BLOBS_DIR, exist_ok=True)
+    tmp = os.path.join(BLOBS_DIR, f".upload.{os.getpid()}.{threading.get_ident()}.tmp")
+    hasher = hashlib.sha256()
+    size = 0
+    try:
+        with open(tmp, 'wb') as out:
+            for chunk in iter(lambda: fileobj.read(chunk_size), b''):
+                hasher.update(chunk)
+                out.write(chunk)
+                size += len(chunk)
+        sha256 = hasher.hexdigest()
+        with blob_lock(sha256):
+            path = _stored_blob_path(sha256, ext)
+            if os.path.exists(path):
+                os.remove(tmp)
+            else:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(tmp, path)
+            claim = _claim(path)
+    except BaseException:
+        remove_files([tmp])
+        raise
+    return {
+        "kind": "image",
+        "path": os.path.relpath(path, STORAGE_DIR),
+        "name": name,
+        "size": size,
+        "sha256": sha256,
+        "claim": claim,
+    }
+
+
+def write_report_files(record: dict, base_name: str, annotated_image: Optional[str] = None,
+                       image_artifact: Optional[dict] = None) -> List[dict]:
+    """Write ``{base_name}.json`` and, for a data URL, the decoded image.
+
+    ``image_artifact`` is an image already stored via put_image_stream. Returns
+    manifest entries (kind, path relative to STORAGE_DIR, name, size, sha256).
+    """
+    artifacts = []
+    img_path = None
+    if image_artifact is None and annotated_image and isinstance(annotated_image, str) and annotated_image.startswith('data:image/'):
+        decoded = decode_data_url(annotated_image)
+        if decoded is not None:
+            ext, raw = decoded
+            try:
+                image_artifact = _put_blob(raw, ext, f"{base_name}.{ext}")
+            except OSError:
+                image_artifact = None
+    if image_artifact is not None:
+        artifacts.append(image_artifact)
+        img_path = os.path.join(STORAGE_DIR, image_artifact["path"])
+
+    # Save JSON report file (including treatment list)
+    record = dict(record, annotated_image_path=img_path)
+    json_path = os.path.join(shard_dir(REPORTS_DIR, record['id']), f"{base_name}.json")
+    try:
+        data = json.dumps(record, ensure_ascii=False, indent=2).encode('utf-8')
+        artifacts.append(_write_file(json_path, data, 'json'))
+    except OSError:
+        pass
+    return artifacts
+
+
+def record_artifacts(db: Session, report_id: int, artifacts: List[dict]) -> None:
+    for a in artifacts:
+        db.add(models.ReportArtifact(report_id=report_id, **{k: v for k, v in a.items() if k != 'claim'}))
+        if _is_blob(a["path"]):
+            acquire_blob(db, a["sha256"], os.path.splitext(a["path"])[1].lstrip('.'), a["size"])
+
+
+def settle_claims(artifacts: List[dict], committed: bool = True) -> None:
+    """Drop the claims taken by put_* once the references are committed (or abandoned).
+
+    A committed reference whose blob was unlinked by a racing release gets it back.
+    Committed artifacts are counted in the storage metrics here, so rolled-back
+    attempts aren't.
+    """
+    for a in artifacts:
+        if committed:
+            metrics.STORAGE_BYTES.inc(a["size"], kind=a["kind"])
+            metrics.STORAGE_FILES.inc(kind=a["kind"])
+        claim = a.get("claim")
+        if not claim:
+            continue
+        path = os.path.join(STORAGE_DIR, a["path"])
+        with blob_lock(a["sha256"]):
+            try:
+                if committed and not os.path.exists(path):
+                    os.replace(claim, path)
+                else:
+                    os.remove(claim)
+            except OSError:
+                pass
+
+
+def _is_blob(rel_path: str) -> bool:
+    return rel_path.replace(os.sep, '/').startswith('blobs/')
+
+
+def acquire_blob(db: Session, sha256: str, ext: str, size: int) -> None:
+    """Add a reference to a stored blob, creating its row on first use.
+
+    One upsert, so workers taking the first reference at the same time don't
+    collide on the key.
+    """
+    Blob = models.ImageBlob
+    values = dict(sha256=sha256, ext=ext, size=size, refcount=1)
+    dialect = db.get_bind().dialect.name
+    if dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+        stmt = sqlite_insert(Blob).values(**values)
+        db.execute(stmt.on_conflict_do_update(index_elements=[Blob.sha256], set_={"refcount": Blob.refcount + 1}))
+    elif dialect == 'mysql':
+        from sqlalchemy.dialects.mysql import insert as mysql_insert
+        stmt = mysql_insert(Blob).values(**values)
+        db.execute(stmt.on_duplicate_key_update(refcount=Blob.refcount + 1))
+    else:
+        updated = (
+            db.query(Blob)
+            .filter(Blob.sha256 == sha256)
+            .update({Blob.refcount: Blob.refcount + 1}, synchronize_session=False)
+        )
+        if not updated:
+            db.add(Blob(**values))
+            # Flush so a second acquire in the same transaction (batched writes) sees the row
+            db.flush()
+
+
+def _release_blob(db: Session, sha256: str) -> bool:
+    """Drop one reference; True if it was the last and the file can go."""
+    Blob = models.ImageBlob
+    blobs = db.query(Blob).filter(Blob.sha256 == sha256)
+    # Decremented in SQL: a count read into Python and written back loses updates between workers
+    if blobs.filter(Blob.refcount > 1).update({Blob.refcount: Blob.refcount - 1}, synchronize_session=False):
+        return False
+    return bool(blobs.filter(Blob.refcount <= 1).delete(synchronize_session=False))
+
+
+def release_files(db: Session, report_id: int) -> List[str]:
+    """Drop a report's manifest rows and blob references.
+
+    Returns the paths that are now unreferenced; unlink them after committing.
+    """
+    rows = artifact_rows(db, report_id)
+    if not rows:
+        json_files, img_files = _legacy_files(report_id)
+        return json_files + img_files
+    unlink = []
+    for r in rows:
+        if not _is_blob(r.path):
+            unlink.append(os.path.join(STORAGE_DIR, r.path))
+            continue
+        if _release_blob(db, r.sha256):
+            unlink.append(os.path.join(STORAGE_DIR, r.path))
+    db.query(models.ReportArtifact).filter(models.ReportArtifact.report_id == report_id).delete(synchronize_session=False)
+    return unlink
+
+
+def verify_blobs(db: Session) -> List[str]:
+    """SHA-256 of every blob whose file is missing or no longer matches its name."""
+    bad = []
+    for blob in db.query(models.ImageBlob).yield_per(500):
+        path = blob_path(blob.sha256, blob.ext)
+        try:
+            hasher = hashlib.sha256()
+            with open(path, 'rb') as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                    hasher.update(chunk)
+            if hasher.hexdigest() != blob.sha256:
+                bad.append(blob.sha256)
+        except OSError:
+            bad.append(blob.sha256)
+    return bad
+
+
+def artifact_rows(db: Session, report_id: int) -> List[models.ReportArtifact]:
+    return (
+        db.query(models.ReportArtifact)
+        .filter(models.ReportArtifact.report_id == report_id)
+        .order_by(models.ReportArtifact.id.desc())
+        .all()
+    )
+
+
+def image_shas(db: Session, report_ids: List[int]) -> Dict[int, str]:
+    """SHA-256 of each report's newest image in the manifest; reports from before it have none."""
+    rows = (
+        db.query(models.ReportArtifact.report_id, models.ReportArtifact.sha256)
+        .filter(models.ReportArtifact.report_id.in_(report_ids), models.ReportArtifact.kind == 'image')
+        .order_by(models.ReportArtifact.id.desc())
+        .all()
+    )
+    shas: Dict[int, str] = {}
+    for report_id, sha256 in rows:
+        if sha256:
+            shas.setdefault(report_id, sha256)
+    return shas
+
+
+def latest_files(db: Session, report_ids: List[int]) -> Dict[int, List[Tuple[str, str, Optional[str]]]]:
+    """(absolute path, download name, sha256) of the newest JSON report and image of each report."""
+    rows = (
+        db.query(models.ReportArtifact)
+        .filter(models.ReportArtifact.report_id.in_(report_ids))
+        .order_by(models.ReportArtifact.id.desc())
+        .all()
+    )
+    picked: Dict[int, Dict[str, Tuple[str, str, Optional[str]]]] = {}
+    for r in rows:
+        entry = (os.path.join(STORAGE_DIR, r.path), r.name or os.path.basename(r.path), r.sha256)
+        picked.setdefault(r.report_id, {}).setdefault(r.kind, entry)
+    files = {}
+    for report_id in report_ids:
+        if report_id in picked:
+            kinds = picked[report_id]
+            files[report_id] = [kinds[k] for k in ('json', 'image') if k in kinds]
+        else:
+            json_files, img_files = _legacy_files(report_id)
+            files[report_id] = [(p, os.path.basename(p), None) for p in json_files[:1] + img_files[:1]]
+    return files
+
+
+def _legacy_files(report_id: int) -> Tuple[List[str], List[str]]:
+    # Reports written before the manifest sit directly in the flat directories
+    json_files = sorted(glob(os.path.join(REPORTS_DIR, f"{report_id}-*.json")), reverse=True)
+    img_files = sorted(glob(os.path.join(IMAGES_DIR, f"{report_id}-*")), reverse=True)
+    return json_files, [p for p in img_files if os.path.isfile(p)]
+
+
+def legacy_json_files() -> Dict[int, str]:
+    """Newest pre-manifest JSON report of each report id, from one listing of the flat directory."""
+    newest: Dict[int, str] = {}
+    try:
+        entries = os.scandir(REPORTS_DIR)
+    except OSError:
+        return newest
+    with entries:
+        for e in entries:
+            m = re.fullmatch(r'(\d+)-.*\.json', e.name)
+            if m and e.is_file() and e.path > newest.get(int(m.group(1)), ''):
+                newest[int(m.group(1))] = e.path
+    return newest
+
+
+def remove_released(paths: List[str]) -> List[str]:
+    """Unlink files returned by release_files, after the commit; returns the paths removed.
+
+    Blobs are checked again under their lock: another worker may have taken a
+    new reference since the release was committed.
+    """
+    removed = []
+    for p in paths:
+        if _is_blob(os.path.relpath(p, STORAGE_DIR)):
+            sha256 = os.path.basename(p).split('.')[0]
+            with blob_lock(sha256), SessionLocal() as db:
+                if db.get(models.ImageBlob, sha256) is not None:
+                    continue
+                remove_files([p])
+        else:
+            remove_files([p])
+        removed.append(p)
+    return removed
+
+
+def sweep_claims(max_age: int = CLAIM_MAX_AGE) -> int:
+    """Remove claims older than ``max_age`` seconds, left by workers that died mid-write."""
+    cutoff = time.time() - max_age
+    swept = 0
+    for dirpath, _, names in os.walk(BLOBS_DIR):
+        for name in names:
+            if not name.endswith('.claim'):
+                continue
+            try:
+                if int(name.rsplit('.', 3)[1]) < cutoff:
+                    os.remove(os.path.join(dirpath, name))
+                    swept += 1
+            except (OSError, ValueError):
+                pass
+    return swept
+
+
+def remove_files(paths: List[str]) -> None:
+    # Called after the commit that dropped the references
+    for p in paths:
+        try:
+            os.remove(p)
+        except OSError:
+            pass
+
+
+if __name__ == '__main__':
+    # python -m api.storage verify|sweep
+    import sys
+
+    if sys.argv[1:] == ['verify']:
+        with SessionLocal() as session:
+            broken = verify_blobs(session)
+        print('\n'.join(broken) or 'all blobs ok')
+        sys.exit(1 if broken else 0)
+    if sys.argv[1:] == ['sweep']:
+        print(f"{sweep_claims()} stale claims removed")
+        sys.exit(0)
+    print('usage: python -m api.storage verify|sweep')
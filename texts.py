@@ -0,0 +1,150 @@
+"""Interned recommendation and treatment texts.
+
+Reports reference ``catalog_texts`` rows by id through ``report_texts``
+(report_id, kind, position, text_id) instead of carrying a JSON copy of every
+sentence. Ids never change once assigned, so each process keeps an id <-> text
+map and rebuilding a page of reports is one indexed query plus dict lookups.
+"""
+import hashlib
+import json
+import os
+import threading
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import insert, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from . import models
+from .database import SessionLocal
+from .rules import ENGINE, SEVERITIES
+
+REC = 'rec'
+STEP = 'step'
+
+# Texts kept in memory per process; the catalog itself is a few hundred entries
+TEXT_CACHE_SIZE = int(os.getenv('TEXT_CACHE_SIZE', '50000'))
+
+
+def _sha(text: str) -> str:
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def catalog_strings() -> List[str]:
+    """Every recommendation and treatment step the rule catalog can produce."""
+    out = []
+    for rule in ENGINE.rules + (ENGINE.unknown,):
+        out.extend(rule.recs)
+        for sev in SEVERITIES:
+            out.extend(rule.treatment_for(sev))
+    return list(dict.fromkeys(out))
+
+
+class TextCatalog:
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._ids: Dict[str, int] = {}
+        self._texts: Dict[int, str] = {}
+
+    def _remember(self, pairs: Iterable[Tuple[int, str]]) -> None:
+        with self._lock:
+            if len(self._ids) > self.max_size:
+                self._ids.clear()
+                self._texts.clear()
+            for text_id, text in pairs:
+                self._ids[text] = text_id
+                self._texts[text_id] = text
+
+    def cached_ids(self, strings: Iterable[str]) -> Optional[Dict[str, int]]:
+        """Ids for ``strings`` if all are already known to this process, else None."""
+        with self._lock:
+            try:
+                return {s: self._ids[s] for s in strings}
+            except KeyError:
+                return None
+
+    def ids(self, strings: Iterable[str]) -> Dict[str, int]:
+        """Id of each string, interning unseen ones.
+
+        New texts are committed in their own short transaction, never inside the
+        caller's: an id handed out must exist even if the report insert rolls back.
+        """
+        strings = list(dict.fromkeys(strings))
+        cached = self.cached_ids(strings)
+        if cached is not None:
+            return cached
+        with SessionLocal() as db:
+            by_sha = {_sha(s): s for s in strings}
+            found = dict(db.execute(
+                select(models.CatalogText.sha256, models.CatalogText.id)
+                .where(models.CatalogText.sha256.in_(list(by_sha)))
+            ).all())
+            missing = [sha for sha in by_sha if sha not in found]
+            if missing:
+                try:
+                    db.execute(insert(models.CatalogText), [{"sha256": sha, "text": by_sha[sha]} for sha in missing])
+                    db.commit()
+                except IntegrityError:
+                    # Another worker interned some of them first; add the rest one at a time
+                    db.rollback()
+                    for sha in missing:
+                        try:
+                            db.execute(insert(models.CatalogText).values(sha256=sha, text=by_sha[sha]))
+                            db.commit()
+                        except IntegrityError:
+                            db.rollback()
+                found = dict(db.execute(
+                    select(models.CatalogText.sha256, models.CatalogText.id)
+                    .where(models.CatalogText.sha256.in_(list(by_sha)))
+                ).all())
+        self._remember((found[sha], text) for sha, text in by_sha.items())
+        return {text: found[sha] for sha, text in by_sha.items()}
+
+    def texts(self, db: Session, text_ids: Iterable[int]) -> Dict[int, str]:
+        text_ids = set(text_ids)
+        with self._lock:
+            known = {i: self._texts[i] for i in text_ids if i in self._texts}
+        missing = text_ids - known.keys()
+        if missing:
+            rows = db.execute(
+                select(models.CatalogText.id, models.CatalogText.text).where(models.CatalogText.id.in_(missing))
+            ).all()
+            self._remember((i, t) for i, t in rows)
+            known.update(rows)
+        return known
+
+    @staticmethod
+    def link_rows(report_id: int, recs: List[str], steps: List[str], ids: Dict[str, int]) -> List[dict]:
+        return (
+            [{"report_id": report_id, "kind": REC, "position": i, "text_id": ids[t]} for i, t in enumerate(recs)]
+            + [{"report_id": report_id, "kind": STEP, "position": i, "text_id": ids[t]} for i, t in enumerate(steps)]
+        )
+
+    def lists_for(self, db: Session, report_ids: List[int]) -> Dict[int, Tuple[List[str], List[str]]]:
+        """(recommendations, treatment) of each report, in their original order."""
+        out: Dict[int, Tuple[List[str], List[str]]] = defaultdict(lambda: ([], []))
+        if not report_ids:
+            return out
+        links = db.execute(
+            select(models.ReportText.report_id, models.ReportText.kind, models.ReportText.text_id)
+            .where(models.ReportText.report_id.in_(report_ids))
+            .order_by(models.ReportText.report_id, models.ReportText.kind, models.ReportText.position)
+        ).all()
+        texts = self.texts(db, (link.text_id for link in links))
+        for report_id, kind, text_id in links:
+            out[report_id][0 if kind == REC else 1].append(texts[text_id])
+        return out
+
+    def seed(self) -> None:
+        """Intern the rule catalog so predictions saved as reports never miss the cache."""
+        self.ids(catalog_strings())
+
+
+def legacy_recommendations(raw: Optional[str]) -> List[str]:
+    # Rows written before report_texts existed (until python -m api.migrate moves them)
+    return json.loads(raw) if raw else []
+
+
+TEXTS = TextCatalog(TEXT_CACHE_SIZE)
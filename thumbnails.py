@@ -0,0 +1,194 @@
+"""Downscaled report images for GET /reports/{id}/image?size=.
+
+Each (source image, size) is rendered once and kept under ``storage/thumbs``,
+named after the source's SHA-256, so reports sharing a blob share thumbnails.
+The directory is bounded by THUMB_CACHE_BYTES with least-recently-used
+eviction; file mtimes carry the recency across restarts.
+
+Rendering needs Pillow; without it every size serves the original image.
+"""
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from .storage import BLOBS_DIR, STORAGE_DIR
+
+THUMBS_DIR = os.path.join(STORAGE_DIR, 'thumbs')
+THUMB_CACHE_BYTES = int(os.getenv('THUMB_CACHE_BYTES', str(256 * 1024 * 1024)))
+THUMB_QUALITY = int(os.getenv('THUMB_QUALITY', '80'))
+# Longest side in pixels of each named size; "full" is the stored image itself
+SIZES: Dict[str, int] = {
+    "thumb": int(os.getenv('THUMB_SIZE', '160')),
+    "preview": int(os.getenv('PREVIEW_SIZE', '640')),
+}
+
+
+def render(src: str, dst: str, box: int, quality: int = THUMB_QUALITY) -> Optional[int]:
+    """Write a JPEG of ``src`` fitting in ``box`` x ``box`` to ``dst``; returns its size.
+
+    Returns None if Pillow is missing or ``src`` isn't a decodable image. Module
+    level so it can run on a process pool.
+    """
+    try:
+        from PIL import Image
+    except ImportError:
+        return None
+    tmp = f"{dst}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with Image.open(src) as img:
+            # JPEG sources decode straight to the nearest DCT scale above the target
+            img.draft('RGB', (box, box))
+            # reducing_gap shrinks by an integer factor first, then resamples the rest
+            img.thumbnail((box, box), Image.Resampling.LANCZOS, reducing_gap=2.0)
+            if img.mode in ('RGBA', 'LA', 'P'):
+                rgba = img.convert('RGBA')
+                img = Image.new('RGB', rgba.size, (255, 255, 255))
+                img.paste(rgba, mask=rgba.getchannel('A'))
+            elif img.mode != 'RGB':
+                img = img.convert('RGB')
+            os.makedirs(os.path.dirname(dst), exist_ok=True)
+            img.save(tmp, 'JPEG', quality=quality, optimize=True)
+        os.replace(tmp, dst)
+        return os.path.getsize(dst)
+    except (OSError, ValueError, Image.DecompressionBombError):
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        return None
+
+
+class ThumbnailCache:
+    def __init__(self, root: str, max_bytes: int):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries: Optional[OrderedDict] = None  # path -> bytes, oldest first
+        self._bytes = 0
+        self._rendering: Dict[str, threading.Lock] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _load(self) -> None:
+        # Caller holds self._lock; one directory walk per process, on first use
+        found = []
+        for dirpath, _, names in os.walk(self.root):
+            for name in names:
+                if name.endswith('.tmp'):
+                    continue
+                path = os.path.join(dirpath, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                found.append((st.st_mtime, path, st.st_size))
+        self._entries = OrderedDict((path, size) for _, path, size in sorted(found))
+        self._bytes = sum(self._entries.values())
+
+    def path_for(self, key: str, size: str) -> str:
+        return os.path.join(self.root, key[:2], f"{key}-{size}.jpg")
+
+    def _touch(self, path: str) -> bool:
+        try:
+            os.utime(path)
+        except OSError:
+            return False
+        with self._lock:
+            if self._entries is None:
+                self._load()
+            if path in self._entries:
+                self._entries.move_to_end(path)
+            self.hits += 1
+        return True
+
+    def _add(self, path: str, nbytes: int) -> None:
+        evict = []
+        with self._lock:
+            if self._entries is None:
+                self._load()
+            self._bytes += nbytes - self._entries.pop(path, 0)
+            self._entries[path] = nbytes
+            while self._bytes > self.max_bytes and len(self._entries) > 1:
+                old, old_bytes = self._entries.popitem(last=False)
+                self._bytes -= old_bytes
+                self.evictions += 1
+                evict.append(old)
+        for old in evict:
+            try:
+                os.remove(old)
+            except OSError:
+                pass
+
+    def get(self, src: str, key: str, size: str, pool) -> Optional[str]:
+        """Path of ``src`` rendered at ``size``, rendering it on ``pool`` on a miss.
+
+        ``key`` identifies the source content. Returns None when it can't be rendered.
+        """
+        dst = self.path_for(key, size)
+        if self._touch(dst):
+            return dst
+        with self._lock:
+            lock = self._rendering.setdefault(dst, threading.Lock())
+        # Concurrent requests for the same thumbnail render it once
+        with lock:
+            try:
+                if self._touch(dst):
+                    return dst
+                with self._lock:
+                    self.misses += 1
+                nbytes = pool.submit(render, src, dst, SIZES[size]).result()
+            finally:
+                with self._lock:
+                    self._rendering.pop(dst, None)
+        if nbytes is None:
+            return None
+        self._add(dst, nbytes)
+        return dst
+
+    def forget(self, paths: List[str]) -> None:
+        """Drop the thumbnails of blob files that were just deleted."""
+        keys = [os.path.basename(p).split('.')[0] for p in paths
+                if os.path.abspath(p).startswith(os.path.abspath(BLOBS_DIR))]
+        for key in keys:
+            for size in SIZES:
+                path = self.path_for(key, size)
+                with self._lock:
+                    if self._entries is not None:
+                        self._bytes -= self._entries.pop(path, 0)
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries) if self._entries is not None else None,
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+def source_key(path: str, sha256: Optional[str]) -> str:
+    """Content key of a stored image; files from before the manifest fall back to path + mtime."""
+    if sha256:
+        return sha256
+    st = os.stat(path)
+    return hashlib.sha256(f"{path}:{st.st_mtime_ns}:{st.st_size}".encode('utf-8')).hexdigest()
+
+
+def image_entry(files: List[Tuple[str, str, Optional[str]]]) -> Optional[Tuple[str, str, Optional[str]]]:
+    # storage.latest_files lists the JSON report first, then the image if there is one
+    for entry in files:
+        if not entry[0].endswith('.json'):
+            return entry
+    return None
+
+
+THUMBS = ThumbnailCache(THUMBS_DIR, THUMB_CACHE_BYTES)
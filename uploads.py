@@ -0,0 +1,133 @@
+"""Chunked reading of uploaded images with a size limit."""
+import hashlib
+import os
+import zipfile
+from typing import BinaryIO, Callable, List, Tuple
+
+from fastapi import HTTPException, UploadFile
+from starlette.responses import PlainTextResponse
+
+# Upload configuration via environment variables
+UPLOAD_CHUNK_SIZE = int(os.getenv('UPLOAD_CHUNK_SIZE', str(256 * 1024)))
+MAX_UPLOAD_BYTES = int(os.getenv('MAX_UPLOAD_BYTES', str(20 * 1024 * 1024)))
+# POST /reports: one image, as a binary part or a base64 data URL (4/3 of its size), plus metadata
+MAX_REPORT_BYTES = int(os.getenv('MAX_REPORT_BYTES', str(MAX_UPLOAD_BYTES * 4 // 3 + 1024 * 1024)))
+# Batch uploads: many files (or zip archives) in one request
+BATCH_MAX_FILES = int(os.getenv('BATCH_MAX_FILES', '500'))
+MAX_BATCH_BYTES = int(os.getenv('MAX_BATCH_BYTES', str(512 * 1024 * 1024)))
+BATCH_WORKERS = int(os.getenv('BATCH_WORKERS', str(min(8, (os.cpu_count() or 1) + 2))))
+# Allowance for multipart boundaries and part headers on top of the file itself
+MULTIPART_OVERHEAD = 64 * 1024
+
+
+def _too_large(limit: int) -> HTTPException:
+    return HTTPException(status_code=413, detail=f"Upload exceeds the {limit} byte limit")
+
+
+def check_upload_size(file: UploadFile, max_bytes: int = MAX_UPLOAD_BYTES) -> None:
+    """Raise 413 up front when the parsed upload is already known to be too large."""
+    if file.size is not None and file.size > max_bytes:
+        raise _too_large(max_bytes)
+
+
+def upload_length(fileobj: BinaryIO, max_bytes: int = MAX_UPLOAD_BYTES, chunk_size: int = UPLOAD_CHUNK_SIZE) -> int:
+    """Size of an upload counted one chunk at a time, for when the parser didn't record it.
+
+    Blocking; run it on a worker pool. Raises 413 as soon as the count passes ``max_bytes``.
+    """
+    total = 0
+    for chunk in iter(lambda: fileobj.read(chunk_size), b''):
+        total += len(chunk)
+        if total > max_bytes:
+            raise _too_large(max_bytes)
+    return total
+
+
+def hash_fileobj(fileobj: BinaryIO, max_bytes: int = MAX_UPLOAD_BYTES, chunk_size: int = UPLOAD_CHUNK_SIZE) -> bytes:
+    """SHA-256 digest of an upload, read one chunk at a time.
+
+    Blocking; run it on a worker pool. Raises 413 as soon as the running
+    total passes ``max_bytes``.
+    """
+    hasher = hashlib.sha256()
+    total = 0
+    while True:
+        chunk = fileobj.read(chunk_size)
+        if not chunk:
+            break
+        total += len(chunk)
+        if total > max_bytes:
+            raise _too_large(max_bytes)
+        hasher.update(chunk)
+    return hasher.digest()
+
+
+def _is_zip(upload: UploadFile) -> bool:
+    return (upload.filename or '').lower().endswith('.zip') or upload.content_type in (
+        'application/zip', 'application/x-zip-compressed'
+    )
+
+
+def batch_items(uploads: List[UploadFile]) -> Tuple[List[Tuple[str, Callable[[], BinaryIO]]], List[zipfile.ZipFile]]:
+    """Expand uploaded files and zip archives into (filename, opener) pairs in input order.
+
+    Also returns the opened archives so the caller can close them when done.
+    """
+    items: List[Tuple[str, Callable[[], BinaryIO]]] = []
+    archives: List[zipfile.ZipFile] = []
+    for upload in uploads:
+        if _is_zip(upload):
+            try:
+                zf = zipfile.ZipFile(upload.file)
+            except zipfile.BadZipFile:
+                raise HTTPException(status_code=400, detail=f"{upload.filename} is not a valid zip archive")
+            archives.append(zf)
+            for info in zf.infolist():
+                if info.is_dir() or info.filename.startswith('__MACOSX/'):
+                    continue
+                if info.file_size > MAX_UPLOAD_BYTES:
+                    raise _too_large(MAX_UPLOAD_BYTES)
+                items.append((info.filename, lambda zf=zf, info=info: zf.open(info)))
+        else:
+            items.append((upload.filename or 'upload', lambda f=upload.file: f))
+        if len(items) > BATCH_MAX_FILES:
+            raise HTTPException(status_code=400, detail=f"At most {BATCH_MAX_FILES} images per batch")
+    return items, archives
+
+
+class UploadLimitMiddleware:
+    """Reject upload requests whose declared Content-Length is over the limit
+    before the multipart body is parsed and spooled, and stop reading bodies
+    sent without one once they pass it."""
+
+    def __init__(self, app, limits: dict):
+        self.app = app
+        self.limits = limits
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["method"] == "POST":
+            limit = self.limits.get(scope["path"])
+            if limit is not None:
+                length = dict(scope["headers"]).get(b"content-length")
+                if length is not None and length.isdigit() and int(length) > limit + MULTIPART_OVERHEAD:
+                    response = PlainTextResponse(f"Upload exceeds the {limit} byte limit", status_code=413)
+                    await response(scope, receive, send)
+                    return
+                receive = _counting(receive, limit)
+        await self.app(scope, receive, send)
+
+
+def _counting(receive: Callable, limit: int) -> Callable:
+    received = 0
+
+    async def counted():
+        nonlocal received
+        message = await receive()
+        if message["type"] == "http.request":
+            received += len(message.get("body", b""))
+            if received > limit + MULTIPART_OVERHEAD:
+                # Raised inside the body read, so the app answers it like any other 413
+                raise _too_large(limit)
+        return message
+
+    return counted
@@ -0,0 +1,119 @@
+"""Executor pools for CPU-heavy request steps (hashing, scoring, image decoding).
+
+HASH_POOL is a thread pool: hashlib releases the GIL on large buffers, so
+hashing scales across cores without pickling. CPU_POOL is a process pool when
+WORKER_PROCESSES > 0, otherwise it shares the thread pool. Both reject new work
+with a 429 once WORKER_MAX_QUEUE tasks are waiting or running.
+"""
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+
+from fastapi import HTTPException
+
+# Worker pool configuration via environment variables
+WORKER_THREADS = int(os.getenv('WORKER_THREADS', str(min(32, (os.cpu_count() or 1) + 4))))
+WORKER_PROCESSES = int(os.getenv('WORKER_PROCESSES', '0'))  # 0 = no process pool
+WORKER_MAX_QUEUE = int(os.getenv('WORKER_MAX_QUEUE', '128'))  # in-flight tasks before 429
+
+
+def _timed(fn, args, submitted_at: float):
+    # Runs in the worker (thread or process); reports when the task actually started
+    started = time.monotonic()
+    return fn(*args), started - submitted_at
+
+
+class WorkerPool:
+    """Executor wrapper with bounded in-flight work and latency counters."""
+
+    def __init__(self, name: str, executor: Executor, max_queue: int):
+        self.name = name
+        self.executor = executor
+        self.max_queue = max_queue
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.wait_seconds = 0.0
+        self.run_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    def _reject_if_saturated(self) -> None:
+        # Caller holds self._lock
+        if self.in_flight >= self.max_queue:
+            self.rejected += 1
+            raise HTTPException(status_code=429, detail="Server busy, retry shortly", headers={"Retry-After": "1"})
+
+    def ensure_capacity(self) -> None:
+        """Raise 429 now if the pool is saturated, before the caller starts side effects."""
+        with self._lock:
+            self._reject_if_saturated()
+
+    def submit(self, fn, *args, reject: bool = True) -> Future:
+        """Schedule ``fn(*args)``. With ``reject`` a saturated pool raises 429 instead of queueing."""
+        with self._lock:
+            if reject:
+                self._reject_if_saturated()
+            self.in_flight += 1
+            self.submitted += 1
+        submitted_at = time.monotonic()
+        inner = self.executor.submit(_timed, fn, args, submitted_at)
+        outer: Future = Future()
+
+        def _done(f: Future):
+            elapsed = time.monotonic() - submitted_at
+            with self._lock:
+                self.in_flight -= 1
+                if f.exception() is not None:
+                    self.failed += 1
+                else:
+                    wait = f.result()[1]
+                    self.completed += 1
+                    self.wait_seconds += wait
+                    self.run_seconds += elapsed - wait
+                    self.max_wait_seconds = max(self.max_wait_seconds, wait)
+            if f.exception() is not None:
+                outer.set_exception(f.exception())
+            else:
+                outer.set_result(f.result()[0])
+
+        inner.add_done_callback(_done)
+        return outer
+
+    async def run(self, fn, *args, reject: bool = True):
+        """Await ``fn(*args)`` on the pool without blocking the event loop."""
+        return await asyncio.wrap_future(self.submit(fn, *args, reject=reject))
+
+    def stats(self) -> dict:
+        with self._lock:
+            done = self.completed or 1
+            return {
+                "name": self.name,
+                "queue_depth": self.in_flight,
+                "max_queue": self.max_queue,
+                "submitted": self.submitted,
+                "completed": self.completed,
+                "failed": self.failed,
+                "rejected": self.rejected,
+                "avg_wait_ms": round(self.wait_seconds / done * 1000, 3),
+                "avg_run_ms": round(self.run_seconds / done * 1000, 3),
+                "max_wait_ms": round(self.max_wait_seconds * 1000, 3),
+            }
+
+
+HASH_POOL = WorkerPool(
+    "threads", ThreadPoolExecutor(max_workers=WORKER_THREADS, thread_name_prefix='cropai-worker'), WORKER_MAX_QUEUE
+)
+if WORKER_PROCESSES > 0:
+    CPU_POOL = WorkerPool("processes", ProcessPoolExecutor(max_workers=WORKER_PROCESSES), WORKER_MAX_QUEUE)
+else:
+    CPU_POOL = HASH_POOL
+
+
+def pool_stats() -> list:
+    pools = [HASH_POOL] if CPU_POOL is HASH_POOL else [HASH_POOL, CPU_POOL]
+    return [p.stats() for p in pools]
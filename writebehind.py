@@ -0,0 +1,326 @@
+"""Optional write-behind pipeline for report artifacts.
+
+With REPORT_WRITE_BEHIND=1, create_report commits the DB row and returns; a
+background thread then writes the JSON report (and any data-URL image), fsyncs
+each batch of files together and records them in the artifact manifest.
+
+Every queued job is first appended to a per-process journal under
+``storage/journal``, named for the process and the run (PIDs repeat across
+container restarts). Finished jobs are marked done, and the journal is truncated
+whenever the queue drains; jobs that ran out of retries are written back into
+the fresh journal and queued again after a growing delay. On start, journals left behind by processes that are
+no longer running (their lock is free) are replayed, so restarting the server
+loses nothing that was acknowledged. Journal appends are flushed but only
+fsynced together with each finished batch, keeping fsync off the request path.
+"""
+import json
+import os
+import queue
+import threading
+import time
+import uuid
+from glob import glob
+from typing import Dict, List, Optional, Set, Tuple
+
+from . import metrics, models, storage
+from .database import SessionLocal
+
+try:
+    import fcntl
+except ImportError:  # Windows: one worker process, no cross-process journal locking
+    fcntl = None
+
+# Write-behind configuration via environment variables
+REPORT_WRITE_BEHIND = os.getenv('REPORT_WRITE_BEHIND', '0') == '1'
+WRITE_BEHIND_QUEUE = int(os.getenv('WRITE_BEHIND_QUEUE', '1000'))
+WRITE_BEHIND_BATCH = int(os.getenv('WRITE_BEHIND_BATCH', '64'))
+WRITE_BEHIND_FSYNC = os.getenv('WRITE_BEHIND_FSYNC', '1') == '1'
+WRITE_BEHIND_RETRIES = int(os.getenv('WRITE_BEHIND_RETRIES', '3'))
+# Failed jobs are queued again after this many seconds, doubling up to the maximum
+WRITE_BEHIND_RETRY_DELAY = float(os.getenv('WRITE_BEHIND_RETRY_DELAY', '30'))
+WRITE_BEHIND_RETRY_MAX = float(os.getenv('WRITE_BEHIND_RETRY_MAX', '900'))
+
+JOURNAL_DIR = os.path.join(storage.STORAGE_DIR, 'journal')
+SPOOL_DIR = os.path.join(JOURNAL_DIR, 'spool')
+
+
+def _fsync_paths(paths: List[str]) -> None:
+    dirs = set()
+    for p in paths:
+        try:
+            fd = os.open(p, os.O_RDONLY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+            dirs.add(os.path.dirname(p))
+        except OSError:
+            pass
+    for d in dirs:
+        try:
+            fd = os.open(d, os.O_RDONLY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+        except OSError:
+            # Directories can't be opened for fsync on every platform
+            pass
+
+
+class WriteBehind:
+    """Bounded queue plus a single writer thread that persists artifacts in batches."""
+
+    def __init__(self, max_queue: int, batch_size: int, fsync: bool):
+        self.batch_size = batch_size
+        self.fsync = fsync
+        self._queue: "queue.Queue[dict]" = queue.Queue(maxsize=max_queue)
+        self._pending: Set[int] = set()
+        # report id -> (job, failed rounds) for jobs that ran out of retries
+        self._failed: Dict[int, Tuple[dict, int]] = {}
+        self._lock = threading.Lock()
+        self._journal = None
+        self._journal_name = f"pending-{os.getpid()}-{uuid.uuid4().hex[:12]}.jsonl"
+        self._thread: Optional[threading.Thread] = None
+        self.written = 0
+        self.batches = 0
+
+    # -- journal ---------------------------------------------------------------
+
+    def _journal_path(self) -> str:
+        return os.path.join(JOURNAL_DIR, self._journal_name)
+
+    def _open_journal(self) -> None:
+        os.makedirs(SPOOL_DIR, exist_ok=True)
+        self._journal = open(self._journal_path(), 'a+', encoding='utf-8')
+        if fcntl is not None:
+            fcntl.flock(self._journal.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+    def _write_records(self, records: List[dict], sync: bool = False) -> None:
+        # Caller holds self._lock
+        for r in records:
+            self._journal.write(json.dumps(r, ensure_ascii=False) + "\n")
+        self._journal.flush()
+        if sync:
+            os.fsync(self._journal.fileno())
+
+    @staticmethod
+    def _unfinished(path: str) -> List[dict]:
+        jobs, done = {}, set()
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    rec = json.loads(line)
+                except ValueError:
+                    continue  # torn final line
+                if rec.get('op') == 'job':
+                    jobs[rec['report_id']] = rec
+                elif rec.get('op') == 'done':
+                    done.add(rec['report_id'])
+        return [job for rid, job in jobs.items() if rid not in done]
+
+    def _replay_orphans(self) -> None:
+        """Re-queue unfinished jobs from journals whose owning process is gone."""
+        for path in glob(os.path.join(JOURNAL_DIR, 'pending-*.jsonl')):
+            if path == self._journal_path():
+                continue
+            with open(path, 'a+', encoding='utf-8') as f:
+                if fcntl is not None:
+                    try:
+                        fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    except OSError:
+                        continue  # another live worker owns it
+                jobs = self._unfinished(path)
+                if jobs:
+                    with self._lock:
+                        self._write_records(jobs, sync=True)
+                        self._pending.update(job['report_id'] for job in jobs)
+                    for job in jobs:
+                        self._queue.put(job)
+                os.remove(path)
+
+    # -- lifecycle ---------------------------------------------------------------
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._open_journal()
+        self._thread = threading.Thread(target=self._run, name='report-write-behind', daemon=True)
+        self._thread.start()
+        self._replay_orphans()
+
+    def enqueue(self, report_id: int, record: dict, base_name: str, annotated_image: Optional[str] = None,
+                image_artifact: Optional[dict] = None) -> bool:
+        """Queue artifact writes for a committed report.
+
+        Returns False when write-behind isn't running or the queue is full; the
+        caller then writes the files inline.
+        """
+        if self._thread is None or self._queue.full():
+            return False
+        spool = None
+        if annotated_image:
+            # Park the data URL on disk so the job survives a restart; decoding happens later
+            spool = os.path.join(SPOOL_DIR, f"{base_name}.dataurl")
+            with open(spool, 'w', encoding='ascii') as f:
+                f.write(annotated_image)
+        job = {"op": "job", "report_id": report_id, "record": record, "base_name": base_name,
+               "spool": spool, "image_artifact": image_artifact}
+        with self._lock:
+            # Journaled (flushed, not fsynced) before the request is acknowledged
+            self._write_records([job])
+            self._pending.add(report_id)
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            with self._lock:
+                self._pending.discard(report_id)
+                self._write_records([{"op": "done", "report_id": report_id}])
+            storage.remove_files([spool] if spool else [])
+            return False
+        return True
+
+    # -- status ------------------------------------------------------------------
+
+    def status(self, report_id: int) -> Optional[str]:
+        """'pending' or 'failed' while the writer still owes files for the report, else None."""
+        with self._lock:
+            if report_id in self._failed:
+                return 'failed'
+        return 'pending' if report_id in self.pending_ids() else None
+
+    def forget(self, report_id: int) -> None:
+        """Stop tracking (and retrying) the report's job; call once the report is deleted."""
+        with self._lock:
+            failed = self._failed.pop(report_id, None) is not None
+            if failed or report_id in self._pending:
+                # A copy still queued is written as an orphan; it isn't retried if that fails
+                self._pending.discard(report_id)
+                self._write_records([{"op": "done", "report_id": report_id}])
+
+    def pending_ids(self) -> Set[int]:
+        """Reports whose artifacts are queued here or in another live worker's journal."""
+        with self._lock:
+            ids = set(self._pending)
+        for path in glob(os.path.join(JOURNAL_DIR, 'pending-*.jsonl')):
+            if path != self._journal_path():
+                try:
+                    ids.update(job['report_id'] for job in self._unfinished(path))
+                except OSError:
+                    pass
+        return ids
+
+    def stats(self) -> dict:
+        with self._lock:
+            pending = len(self._pending)
+            failed = len(self._failed)
+        return {"enabled": self._thread is not None, "pending": pending, "written": self.written,
+                "failed": failed, "batches": self.batches}
+
+    # -- writer thread -------------------------------------------------------------
+
+    def _next_batch(self) -> List[dict]:
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + 0.05
+        while len(batch) < self.batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+        return batch
+
+    def _retry_later(self, jobs: List[dict], rounds: int) -> None:
+        delay = min(WRITE_BEHIND_RETRY_MAX, WRITE_BEHIND_RETRY_DELAY * 2 ** (rounds - 1))
+        timer = threading.Timer(delay, self._requeue, [jobs])
+        timer.daemon = True
+        timer.start()
+
+    def _requeue(self, jobs: List[dict]) -> None:
+        with self._lock:
+            # Deleted reports were forgotten in the meantime
+            jobs = [job for job in jobs if job['report_id'] in self._failed]
+            self._pending.update(job['report_id'] for job in jobs)
+        for job in jobs:
+            self._queue.put(job)
+
+    def _run(self) -> None:
+        while True:
+            batch = self._next_batch()
+            ids = [job['report_id'] for job in batch]
+            for attempt in range(WRITE_BEHIND_RETRIES + 1):
+                try:
+                    self._write_batch(batch)
+                    break
+                except Exception:
+                    time.sleep(0.5 * 2 ** attempt)
+            else:
+                # Left unfinished in the journal (and kept across truncation) so they are never lost
+                with self._lock:
+                    # Jobs forgotten while in flight aren't tracked any more
+                    batch = [job for job in batch if job['report_id'] in self._pending]
+                    self._pending.difference_update(ids)
+                    rounds = 1 + max((self._failed.get(job['report_id'], (None, 0))[1] for job in batch), default=0)
+                    self._failed.update((job['report_id'], (job, rounds)) for job in batch)
+                if batch:
+                    self._retry_later(batch, rounds)
+                continue
+            with self._lock:
+                self._write_records([{"op": "done", "report_id": rid} for rid in ids], sync=self.fsync)
+                self._pending.difference_update(ids)
+                for rid in ids:
+                    self._failed.pop(rid, None)
+                if not self._pending and self._queue.empty():
+                    # Everything else acknowledged is on disk; start the journal afresh with
+                    # only the jobs still waiting for a retry
+                    self._journal.seek(0)
+                    self._journal.truncate()
+                    if self._failed:
+                        self._write_records([job for job, _ in self._failed.values()], sync=True)
+            self.written += len(batch)
+            self.batches += 1
+
+    def _write_batch(self, batch: List[dict]) -> None:
+        written, recorded, orphaned, taken = [], [], [], []
+        try:
+            with SessionLocal() as db:
+                ids = [job['report_id'] for job in batch]
+                live = {rid for (rid,) in db.query(models.Report.id).filter(models.Report.id.in_(ids))}
+                for job in batch:
+                    annotated_image = None
+                    if job.get('spool'):
+                        try:
+                            with open(job['spool'], encoding='ascii') as f:
+                                annotated_image = f.read()
+                        except OSError:
+                            pass
+                    with metrics.stage('file_write'):
+                        artifacts = storage.write_report_files(job['record'], job['base_name'], annotated_image,
+                                                               job.get('image_artifact'))
+                    # An uploaded image's claim belongs to the job and has to outlive retries
+                    taken.extend(a for a in artifacts if a is not job.get('image_artifact'))
+                    if job['report_id'] in live:
+                        storage.record_artifacts(db, job['report_id'], artifacts)
+                        recorded.extend(artifacts)
+                        written.extend(os.path.join(storage.STORAGE_DIR, a['path']) for a in artifacts)
+                    else:
+                        # Deleted while queued: nothing references these files
+                        orphaned.extend(artifacts)
+                if self.fsync:
+                    with metrics.stage('fsync'):
+                        _fsync_paths(written)
+                with metrics.stage('db_commit'):
+                    db.commit()
+        except BaseException:
+            # Drop the claims this attempt took; a retry takes fresh ones
+            storage.settle_claims(taken, committed=False)
+            raise
+        storage.settle_claims(recorded)
+        storage.settle_claims(orphaned, committed=False)
+        # Blobs shared with another report survive remove_released's check
+        storage.remove_released([os.path.join(storage.STORAGE_DIR, a['path']) for a in orphaned])
+        storage.remove_files([job['spool'] for job in batch if job.get('spool')])
+
+WRITER = WriteBehind(WRITE_BEHIND_QUEUE, WRITE_BEHIND_BATCH, WRITE_BEHIND_FSYNC)
@@ -0,0 +1,196 @@
+"""Zip archives streamed straight from disk.
+
+Entries are written through zipfile onto an unseekable sink, so each chunk
+read from disk is emitted as soon as it is compressed and nothing is buffered
+beyond one chunk. Already-compressed images are STORED, everything else
+DEFLATED. Output is deterministic for the same files, which is what makes the
+ETag and HTTP Range support below possible.
+"""
+import hashlib
+import os
+import re
+import threading
+import time
+import zipfile
+from collections import OrderedDict
+from typing import Iterator, List, NamedTuple, Optional
+
+from fastapi import Request
+from fastapi.responses import Response, StreamingResponse
+
+from . import httpcache, metrics
+
+CHUNK_SIZE = 256 * 1024
+# Formats that don't shrink under deflate
+STORED_EXTENSIONS = {'.png', '.jpg', '.jpeg', '.webp', '.gif', '.zip', '.gz'}
+# Archive sizes remembered by ETag, so resumed downloads don't compress the bundle twice
+SIZE_CACHE_ENTRIES = int(os.getenv('ZIP_SIZE_CACHE_ENTRIES', '1024'))
+
+
+class Entry(NamedTuple):
+    path: str  # absolute path on disk
+    arcname: str
+    checksum: Optional[str] = None  # sha256 from the artifact manifest, when known
+
+
+class _Sink:
+    """Write-only, unseekable buffer that zipfile writes into and we drain."""
+
+    def __init__(self):
+        self._buf = bytearray()
+        self._pos = 0
+
+    def write(self, data) -> int:
+        self._buf += data
+        self._pos += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._pos
+
+    def flush(self) -> None:
+        pass
+
+    def drain(self) -> bytes:
+        data = bytes(self._buf)
+        self._buf.clear()
+        return data
+
+
+def _zipinfo(entry: Entry, st: os.stat_result) -> zipfile.ZipInfo:
+    date_time = time.localtime(max(st.st_mtime, 315532800))[:6]  # zip dates start in 1980
+    info = zipfile.ZipInfo(entry.arcname, date_time=date_time)
+    info.external_attr = 0o644 << 16
+    info.file_size = st.st_size
+    stored = os.path.splitext(entry.path)[1].lower() in STORED_EXTENSIONS
+    info.compress_type = zipfile.ZIP_STORED if stored else zipfile.ZIP_DEFLATED
+    return info
+
+
+def generate(entries: List[Entry]) -> Iterator[bytes]:
+    sink = _Sink()
+    with zipfile.ZipFile(sink, mode='w') as zf:
+        for entry in entries:
+            st = os.stat(entry.path)
+            info = _zipinfo(entry, st)
+            with open(entry.path, 'rb') as src, zf.open(info, 'w', force_zip64=st.st_size >= zipfile.ZIP64_LIMIT) as dst:
+                while True:
+                    chunk = src.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    dst.write(chunk)
+                    data = sink.drain()
+                    if data:
+                        yield data
+            yield sink.drain()
+    yield sink.drain()
+
+
+def etag(entries: List[Entry]) -> str:
+    h = hashlib.sha256()
+    for e in entries:
+        st = os.stat(e.path)
+        h.update(f"{e.arcname}\0{e.checksum or ''}\0{st.st_size}\0{int(st.st_mtime)}\n".encode('utf-8'))
+    return f'"{h.hexdigest()[:32]}"'
+
+
+def _slice(chunks: Iterator[bytes], start: int, end: int) -> Iterator[bytes]:
+    """Bytes ``start..end`` (inclusive) of the chunk stream."""
+    pos = 0
+    for chunk in chunks:
+        nxt = pos + len(chunk)
+        if nxt > start and pos <= end:
+            yield chunk[max(0, start - pos):end - pos + 1]
+        if nxt > end:
+            break
+        pos = nxt
+
+
+class _SizeCache:
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._sizes: OrderedDict = OrderedDict()
+
+    def get(self, tag: str) -> Optional[int]:
+        with self._lock:
+            size = self._sizes.get(tag)
+            if size is not None:
+                self._sizes.move_to_end(tag)
+            return size
+
+    def put(self, tag: str, size: int) -> None:
+        with self._lock:
+            self._sizes[tag] = size
+            self._sizes.move_to_end(tag)
+            while len(self._sizes) > self.max_entries:
+                self._sizes.popitem(last=False)
+
+
+SIZES = _SizeCache(SIZE_CACHE_ENTRIES)
+
+
+def _counted(tag: str, chunks: Iterator[bytes]) -> Iterator[bytes]:
+    # Remembers the archive size once a full stream has been produced
+    total = 0
+    for chunk in chunks:
+        total += len(chunk)
+        yield chunk
+    SIZES.put(tag, total)
+
+
+def _size(tag: str, entries: List[Entry]) -> int:
+    total = SIZES.get(tag)
+    if total is None:
+        # Not known yet: count one pass (the bytes are deterministic, so the count holds for the ETag)
+        total = sum(len(c) for c in _counted(tag, generate(entries)))
+    return total
+
+
+def _parse_range(header: str):
+    """(first, last) of a single byte range, either possibly None; None to ignore the header.
+
+    Multiple ranges and malformed headers are ignored (RFC 9110 allows serving 200).
+    """
+    m = re.fullmatch(r'bytes=(\d*)-(\d*)', header.strip())
+    if not m or (not m.group(1) and not m.group(2)):
+        return None
+    return (int(m.group(1)) if m.group(1) else None), (int(m.group(2)) if m.group(2) else None)
+
+
+def _resolve_range(spec, total: int):
+    first, last = spec
+    if first is None:
+        start, end = max(0, total - last), total - 1
+    else:
+        start = first
+        end = min(last, total - 1) if last is not None else total - 1
+    return (start, end) if start <= end else None
+
+
+def bundle_response(request: Request, entries: List[Entry], download_name: str) -> Response:
+    """Stream ``entries`` as a zip, honouring If-None-Match, Range and If-Range."""
+    tag = etag(entries)
+    headers = {
+        'ETag': tag,
+        'Accept-Ranges': 'bytes',
+        'Content-Disposition': f'attachment; filename="{download_name}"',
+    }
+    if httpcache.not_modified(request, tag, None):
+        return Response(status_code=304, headers={'ETag': tag})
+
+    range_header = request.headers.get('range')
+    if_range = request.headers.get('if-range')
+    spec = _parse_range(range_header) if range_header and (if_range is None or if_range == tag) else None
+    if spec is not None:
+        total = _size(tag, entries)
+        rng = _resolve_range(spec, total)
+        if rng is None:
+            return Response(status_code=416, headers={'Content-Range': f'bytes */{total}', 'ETag': tag})
+        start, end = rng
+        headers.update({'Content-Range': f'bytes {start}-{end}/{total}', 'Content-Length': str(end - start + 1)})
+        return StreamingResponse(metrics.timed_iter('zip_build', _slice(generate(entries), start, end)), status_code=206,
+                                 media_type='application/zip', headers=headers)
+
+    return StreamingResponse(metrics.timed_iter('zip_build', _counted(tag, generate(entries))),
+                             media_type='application/zip', headers=headers)